@@ -0,0 +1,772 @@
+#!/usr/bin/env python3
+"""Benchmarks for the CLEVA-Compass generation pipeline."""
+import argparse
+import glob
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields
+
+from create_compass import CompiledTemplate, FragmentCache, fill_template, insert_inner_level
+from create_compass import insert_legend, insert_number_of_methods, insert_outer_level
+from create_compass import read_json_entries
+from levels import CompassEntry, InnerLevel, OuterLevel
+
+PERCENTILES = [50, 90, 99]
+REGRESSION_MIN_MS = 0.05  # Smaller slowdowns are considered noise
+# Modules which are slow to import and must only be loaded on first use
+HEAVY_MODULES = ["tkinter", "PIL", "numpy", "pdf2image", "multiprocessing", "sqlite3", "tikz2svg"]
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="CLEVA-Compass Benchmarks.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "benchmark",
+        choices=sorted(BENCHMARKS),
+        help="Benchmark to run.",
+    )
+    parser.add_argument(
+        "--template",
+        default="cleva_template.tex",
+        help="Tikz template file.",
+    )
+    parser.add_argument(
+        "--data",
+        default="examples/compass_data_3.json",
+        help="Entries as JSON file.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of timed repetitions.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of concurrent workers.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100, 1000, 10000],
+        help="Suite: numbers of entries of the synthetic inputs.",
+    )
+    parser.add_argument(
+        "--max-compile-entries",
+        type=int,
+        default=100,
+        help="Suite: largest input compiled with pdflatex/poppler.",
+    )
+    parser.add_argument(
+        "--json",
+        default=None,
+        help="Suite: save the results to this JSON file.",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="Suite: compare against the results saved in this JSON file.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Suite: relative slowdown of the median time reported as regression.",
+    )
+    return parser.parse_args()
+
+
+def timeit(fn, repeat):
+    """Run fn repeat times and return the wall times in seconds."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def report(name, times):
+    """Print a one-line summary of the given wall times."""
+    print(
+        f"{name:<32} mean {statistics.mean(times) * 1000:9.2f} ms  "
+        f"median {statistics.median(times) * 1000:9.2f} ms  (n={len(times)})"
+    )
+
+
+def percentile(times, p):
+    """The p-th percentile of the given times (nearest rank)."""
+    times = sorted(times)
+    return times[max(0, math.ceil(p / 100 * len(times)) - 1)]
+
+
+def measure(fn, repeat, n=1):
+    """
+    Time fn repeat times and trace its peak Python memory in one extra run. Returns the latency
+    percentiles, the throughput in items per second for n items per call and the peak in KiB.
+    """
+    import tracemalloc
+
+    times = timeit(fn, repeat)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    median = statistics.median(times)
+    return {
+        "n": n,
+        "repeat": repeat,
+        "median_ms": median * 1000,
+        **{f"p{p}_ms": percentile(times, p) * 1000 for p in PERCENTILES},
+        "throughput": n / median if median > 0 else None,
+        "peak_kib": peak / 1024,
+    }
+
+
+def print_result(name, result):
+    """Print a one-line summary of a measure() result."""
+    percentiles = "  ".join(f"p{p} {result[f'p{p}_ms']:9.2f} ms" for p in PERCENTILES[1:])
+    throughput = f"{result['throughput']:11.0f}/s" if result["throughput"] else " " * 13
+    print(
+        f"{name:<32} median {result['median_ms']:9.2f} ms  {percentiles}  {throughput}  "
+        f"peak {result['peak_kib']:9.1f} KiB"
+    )
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of the median times against the baseline results and return the names of
+    the regressions: stages slower by more than threshold (relative) and REGRESSION_MIN_MS.
+    """
+    regressions = []
+    print(f"\n{'Stage':<32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_ms"], result["median_ms"]
+        change = after / before - 1 if before > 0 else 0.0
+        regression = change > threshold and after - before > REGRESSION_MIN_MS
+        if regression:
+            regressions.append(name)
+        print(
+            f"{name:<32} {before:9.2f} ms {after:9.2f} ms {change:+8.1%}"
+            + ("  ✘ regression" if regression else "")
+        )
+    return regressions
+
+
+def bench_suite(args):
+    """
+    Every stage of the compass generation on reproducible synthetic inputs of args.sizes entries.
+    Toolchain stages are skipped if pdflatex, pdf2svg or poppler are not installed.
+    """
+    import dataclasses
+    import platform
+    import subprocess
+    import tikz2svg
+    from gui_utils import scale_image_to_width
+    from image_utils import replace_background
+    from PIL import Image, ImageDraw
+
+    has_latex = shutil.which("pdflatex") is not None
+    has_pdf2svg = has_latex and shutil.which("pdf2svg") is not None
+    has_poppler = has_latex and shutil.which("pdftoppm") is not None
+    tools = {"pdflatex": has_latex, "pdf2svg": has_pdf2svg, "pdftoppm": has_poppler}
+    for tool, found in tools.items():
+        if not found:
+            print(f"Skipping the {tool} stages: {tool} not found")
+    if has_latex:
+        # Build the format once, outside of the timed region
+        tikz2svg.get_format()
+
+    with open(args.template) as f:
+        template = f.read()
+    results = {}
+
+    def run(stage, fn, n=1):
+        name = f"{stage} [{n}]"
+        results[name] = measure(fn, args.repeat, n)
+        print_result(name, results[name])
+
+    image = None
+    for n in args.sizes:
+        entries = random_entries(n)
+        dicts = [dataclasses.asdict(e) for e in entries]
+        run("read_json_entries", lambda: read_json_entries(dicts), n)
+        for insert in [insert_legend, insert_outer_level, insert_inner_level]:
+            run(insert.__name__, lambda: insert(template, entries), n)
+        run("insert_number_of_methods", lambda: insert_number_of_methods(template, entries), n)
+        run("fill_template", lambda: fill_template(args.template, entries), n)
+        tikz = fill_template(args.template, entries)
+        run("tikz2tex", lambda: tikz2svg.tikz2tex(tikz), n)
+        if not has_latex or n > args.max_compile_entries:
+            continue
+
+        tex = tikz2svg.tikz2tex(tikz).encode("utf-8")
+        with tikz2svg.workspace() as tmp_d:
+            run("tex2pdf", lambda: tikz2svg.tex2pdf(tex, cwd=tmp_d), n)
+            if has_pdf2svg:
+                run("pdf2svg", lambda: tikz2svg.pdf2svg(cwd=tmp_d), n)
+            with open(os.path.join(tmp_d, "texput.pdf"), "rb") as f:
+                pdf = f.read()
+        if has_poppler:
+            # Rasterization stage of tikz2img
+            run("pdf2png", lambda: tikz2svg.pdf2png(pdf), n)
+            image = Image.open(io.BytesIO(tikz2svg.pdf2png(pdf))).convert("RGB")
+
+    # Image stages of the GUI preview, independent of the number of entries
+    if image is None:
+        # Stand-in of the size poppler renders a compass at 200 dpi
+        image = Image.new("RGB", (1000, 1100), "white")
+        ImageDraw.Draw(image).ellipse((100, 100, 900, 900), outline="black", width=3, fill="pink")
+    run("replace_background", lambda: replace_background(image.copy()))
+    run("scale_image_to_width", lambda: scale_image_to_width(image, 500))
+
+    if args.json is not None:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        meta = {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "toolchain": {"pdflatex": has_latex, "pdf2svg": has_pdf2svg, "poppler": has_poppler},
+        }
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Saved the results to {args.json}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"✘ {len(regressions)} regression(s): {', '.join(regressions)}")
+            exit(1)
+        print("✔ No regressions")
+
+
+def bench_format(args):
+    """Per-render pdflatex wall time with the full preamble vs. the precompiled format."""
+    if shutil.which("pdflatex") is None:
+        print("Skipping: pdflatex not found")
+        return
+    import tikz2svg
+
+    entries = read_json_entries(json.load(open(args.data))["entries"])
+    tex = tikz2svg.tikz2tex(fill_template(args.template, entries)).encode("utf-8")
+
+    # Build the format once, outside of the timed region
+    tikz2svg.get_format()
+
+    with tikz2svg.workspace() as tmp_d:
+        report(
+            "tex2pdf (full preamble)",
+            timeit(lambda: tikz2svg.tex2pdf(tex, use_format=False, cwd=tmp_d), args.repeat),
+        )
+        report(
+            "tex2pdf (precompiled format)",
+            timeit(lambda: tikz2svg.tex2pdf(tex, cwd=tmp_d), args.repeat),
+        )
+
+
+def bench_stress(args):
+    """Render many different compasses concurrently from a thread pool and check the results."""
+    if shutil.which("pdflatex") is None:
+        print("Skipping: pdflatex not found")
+        return
+    import tikz2svg
+
+    n_renders = args.repeat * 40
+    tikz = [
+        fill_template(args.template, random_entries(n=i % 8 + 1, seed=i)) for i in range(n_renders)
+    ]
+    workspaces_before = set(glob.glob(os.path.join(tempfile.gettempdir(), "cleva-*")))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        pdfs = list(pool.map(tikz2svg.tikz2pdf, tikz))
+    elapsed = time.perf_counter() - t0
+
+    # Each job must produce its own PDF; compare against serial renders of a sample
+    for i in range(0, n_renders, max(1, n_renders // 10)):
+        assert pdfs[i].startswith(b"%PDF"), f"Render {i} did not produce a PDF"
+        assert _strip_pdf_metadata(pdfs[i]) == _strip_pdf_metadata(
+            tikz2svg.tikz2pdf(tikz[i])
+        ), f"Render {i} differs from its serial render"
+    leftover = set(glob.glob(os.path.join(tempfile.gettempdir(), "cleva-*"))) - workspaces_before
+    assert not leftover, f"Workspaces were not cleaned up: {sorted(leftover)}"
+    print(
+        f"Rendered {n_renders} compasses with {args.workers} threads in {elapsed:.2f} s "
+        f"({n_renders / elapsed:.1f} renders/s)"
+    )
+
+
+def bench_template(args):
+    """Template filling with chained string replaces vs. the compiled single-pass template."""
+    with open(args.template) as f:
+        template = f.read()
+
+    def fill_replace(entries):
+        tex = insert_legend(template, entries)
+        tex = insert_outer_level(tex, entries)
+        tex = insert_inner_level(tex, entries)
+        return insert_number_of_methods(tex, entries)
+
+    for n in [1, 100, 10000]:
+        entries = random_entries(n)
+        compiled = CompiledTemplate.load(args.template)
+        assert compiled.render(entries) == fill_replace(entries)
+        report(f"replace ({n} entries)", timeit(lambda: fill_replace(entries), args.repeat))
+        report(f"compiled ({n} entries)", timeit(lambda: compiled.render(entries), args.repeat))
+        report(
+            f"compiled + load ({n} entries)",
+            timeit(lambda: fill_template(args.template, entries), args.repeat),
+        )
+
+
+def bench_fragments(args):
+    """Filling the template again after a small edit, without vs. with the per-entry fragments."""
+    for n in [10, 100, 1000]:
+        entries = random_entries(n)
+        changed = random_entries(1, seed=1)[0]
+        edits = {
+            "edit": entries[: n // 2] + [changed] + entries[n // 2 + 1 :],
+            "append": entries + [changed],
+            "delete": entries[: n // 2] + entries[n // 2 + 1 :],
+            "swap": [entries[1], entries[0]] + entries[2:],
+        }
+        for edit, edited in edits.items():
+            # Alternate between both versions, so that every fill follows a change
+            versions = [entries, edited]
+            fragments = FragmentCache()
+            for version in versions:
+                assert fill_template(args.template, version, fragments=fragments) == fill_template(
+                    args.template, version
+                )
+
+            def fill(fragments=None):
+                versions.reverse()
+                fill_template(args.template, versions[0], fragments=fragments)
+
+            report(f"{edit} full ({n} entries)", timeit(fill, args.repeat))
+            report(
+                f"{edit} fragments ({n} entries)", timeit(lambda: fill(fragments), args.repeat)
+            )
+
+
+def bench_store(args):
+    """Bulk import, removal and type-ahead filtering of the GUI entry store."""
+    from entry_store import EntryStore
+
+    query = "method 12 federated=1 forgetting=1"
+    for n in [1000, 100000]:
+        entries = random_entries(n)
+        report(f"import ({n} entries)", timeit(lambda: EntryStore(entries), args.repeat))
+        store = EntryStore(entries)
+        ids = iter(store.ids()[::-1])
+        report(f"remove ({n} entries)", timeit(lambda: store.remove(next(ids)), args.repeat))
+
+        # Every prefix of the query, as typed; incomplete conditions are rejected
+        def type_ahead(store):
+            for i in range(1, len(query) + 1):
+                try:
+                    store.filter(query[:i])
+                except ValueError:
+                    pass
+
+        def type_ahead_full():
+            # A change between keystrokes invalidates the previous result
+            for i in range(1, len(query) + 1):
+                store.version += 1
+                try:
+                    store.filter(query[:i])
+                except ValueError:
+                    pass
+
+        store = EntryStore(entries)
+        report(f"type-ahead full ({n} entries)", timeit(type_ahead_full, args.repeat))
+        report(f"type-ahead ({n} entries)", timeit(lambda: type_ahead(store), args.repeat))
+
+
+def bench_optimize(args):
+    """Size, emission time and compile time of the plain vs. the optimized TikZ output."""
+    has_latex = shutil.which("pdflatex") is not None and shutil.which("pdf2svg") is not None
+    if not has_latex:
+        print("pdflatex/pdf2svg not found, skipping compile times")
+    import tikz2svg
+
+    for n in [1, 10, 100, 1000]:
+        entries = random_entries(n)
+        for optimize in [False, True]:
+            name = f"{'optimized' if optimize else 'plain'} ({n} entries)"
+            compiled = CompiledTemplate.load(args.template, optimize)
+            tex = compiled.render(entries)
+            report(f"{name} emit", timeit(lambda: compiled.render(entries), args.repeat))
+            print(f"{name:<32} tex {len(tex) / 1024:9.1f} KiB")
+            if has_latex:
+                report(f"{name} compile", timeit(lambda: tikz2svg.tikz2svg(tex), args.repeat))
+                print(f"{name:<32} svg {len(tikz2svg.tikz2svg(tex)) / 1024:9.1f} KiB")
+
+
+def bench_postprocess(args):
+    """Per-frame cost of the preview post-processing: per-pixel loop vs. image_utils."""
+    from PIL import Image, ImageDraw
+    from image_utils import PREVIEW_BACKGROUND, postprocess
+
+    if shutil.which("pdflatex") is not None:
+        import tikz2svg
+
+        entries = read_json_entries(json.load(open(args.data))["entries"])
+        image = tikz2svg.tikz2img(fill_template(args.template, entries)).convert("RGB")
+    else:
+        # Stand-in of the size poppler renders a compass at 200 dpi
+        print("pdflatex not found, using a synthetic image")
+        image = Image.new("RGB", (1000, 1100), "white")
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((100, 100, 900, 900), outline="black", width=3, fill=(250, 220, 240))
+
+    def per_pixel_loop(width):
+        img = image.copy()
+        pixdata = img.load()
+        for y in range(img.size[1]):
+            for x in range(img.size[0]):
+                if pixdata[x, y] == (255, 255, 255):
+                    pixdata[x, y] = (250, 250, 250)
+        return img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+
+    print(f"Input image {image.width}x{image.height}")
+    for width in [500, 2400]:
+        report(f"per-pixel loop ({width} px)", timeit(lambda: per_pixel_loop(width), args.repeat))
+        report(
+            f"postprocess ({width} px)",
+            timeit(lambda: postprocess(image, width, PREVIEW_BACKGROUND), args.repeat),
+        )
+
+
+def bench_raster(args):
+    """Latency and decoded image size per preview: full-page raster + downscale vs. direct raster."""
+    if shutil.which("pdflatex") is None or shutil.which("pdftoppm") is None:
+        print("Skipping: pdflatex or pdftoppm not found")
+        return
+    import io
+    from PIL import Image
+    import tikz2svg
+
+    entries = read_json_entries(json.load(open(args.data))["entries"])
+    pdf = tikz2svg.tikz2pdf(fill_template(args.template, entries))
+
+    def full_page(width):
+        # Previous pipeline: rasterize all pages at the default resolution, then downscale
+        image = Image.open(io.BytesIO(tikz2svg.pdf2png(pdf)))
+        image.load()
+        full_page.pixels = image.width * image.height
+        return image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+    def direct(width):
+        image = Image.open(io.BytesIO(tikz2svg.pdf2png(pdf, width=width)))
+        image.load()
+        direct.pixels = image.width * image.height
+        return image
+
+    for width in [500, tikz2svg.THUMBNAIL_WIDTH]:
+        for fn in [full_page, direct]:
+            report(f"{fn.__name__} ({width} px)", timeit(lambda: fn(width), args.repeat))
+            print(f"{fn.__name__} ({width} px)".ljust(32), f"decoded {fn.pixels * 3 / 2**20:.2f} MiB")
+
+
+def bench_index(args):
+    """Initial build, no-op update and query time of the method index for a large library."""
+    from entry_loader import entry_to_json
+    from method_index import MethodIndex
+
+    n = 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        methods_dir = os.path.join(tmp, "methods")
+        os.makedirs(methods_dir)
+        for i, entry in enumerate(random_entries(n)):
+            with open(os.path.join(methods_dir, f"method_{i}.json"), "w") as f:
+                json.dump({"entries": [entry_to_json(entry)]}, f)
+
+        def scan_files():
+            # Without an index: parse every method file and filter in Python
+            matches = []
+            for path in glob.glob(os.path.join(methods_dir, "*.json")):
+                with open(path) as f:
+                    for e in read_json_entries(json.load(f)["entries"]):
+                        if e.inner_level.federated == 1 and e.outer_level.forgetting:
+                            matches.append(e)
+            return matches
+
+        index = MethodIndex(methods_dir, os.path.join(tmp, "index.sqlite"))
+        report(f"build index ({n} files)", timeit(index.update, 1))
+        report("update (unchanged)", timeit(index.update, args.repeat))
+        report("scan files + filter", timeit(scan_files, 1))
+        query = lambda: index.query(federated=1, forgetting=True)
+        report("query federated+forgetting", timeit(query, args.repeat))
+        assert len(query()) == len(scan_files())
+        index.close()
+
+
+def bench_corpus(args):
+    """Memory per entry and load time of JSON data vs. the memory-mapped columnar corpus."""
+    import sys
+    from corpus import Corpus
+    from entry_loader import entry_to_json
+    from levels import to_slots
+
+    def deep_size(obj):
+        if isinstance(obj, int):
+            return 0  # Small ints and bools are shared
+        size = sys.getsizeof(obj)
+        if hasattr(obj, "__dict__"):
+            size += sys.getsizeof(obj.__dict__) + sum(map(deep_size, vars(obj).values()))
+        elif hasattr(obj, "__slots__"):
+            size += sum(deep_size(getattr(obj, name)) for name in obj.__slots__)
+        return size
+
+    entries = random_entries(1000)
+    print("Python objects per entry:")
+    print(f"  dataclasses   {statistics.mean(map(deep_size, entries)):8.0f} bytes")
+    print(f"  __slots__     {statistics.mean(deep_size(to_slots(e)) for e in entries):8.0f} bytes")
+    corpus = Corpus.from_entries(entries)
+    columns = sum(getattr(corpus, name).nbytes for name in ["inner", "outer", "color"])
+    labels = corpus.label_data.nbytes + corpus.label_offsets.nbytes
+    label_size = labels / len(corpus)
+    print(f"  corpus row    {columns / len(corpus):8.0f} bytes (+ {label_size:.0f} label bytes)")
+
+    n_json, n = 100000, 1000000
+    corpus = random_corpus(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data.json")
+        with open(data, "w") as f:
+            json.dump({"entries": [entry_to_json(e) for e in corpus[:n_json]]}, f)
+        corpus.save(os.path.join(tmp, "corpus"))
+
+        def load_json():
+            with open(data) as f:
+                return read_json_entries(json.load(f)["entries"])
+
+        load_corpus = lambda: Corpus.load(os.path.join(tmp, "corpus"))
+        report(f"load JSON ({n_json} entries)", timeit(load_json, 1))
+        report(f"load corpus ({n} entries)", timeit(load_corpus, args.repeat))
+        load_memory = lambda: Corpus.load(os.path.join(tmp, "corpus"), mmap=False)
+        report(f"load corpus to memory ({n})", timeit(load_memory, args.repeat))
+        mapped = load_corpus()
+        where = lambda: mapped.where(federated=1, forgetting=True)
+        report("where federated+forgetting", timeit(where, args.repeat))
+
+
+def bench_loader(args):
+    """Time and peak memory of json.load + decode vs. the streaming loader, serial vs. parallel."""
+    import tracemalloc
+    from entry_loader import iter_json_entries, load_entry_files
+    from entry_loader import entry_to_json
+
+    n, n_files = 100000, 4
+    entries = random_entries(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data.json")
+        with open(data, "w") as f:
+            json.dump({"entries": [entry_to_json(e) for e in entries]}, f)
+        print(f"{n} entries, {os.path.getsize(data) / 2**20:.1f} MiB")
+
+        def load_document():
+            with open(data) as f:
+                return read_json_entries(json.load(f)["entries"])
+
+        def count_streamed():
+            # Consume the entries without keeping them, e.g. for an aggregation
+            return sum(1 for _ in iter_json_entries(data))
+
+        for name, fn in [("json.load + decode", load_document), ("streaming", count_streamed)]:
+            report(name, timeit(fn, args.repeat))
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<32} peak memory {peak / 2**20:.1f} MiB")
+
+        files = [data] * n_files
+        report(f"{n_files} files serial", timeit(lambda: load_entry_files(files, 1), 1))
+        parallel = lambda: load_entry_files(files, args.workers)
+        report(f"{n_files} files, {args.workers} workers", timeit(parallel, 1))
+
+
+def bench_similarity(args):
+    """k-nearest-neighbour queries: vectorized brute force vs. the outer level ring index."""
+    import numpy as np
+    from similarity import ProfileIndex, nearest
+
+    for clusters in [None, 200]:
+        for n in [10000, 1000000]:
+            corpus = random_corpus(n, clusters=clusters)
+            name = f"{n} {'clustered' if clusters else 'uniform'}"
+            t0 = time.perf_counter()
+            index = ProfileIndex(corpus)
+            print(f"{name:<32} index built in {(time.perf_counter() - t0) * 1000:.1f} ms")
+            queries = [corpus[int(i)] for i in np.random.default_rng(1).integers(0, n, 20)]
+            for q in queries:
+                assert np.array_equal(index.search(q, 5)[0], nearest(corpus, q, 5)[0])
+            brute = lambda: [nearest(corpus, q, 5) for q in queries]
+            report(f"{name} brute force", [t / 20 for t in timeit(brute, args.repeat)])
+            search = lambda: [index.search(q, 5) for q in queries]
+            report(f"{name} index", [t / 20 for t in timeit(search, args.repeat)])
+
+
+def bench_stats(args):
+    """Coverage statistics: loop over entries vs. histograms of a memory-mapped corpus."""
+    from corpus import Corpus
+    from corpus_stats import CorpusStats
+
+    n_loop, n = 100000, 1000000
+    entries = random_entries(n_loop)
+
+    def loop():
+        # Count per attribute and level with plain Python
+        inner = {f.name: [0, 0, 0] for f in fields(InnerLevel)}
+        outer = {f.name: 0 for f in fields(OuterLevel)}
+        for e in entries:
+            for name, counts in inner.items():
+                counts[getattr(e.inner_level, name)] += 1
+            for name in outer:
+                outer[name] += getattr(e.outer_level, name)
+        return inner, outer
+
+    report(f"python loop ({n_loop} entries)", timeit(loop, 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        random_corpus(n).save(tmp)
+        corpus = Corpus.load(tmp)
+        histograms = lambda: CorpusStats.from_corpus(corpus)
+        report(f"corpus histograms ({n} entries)", timeit(histograms, args.repeat))
+        mask = corpus.where(federated=1)
+        masked = lambda: CorpusStats.from_corpus(corpus, mask)
+        report(f"with mask ({n} entries)", timeit(masked, args.repeat))
+
+
+def bench_startup(args):
+    """Cold start of fresh interpreters importing the headless API and running the CLIs."""
+    import subprocess
+    import sys
+
+    commands = [
+        ("python", ["-c", "pass"]),
+        ("import cleva", ["-c", "import cleva"]),
+        ("import create_compass", ["-c", "import create_compass"]),
+        ("create_compass.py --help", ["create_compass.py", "--help"]),
+        ("render_server.py --help", ["render_server.py", "--help"]),
+    ]
+    for name, argv in commands:
+        run = lambda: subprocess.run([sys.executable] + argv, check=True, capture_output=True)
+        run()  # Warm up the file system cache
+        report(name, timeit(run, args.repeat))
+
+    # The headless API must not pull in the GUI or heavy optional dependencies
+    check = "import sys, cleva; print(' '.join(m for m in HEAVY if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", f"HEAVY = {HEAVY_MODULES!r}; {check}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    loaded = result.stdout.split()
+    assert not loaded, f"import cleva loaded {', '.join(loaded)}"
+    print(f"import cleva loads none of {', '.join(HEAVY_MODULES)}")
+
+
+def _strip_pdf_metadata(pdf):
+    """Remove creation dates and IDs which differ between otherwise identical PDFs."""
+    return re.sub(rb"/(CreationDate|ModDate|ID)\s*(\(.*?\)|\[.*?\])", b"", pdf)
+
+
+def random_entries(n, seed=0):
+    """Create n reproducible random compass entries."""
+    rng = random.Random(seed)
+    colors = ["magenta", "green", "blue", "orange", "cyan", "brown"]
+    entries = []
+    for i in range(n):
+        entries.append(
+            CompassEntry(
+                color=rng.choice(colors),
+                label=f"Method {i}",
+                inner_level=InnerLevel(*(rng.randrange(3) for _ in fields(InnerLevel))),
+                outer_level=OuterLevel(*(rng.random() < 0.5 for _ in fields(OuterLevel))),
+            )
+        )
+    return entries
+
+
+def random_corpus(n, seed=0, clusters=None):
+    """
+    Create a reproducible random corpus of n entries. With clusters, the entries are variations
+    (two changed inner and outer attributes) of this number of random profiles.
+    """
+    import numpy as np
+    from corpus import Corpus
+    from levels import INNER_CODES, OUTER_CODES
+
+    rng = np.random.default_rng(seed)
+    inner = rng.integers(0, INNER_CODES, n, dtype=np.int64)
+    outer = rng.integers(0, OUTER_CODES, n, dtype=np.int64)
+    if clusters is not None:
+        cluster = rng.integers(0, clusters, n)
+        inner, outer = inner[:clusters][cluster], outer[:clusters][cluster]
+        for _ in range(2):
+            weight = 3 ** rng.integers(0, 11, n)
+            inner += (rng.integers(0, 3, n) - inner // weight % 3) * weight
+            outer ^= 1 << rng.integers(0, 15, n)
+    labels = [f"Method {i}".encode() for i in range(n)]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(label) for label in labels], out=offsets[1:])
+    return Corpus(
+        inner.astype(np.uint32),
+        outer.astype(np.uint16),
+        rng.integers(0, 6, n, dtype=np.uint8),
+        ["magenta", "green", "blue", "orange", "cyan", "brown"],
+        offsets,
+        np.frombuffer(b"".join(labels), dtype=np.uint8),
+    )
+
+
+BENCHMARKS = {
+    "corpus": bench_corpus,
+    "format": bench_format,
+    "fragments": bench_fragments,
+    "index": bench_index,
+    "loader": bench_loader,
+    "optimize": bench_optimize,
+    "postprocess": bench_postprocess,
+    "raster": bench_raster,
+    "similarity": bench_similarity,
+    "startup": bench_startup,
+    "stats": bench_stats,
+    "store": bench_store,
+    "stress": bench_stress,
+    "suite": bench_suite,
+    "template": bench_template,
+}
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,92 @@
+"""
+Headless API for rendering CLEVA-Compasses, e.g. from scripts, workers or serverless functions.
+
+This module never imports tkinter. Optional dependencies are imported on first use only: PIL for
+png outputs and the LaTeX helpers in tikz2svg for svg, png and pdf outputs (tex outputs and the
+native SVG renderer need neither).
+
+Example:
+
+    import cleva
+
+    svg = cleva.render("examples/compass_data_3.json", fmt="svg")
+    cleva.render(cleva.load("examples/compass_data_3.json"), fmt="png", output="compass.png")
+
+When rendering repeatedly while editing a few entries, pass a FragmentCache, so that only the TikZ
+code of the changed entries is generated again:
+
+    fragments = cleva.FragmentCache()
+    for entries in edits:
+        cleva.render(entries, fmt="tex", fragments=fragments)
+"""
+import os
+
+from create_compass import FORMATS, FragmentCache, read_json_entries, render_entries
+from entry_loader import EntryValidationError, entry_to_json, iter_json_entries
+from levels import CompassEntry, InnerLevel, OuterLevel
+
+# The entry classes, FORMATS, EntryValidationError and FragmentCache are re-exported, so that
+# scripts only need to import this module
+__all__ = [
+    "CompassEntry",
+    "EntryValidationError",
+    "FORMATS",
+    "FragmentCache",
+    "InnerLevel",
+    "OuterLevel",
+    "TEMPLATE_PATH",
+    "load",
+    "render",
+]
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cleva_template.tex")
+
+
+def load(path):
+    """Read the entries of a JSON data file. Raises EntryValidationError for invalid entries."""
+    return list(iter_json_entries(path))
+
+
+def _entries(data):
+    """Entries from a data file path, a data file dict or a list of CompassEntry objects or dicts."""
+    if isinstance(data, (str, os.PathLike)):
+        return load(data)
+    if isinstance(data, dict):
+        data = data["entries"]
+    entries = list(data)
+    if all(isinstance(e, CompassEntry) for e in entries):
+        return entries
+    dicts = [entry_to_json(e) if isinstance(e, CompassEntry) else e for e in entries]
+    return read_json_entries(dicts)
+
+
+def render(
+    entries,
+    fmt="svg",
+    output=None,
+    template_path=TEMPLATE_PATH,
+    renderer="tikz",
+    cache=None,
+    optimize=False,
+    width=None,
+    fragments=None,
+):
+    """
+    Render a compass into fmt (one of FORMATS) and return bytes. entries is a list of CompassEntry
+    objects or entry dicts, a data file dict ({"entries": [...]}) or the path of a data file. The
+    result is also written to output, if given. See create_compass.render_entries for the options.
+    """
+    data = render_entries(
+        _entries(entries),
+        fmt,
+        template_path,
+        renderer,
+        cache=cache,
+        optimize=optimize,
+        width=width,
+        fragments=fragments,
+    )
+    if output is not None:
+        with open(output, "wb") as f:
+            f.write(data)
+    return data
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import json
+import multiprocessing
+import shutil
 
 try:
+    import tkinter as tk
     from tkinter import *
     from tkinter import filedialog as fd
     from tkinter import simpledialog as sd
@@ -15,13 +18,17 @@ except:
     exit(1)
 
 
-from create_compass import read_json_entries, fill_template
+from create_compass import FragmentCache, read_json_entries, fill_template
+from entry_loader import load_entry_files
+from entry_store import EntryStore
 from levels import CompassEntry
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     # Try to import ImageTk from pillow
     from PIL import ImageTk
+    from image_utils import postprocess, to_photo_image, PREVIEW_BACKGROUND
 
     MISSING_PIL = False
 except ImportError:
@@ -29,45 +36,31 @@ except ImportError:
 
 
 try:
-    # Try to import tikz2svg (pdf2img)
-    from tikz2svg import tikz2img, tikz2svg, save_svg
+    # Try to import tikz2svg and find the poppler rasterizer
+    from tikz2svg import tikz2img, tikz2svg, save_svg, cancellable, CompileError
 
-    MISSING_PDF2IMG = False
+    MISSING_PDF2IMG = shutil.which("pdftoppm") is None
 except ImportError:
     MISSING_PDF2IMG = True
 
-from gui_utils import add_tooltip, entry_to_json, scale_image_to_width, download_methods
+import svg_compass
+from render_cache import default_cache
+from render_worker import RenderWorker
+import tracing
+from gui_utils import add_tooltip, entry_to_json, download_methods, VirtualListbox
 from tkinter.colorchooser import askcolor
 
-
-root = Tk()
-root.configure(bg="white")
-root.title("CLEVA Compass Generator")
-# Add a frame to set the size of the window
-root = Frame(root)
-root.pack(fill=BOTH, expand=True, ipadx=10, ipady=10)
-
-def_font = font.nametofont("TkDefaultFont")
-def_font.configure(
-    size=10,
-    family="Arial",
-)
 try:
+    # Themed widgets replace the tkinter ones if available
     from ttkthemes import ThemedStyle
     from tkinter.ttk import *
-
-    style = ThemedStyle(root)
-    style.theme_use("adapta")
 except ImportError:
-    print("Install ttkthemes for a nicer theme")
-    style = ttk.Style(root)
-    if "clam" in style.theme_names():
-        style.theme_use("clam")
+    ThemedStyle = None
+
 
 # bg = style.lookup('TFrame', 'background')
 # bg = "#e7e7e7"
 bg = "white"
-root.configure(background="white")
 
 padx = 5
 pady = 1
@@ -75,13 +68,6 @@ pady = 1
 header_label_kwargs = dict(padx=10, pady=10, sticky=W)
 
 
-ttk.Style().configure("Default.TRadiobutton", background=bg, foreground="black")
-
-ttk.Style().configure("Default.TCheckbutton", background=bg, foreground="black")
-
-definitions = json.load(open("definition.json"))
-
-
 # Define outer level elements (checkboxes)
 outer_levels = [
     "compute_time",
@@ -119,44 +105,13 @@ inner_levels = [
 outer_level_cbs = {}
 inner_level_rbs = {}
 
-# Header
-label = ttk.Label(root, text="CLEVA Compass Generator", background=bg)
-label.grid(row=0, column=0, columnspan=4, sticky=W + E, padx=padx + 5, pady=pady + 5)
-label.config(font=("Arial", 18))
-
-# Label for element in compass
-ttk.Label(root, text="Label", background=bg).grid(row=1, column=0, padx=padx, pady=pady, sticky=W)
-val_label = StringVar()
-entry_label = ttk.Entry(root, textvariable=val_label)
-entry_label.grid(row=1, column=1, columnspan=3, sticky=W + E, padx=padx, pady=pady)
-
-# Color selection
-ttk.Label(root, text="Color", background=bg).grid(row=1, column=4, padx=padx, pady=pady, sticky=W)
-color_val = StringVar(root, "magenta")
-
-
 colors = ["magenta", "green", "blue", "orange", "cyan", "brown"]
 colors_val = ["#f364b8", "#62b162", "#3879e6", "#ec953f", "#74c9ea", "#d7a269"]
 rbs = []
-for i, (color, color_bg) in enumerate(zip(colors, colors_val)):
-    ttk.Style().configure(
-        f"{color}.TRadiobutton",
-        background=color_bg,
-        foreground="black",
-    )
-    row_n = 1
-    rb = ttk.Radiobutton(
-        root,
-        text=" " + color,
-        variable=color_val,
-        width=10,
-        value=color,
-        style=f"{color}.TRadiobutton",
-    )
-    rbs.append(rb)
-    rb.grid(row=row_n, column=5 + i, padx=padx, pady=pady)
+template_path = "cleva_template.tex"
+# Fragments of the entries in the latest render, so that edits only regenerate the changed entries
+fragment_cache = FragmentCache()
 
-    # root.columnconfigure(i+1, minsize=300, pad=0)
 
 
 # def select_color():
@@ -242,74 +197,6 @@ def add_color():
     elem = ExtraColorChooser()
 
 
-add_color_b = ttk.Button(root, text='+', command=add_color)
-add_color_b.grid(row=row_n+1, column=6, padx=padx, pady=pady)
-
-# Create label for inner ring
-inner_level_start_row = row_n + 1
-label = ttk.Label(root, text="Inner Level", background=bg)
-label.grid(row=inner_level_start_row, column=0, columnspan=4, **header_label_kwargs)
-label.config(font=("Arial", 16))
-hintext = "(mouse-over items for info tooltips)"
-hint = ttk.Label(root, text=hintext, background=bg)
-hint.grid(row=inner_level_start_row, column=1, columnspan=3, sticky=W + E, padx=padx, pady=pady)
-hint.config(font=("Arial", 8))
-
-# Create label and radiobutton for inner ring elements
-for i, il in enumerate(inner_levels, start=inner_level_start_row + 1):
-    val = IntVar(root, 0)
-    label = ttk.Label(root, text=il.replace("_", " "), background=bg)
-    label.grid(row=i, column=0, padx=padx, pady=pady + 10, sticky=W)
-    inner_defs = definitions["InnerLevel"]
-    add_tooltip(label, text=inner_defs[il.replace("_", " ")])
-    ttk.Radiobutton(
-        root, text="Unsupervised", variable=val, value=2, style="Default.TRadiobutton"
-    ).grid(row=i, column=1, padx=padx, pady=pady)
-    ttk.Radiobutton(
-        root, text="Supervised", variable=val, value=1, style="Default.TRadiobutton"
-    ).grid(row=i, column=2, padx=padx, pady=pady)
-    ttk.Radiobutton(root, text="None", variable=val, value=0, style="Default.TRadiobutton").grid(
-        row=i, column=3, padx=padx, pady=pady
-    )
-    inner_level_rbs[il] = val
-
-# Create label for Outer Level
-# outer_level_start_row = len(inner_levels) + inner_level_start_row + 1
-outer_level_start_row = 2
-outer_level_start_col = 4
-label = ttk.Label(root, text="Outer Level", background=bg)
-label.grid(
-    row=outer_level_start_row,
-    column=outer_level_start_col,
-    columnspan=2,
-    **header_label_kwargs,
-)
-label.config(font=("Arial", 16))
-
-# Create label and checkbutton for outer ring elements
-for i, ol in enumerate(outer_levels):
-    val = BooleanVar()
-    label = ttk.Label(root, text=ol.replace("_", " "), background=bg)
-    label.grid(
-        row=outer_level_start_row + 1 + i // 4,
-        column=outer_level_start_col + (i * 2) % 8,
-        padx=padx,
-        pady=pady,
-        sticky=E,
-    )
-    cb = ttk.Checkbutton(root, variable=val, style="Default.TCheckbutton")
-    cb.grid(
-        row=outer_level_start_row + 1 + i // 4,
-        column=outer_level_start_col + 1 + (i * 2) % 8,
-        padx=padx,
-        pady=pady,
-        sticky=W,
-    )
-    outer_level_cbs[ol] = val
-    outer_defs = definitions["OuterLevel"]
-    add_tooltip(label, text=outer_defs[ol.replace("_", " ")])
-
-
 def parse_state() -> CompassEntry:
     """
     Parse the current state of the color/label/inner-outer level selections into a CompassEntry
@@ -330,7 +217,15 @@ def parse_state() -> CompassEntry:
     return entry
 
 
-global_entries = []
+# Compass entries, shown by ID in the entry list
+store = EntryStore()
+# Files are imported on a background thread, pending imports are delivered in order
+import_pool = ThreadPoolExecutor(1)
+pending_imports = []
+# Image exports are queued and run one after another on a background thread, unlike previews
+# they are never coalesced or cancelled. Pending exports are (future, output filename).
+export_pool = ThreadPoolExecutor(1)
+pending_exports = []
 
 
 def on_press_download_methods_button():
@@ -347,12 +242,44 @@ def on_press_download_methods_button():
     )
 
 
+def entry_text(id):
+    """Text of an entry in the entry list."""
+    entry = store[id]
+    return entry.label + " (" + entry.color + ")"
+
+
+def update_entry_list():
+    """Show the entries matching the filter in the entry list."""
+    query = filter_val.get()
+    try:
+        ids = store.filter(query)
+    except ValueError:
+        # Incomplete condition while typing, e.g. 'federated=', keep the current rows
+        ids = [id for id in lb.keys if id in store]
+    lb.set_keys(ids)
+    if query.strip():
+        shown = f"{len(ids)} of {len(store)} entries"
+        list_hint.configure(text=f"({shown}, select to delete/update)")
+    else:
+        list_hint.configure(text="(select to delete/update)")
+
+
+def on_filter_changed(*args):
+    """Filter the entry list shortly after the last keystroke."""
+    if filter_val.after_id is not None:
+        root.after_cancel(filter_val.after_id)
+    filter_val.after_id = root.after(100, on_filter_timeout)
+
+
+def on_filter_timeout():
+    filter_val.after_id = None
+    update_entry_list()
+
+
 def on_press_add_entry_button():
     entry = parse_state()
-    global_entries.append(entry)
-
-    # Add to listbox
-    lb.insert(len(global_entries), entry.label + " (" + entry.color + ")")
+    store.add(entry)
+    update_entry_list()
 
     # Reset values
     for ol, val in outer_level_cbs.items():
@@ -365,31 +292,35 @@ def on_press_add_entry_button():
     color_val.set("magenta")
 
 
+def selected_id():
+    """ID of the selected entry, or of the first listed entry if none is selected."""
+    if lb.selected in store:
+        return lb.selected
+    return lb.keys[0] if lb.keys else None
+
+
 def on_press_update_button():
     entry = parse_state()
-    active = lb.get(ACTIVE)
-    if lb.size() > 0:
-        idx = lb.get(0, END).index(active)
-        global_entries[idx] = entry
-        lb.delete(idx)
-        lb.insert(idx, entry.label + " (" + entry.color + ")")
+    id = selected_id()
+    if id is not None:
+        store.update(id, entry)
+        update_entry_list()
         on_press_generate_image()
 
 
 def on_press_delete_button():
-    active = lb.get(ACTIVE)
-    if lb.size() > 0:
-        idx = lb.get(0, END).index(active)
-        lb.delete(idx)
-        global_entries.pop(idx)
+    id = selected_id()
+    if id is not None:
+        store.remove(id)
+        update_entry_list()
+        lb.select(None)
         on_press_generate_image()
 
 
 def on_press_export_button():
-    active = lb.get(ACTIVE)
-    if lb.size() > 0:
-        idx = lb.get(0, END).index(active)
-        selected_entry = global_entries[idx]
+    id = selected_id()
+    if id is not None:
+        selected_entry = store[id]
         json_dict = entry_to_json(selected_entry)
         json_text = json.dumps({"entries": [json_dict]})
         output_filename = fd.asksaveasfilename(initialfile=f"{selected_entry.label}.json")
@@ -404,6 +335,7 @@ def on_press_export_button():
         messagebox.showinfo(title="Info", message=f"There were no entries in the list.")
 
 
+@tracing.traced("gui.import")
 def on_press_import_button(filenames=None):
     if filenames is None:
         filenames = fd.askopenfilenames(
@@ -411,21 +343,36 @@ def on_press_import_button(filenames=None):
                 ("JSON format", ".json"),
             ]
         )
-    for filename in filenames:
-        entries_json = json.load(open(filename))["entries"]
-        entries = read_json_entries(entries_json)
-        for entry in entries:
-            global_entries.append(entry)
-            # Add to listbox
-            lb.insert(len(global_entries), entry.label + " (" + entry.color + ")")
-    on_press_generate_image()
+    if not filenames:
+        return
+    # Decode the files in the background and add all their entries at once, see poll_imports. The
+    # worker processes are spawned, forking the Tk process (and its threads) is not safe.
+    spawn = multiprocessing.get_context("spawn")
+    pending_imports.append(import_pool.submit(load_entry_files, list(filenames), mp_context=spawn))
+    update_progress()
+
+
+def poll_imports():
+    """Add the entries of finished imports to the list, in the order the imports were started."""
+    imported = False
+    while pending_imports and pending_imports[0].done():
+        future = pending_imports.pop(0)
+        try:
+            store.extend(future.result())
+            imported = True
+        except (ValueError, OSError) as e:
+            messagebox.showerror(title="Error", message=f"Could not import the entries.\n\n{e}")
+    if imported:
+        update_entry_list()
+        on_press_generate_image()
 
 
+@tracing.traced("gui.generate_compass")
 def on_press_generate_compass():
     output_filename = fd.asksaveasfilename(initialfile="cleva_filled.tex")
 
     template_path = "cleva_template.tex"
-    tex_output = fill_template(template_path, global_entries)
+    tex_output = fill_template(template_path, store.entries(), fragments=fragment_cache)
 
     # Write output to the desired destination
     with open(output_filename, "w") as f:
@@ -437,7 +384,8 @@ def on_press_generate_compass():
 
 
 def on_press_export_image():
-    if not libraries_available():
+    native = use_native_renderer.get()
+    if not native and not libraries_available():
         warn_missing_libraries()
         return
     output_filename = fd.asksaveasfilename(
@@ -447,23 +395,54 @@ def on_press_export_image():
             ("Portable Network Graphics", "*.png"),
         ),
     )
-    if output_filename[-4:] == ".svg":
-        template_path = "cleva_template.tex"
-        tex_output = fill_template(template_path, global_entries)
-        svg_image = tikz2svg(tex_output)
-        save_svg(svg_image, output_filename)
+    entries = store.entries()
+    if output_filename[-4:] == ".svg" and native:
+        # Draw the SVG directly without the LaTeX toolchain
+        svg_compass.save_svg(entries, output_filename)
+        on_image_exported(output_filename, None)
+        return
+    elif output_filename[-4:] == ".png" and not libraries_available():
+        warn_missing_libraries()
+        return
+    elif output_filename[-4:] == ".svg":
+        export = export_svg
     elif output_filename[-4:] == ".png":
-        image = on_press_generate_image()
-        image = scale_image_to_width(image, width=2400)
-        image.save(output_filename)
+        export = export_png
     else:
         msg = "Unsupported file format, please choose one of [svg, png]"
         messagebox.showinfo(title="Info", message=msg)
         return
-    # # Write output to the desired destination
-    # with open(output_filename, "w") as f:
-    #     f.write(tex_output)
 
+    # Render in the background, finished exports are reported by poll_exports
+    pending_exports.append((export_pool.submit(export, entries, output_filename), output_filename))
+    update_progress()
+
+
+def poll_exports():
+    """Report finished exports, in the order they were started."""
+    while pending_exports and pending_exports[0][0].done():
+        future, output_filename = pending_exports.pop(0)
+        on_image_exported(output_filename, future.exception())
+
+
+@tracing.traced("gui.export_svg")
+def export_svg(entries, output_filename):
+    """Render the entries with pdflatex into an SVG file (runs on the export thread)."""
+    tex_output = fill_template(template_path, entries, fragments=fragment_cache)
+    svg_image = tikz2svg(tex_output, cache=default_cache())
+    save_svg(svg_image, output_filename)
+
+
+@tracing.traced("gui.export_png")
+def export_png(entries, output_filename):
+    """Render the entries into a PNG file (runs on the export thread)."""
+    render_image(entries, None, width=2400).save(output_filename)
+
+
+def on_image_exported(output_filename, error):
+    if error is not None:
+        warn_compile_error(error)
+        return
     messagebox.showinfo(
         title="Info", message=f"Successfully saved CLEVA Compass to {output_filename}"
     )
@@ -479,14 +458,9 @@ def set_state(entry: CompassEntry):
         val.set(new_val)
 
 
-def on_select_method(evt):
-    """On click for when a method was selected in the listbox."""
-    # Note here that Tkinter passes an event object to onselect()
-    w = evt.widget
-    if len(w.curselection()) == 0:
-        return
-    index = int(w.curselection()[0])
-    selected_entry = global_entries[index]
+def on_select_method(id):
+    """On click for when a method was selected in the entry list."""
+    selected_entry = store[id]
     entry_label.delete(0, END)
     entry_label.insert(0, selected_entry.label)
     set_state(selected_entry)
@@ -501,208 +475,416 @@ def warn_missing_libraries():
     """Put a warning messagebox telling the user that some libraries are missing."""
     messagebox.showinfo(
         title="Warning",
-        message="Some libraries are missing. Please ensure, that you have the Python packages 'pdf2image' and 'pillow', as well as the system library 'poppler' installed.",
+        message="Some libraries are missing. Please ensure, that you have the Python package 'pillow', as well as the system library 'poppler' installed.",
     )
 
 
+def warn_compile_error(error):
+    """Put an error messagebox with the LaTeX errors of a failed render."""
+    messagebox.showerror(title="Error", message=f"Could not render the CLEVA Compass.\n\n{error}")
+
+
 def on_press_generate_image():
+    """Render the preview of the current entries in the background."""
     if not libraries_available():
         warn_missing_libraries()
         return
-    template_path = "cleva_template.tex"
-    tex_output = fill_template(template_path, global_entries)
-    comp_image = update_background(tikz2img(tex_output))
-    old_width = image.image.width()
-    image.image = ImageTk.PhotoImage(scale_image_to_width(comp_image, width=500))
+    entries = store.entries()
+    preview_worker.submit(lambda cancel: render_image(entries, cancel, 500), on_preview_rendered)
+    update_progress()
+
+
+@tracing.traced("gui.render_image")
+def render_image(entries, cancel, width):
+    """
+    Render the compass of the entries as image of the given width with the preview background
+    (runs on a background thread). The render is cancelled once the threading.Event cancel is set.
+    """
+    tex_output = fill_template(template_path, entries, fragments=fragment_cache)
+    with cancellable(cancel):
+        # Rasterize directly at the target width instead of downscaling a large image
+        comp_image = tikz2img(tex_output, cache=default_cache(), width=width)
+    return postprocess(comp_image, width=width, background=PREVIEW_BACKGROUND)
+
+
+@tracing.traced("gui.show_preview")
+def on_preview_rendered(comp_image, error):
+    if error is not None:
+        warn_compile_error(error)
+        return
+    old_width = image.image.width() if image.image is not None else 0
+    image.image = to_photo_image(comp_image)
     image.configure(image=image.image)
     if image.image.width() != old_width:
         x = root.winfo_height()
         y = root.winfo_width() + image.image.width() - old_width
         root.geometry("{}x{}".format(y, x))
-    return comp_image
-
-
-# Image on right side
-def update_background(img):
-
-    pixdata = img.load()
-    for y in range(img.size[1]):
-        for x in range(img.size[0]):
-            if pixdata[x, y] == (255, 255, 255):
-                pixdata[x, y] = (250, 250, 250)
-    return img
-
-
-button_starting_row = 1
-
-buttons = []
-
-# Add button: add entries to the list of compass entries
-btn_add_entry = ttk.Button(
-    root,
-    text="← Add Compass Entry",
-    command=on_press_add_entry_button,
-)
-add_tooltip(
-    btn_add_entry,
-    text="Adds a new entry with the current selection of inner and outer level options.",
-)
-
-btn_delete_entry = ttk.Button(
-    root,
-    text="← Delete Compass Entry",
-    command=on_press_delete_button,
-)
-add_tooltip(btn_delete_entry, text="Deletes the selected compass entry from the list below.")
-
-btn_update_entry = ttk.Button(
-    root,
-    text="← Update Compass Entry",
-    command=on_press_update_button,
-)
-add_tooltip(
-    btn_update_entry,
-    text="Update the selected compass entry with the current selection of inner and outer level options, label, and color.",
-)
-
-btn_export_entry = ttk.Button(
-    root,
-    text="← Export Entry to File",
-    command=on_press_export_button,
-)
-add_tooltip(btn_export_entry, text="Export the selected entry in the list to a JSON file.")
-
-btn_export_to_image = ttk.Button(
-    root,
-    text="Export to Image →",
-    command=on_press_export_image,
-)
-add_tooltip(
-    btn_export_to_image,
-    text="Export the current preview of the CLEVA Compass to an image (SVG/PNG)",
-)
-
-btn_import_entry = ttk.Button(
-    root,
-    text="← Import Ent. from File(s)",
-    command=on_press_import_button,
-)
-add_tooltip(btn_import_entry, text="Import CLEVA Compass entries from one or multiple JSON files.")
-
-btn_export_to_tex = ttk.Button(
-    root,
-    text="Export to Tex File →",
-    command=on_press_generate_compass,
-)
-add_tooltip(btn_export_to_tex, text="Export the CLEVA Compass as Tikz code into a LaTeX file.")
-
-btn_reload_preview = ttk.Button(
-    root,
-    text="Reload Preview →",
-    command=on_press_generate_image,
-)
-add_tooltip(
-    btn_reload_preview,
-    text="Reload the CLEVA Compass preview, based on the current list of entries.",
-)
-
-
-btn_download_methods = ttk.Button(
-    root,
-    text="Download methods ↓",
-    command=on_press_download_methods_button,
-)
-add_tooltip(
-    btn_download_methods,
-    text="Rerieve the methods from the github repo and place them in `methods` directory",
-)
-
-buttons = [
-    btn_add_entry,
-    btn_delete_entry,
-    btn_update_entry,
-    btn_reload_preview,
-    btn_download_methods,
-    btn_import_entry,
-    btn_export_entry,
-    btn_export_to_image,
-    btn_export_to_tex,
-]
 
-kwargs = dict(columnspan=2, padx=0, pady=0, sticky=W + E)
-
-# Entry buttons
-btn_add_entry.grid(row=len(inner_levels) + 6, column=4, **kwargs)
-btn_delete_entry.grid(row=len(inner_levels) + 7, column=4, **kwargs)
-btn_update_entry.grid(row=len(inner_levels) + 8, column=4, **kwargs)
-btn_export_entry.grid(row=len(inner_levels) + 9, column=4, **kwargs)
-btn_import_entry.grid(row=len(inner_levels) + 10, column=4, **kwargs)
-
-# Export Buttons
-btn_export_to_image.grid(row=outer_level_start_row + 6, column=4, **kwargs)
-btn_export_to_tex.grid(row=outer_level_start_row + 7, column=4, **kwargs)
-btn_reload_preview.grid(row=outer_level_start_row + 8, column=4, **kwargs)
-btn_download_methods.grid(row=outer_level_start_row + 11, column=4, **kwargs)
-
-# Assign buttons in a 4x2 grid
-# for i, btn in enumerate(buttons):
-#     btn.grid(
-#         row=button_starting_row + 1 + i // 4,
-#         column=4 + (i * 2) % 8,
-#         **kwargs,
-#     )
 
-# Listbox to list already added elements
-label = ttk.Label(root, text="Compass Entries", background=bg)
-label.grid(row=len(inner_levels) + 5, column=0, columnspan=4, **header_label_kwargs)
-label.config(font=("Arial", 16))
-
-hint = ttk.Label(root, text="(select to delete/update)", background=bg)
-hint.grid(row=len(inner_levels) + 5, column=2, sticky=W + E, padx=padx, pady=pady)
-hint.config(font=("Arial", 8))
-
-lb = Listbox(root, exportselection=False)
-lb.configure(
-    background="white",
-    foreground="black",
-)
-lb.grid(
-    row=len(inner_levels) + 6,
-    column=0,
-    rowspan=5,
-    columnspan=4,
-    sticky=W + E + N + S,
-    padx=padx + 5,
-    pady=0,
-)
-lb.bind("<<ListboxSelect>>", on_select_method)
+def update_progress():
+    """Show the progress bar while any render is in flight."""
+    if progress is None:
+        return
+    busy = preview_worker.busy or bool(pending_exports) or bool(pending_imports)
+    if busy and not progress.running:
+        progress.start(10)
+    elif not busy and progress.running:
+        progress.stop()
+    progress.running = busy
+
+
+def poll_render_workers():
+    """Deliver finished renders on the Tk thread."""
+    preview_worker.poll()
+    poll_exports()
+    poll_imports()
+    update_progress()
+    root.after(50, poll_render_workers)
+
+
+def build_window():
+    """Create the main window with all widgets."""
+    global root, val_label, entry_label, color_val, add_color_b, use_native_renderer, lb, image
+    global progress, filter_val, list_hint
+
+    root = Tk()
+    root.configure(bg="white")
+    root.title("CLEVA Compass Generator")
+    # Add a frame to set the size of the window (a tk frame, which has a background color)
+    root = tk.Frame(root)
+    root.pack(fill=BOTH, expand=True, ipadx=10, ipady=10)
+
+    def_font = font.nametofont("TkDefaultFont")
+    def_font.configure(
+        size=10,
+        family="Arial",
+    )
+    if ThemedStyle is not None:
+        style = ThemedStyle(root)
+        style.theme_use("adapta")
+    else:
+        print("Install ttkthemes for a nicer theme")
+        style = ttk.Style(root)
+        if "clam" in style.theme_names():
+            style.theme_use("clam")
 
+    root.configure(background="white")
 
-template_path = "cleva_template.tex"
-tex_output = fill_template(template_path, global_entries)
-
-if libraries_available():
-    # img = tikz2img(tex_output)
-    # img = update_background(img)
-    # photo = ImageTk.PhotoImage(scale_image_to_width(img, width=500))
-    image = Label(root, image=None, background=bg, border=4, relief="ridge")
-    image.image = None
-    image_start_row = outer_level_start_row + 5
-    image_start_col = outer_level_start_col + 2
-    image_colspan = 6
-    image_rowspan = len(outer_levels)
-    image.grid(
-        row=image_start_row,
-        column=image_start_col,
-        columnspan=image_colspan,
-        rowspan=image_rowspan,
-        padx=padx,
-        pady=pady,
-        ipadx=3,
-        ipady=3,
+    ttk.Style().configure("Default.TRadiobutton", background=bg, foreground="black")
+
+    ttk.Style().configure("Default.TCheckbutton", background=bg, foreground="black")
+
+    definitions = json.load(open("definition.json"))
+
+    # Header
+    label = ttk.Label(root, text="CLEVA Compass Generator", background=bg)
+    label.grid(row=0, column=0, columnspan=4, sticky=W + E, padx=padx + 5, pady=pady + 5)
+    label.config(font=("Arial", 18))
+
+    # Label for element in compass
+    ttk.Label(root, text="Label", background=bg).grid(
+        row=1, column=0, padx=padx, pady=pady, sticky=W
     )
-else:
-    warn_missing_libraries()
+    val_label = StringVar()
+    entry_label = ttk.Entry(root, textvariable=val_label)
+    entry_label.grid(row=1, column=1, columnspan=3, sticky=W + E, padx=padx, pady=pady)
+
+    # Color selection
+    ttk.Label(root, text="Color", background=bg).grid(
+        row=1, column=4, padx=padx, pady=pady, sticky=W
+    )
+    color_val = StringVar(root, "magenta")
+
+    for i, (color, color_bg) in enumerate(zip(colors, colors_val)):
+        ttk.Style().configure(
+            f"{color}.TRadiobutton",
+            background=color_bg,
+            foreground="black",
+        )
+        row_n = 1
+        rb = ttk.Radiobutton(
+            root,
+            text=" " + color,
+            variable=color_val,
+            width=10,
+            value=color,
+            style=f"{color}.TRadiobutton",
+        )
+        rbs.append(rb)
+        rb.grid(row=row_n, column=5 + i, padx=padx, pady=pady)
+
+        # root.columnconfigure(i+1, minsize=300, pad=0)
+
+    add_color_b = ttk.Button(root, text='+', command=add_color)
+    add_color_b.grid(row=row_n+1, column=6, padx=padx, pady=pady)
+
+    # Create label for inner ring
+    inner_level_start_row = row_n + 1
+    label = ttk.Label(root, text="Inner Level", background=bg)
+    label.grid(row=inner_level_start_row, column=0, columnspan=4, **header_label_kwargs)
+    label.config(font=("Arial", 16))
+    hintext = "(mouse-over items for info tooltips)"
+    hint = ttk.Label(root, text=hintext, background=bg)
+    hint.grid(row=inner_level_start_row, column=1, columnspan=3, sticky=W + E, padx=padx, pady=pady)
+    hint.config(font=("Arial", 8))
+
+    # Create label and radiobutton for inner ring elements
+    for i, il in enumerate(inner_levels, start=inner_level_start_row + 1):
+        val = IntVar(root, 0)
+        label = ttk.Label(root, text=il.replace("_", " "), background=bg)
+        label.grid(row=i, column=0, padx=padx, pady=pady + 10, sticky=W)
+        inner_defs = definitions["InnerLevel"]
+        add_tooltip(label, text=inner_defs[il.replace("_", " ")])
+        ttk.Radiobutton(
+            root, text="Unsupervised", variable=val, value=2, style="Default.TRadiobutton"
+        ).grid(row=i, column=1, padx=padx, pady=pady)
+        ttk.Radiobutton(
+            root, text="Supervised", variable=val, value=1, style="Default.TRadiobutton"
+        ).grid(row=i, column=2, padx=padx, pady=pady)
+        ttk.Radiobutton(
+            root, text="None", variable=val, value=0, style="Default.TRadiobutton"
+        ).grid(row=i, column=3, padx=padx, pady=pady)
+        inner_level_rbs[il] = val
+
+    # Create label for Outer Level
+    # outer_level_start_row = len(inner_levels) + inner_level_start_row + 1
+    outer_level_start_row = 2
+    outer_level_start_col = 4
+    label = ttk.Label(root, text="Outer Level", background=bg)
+    label.grid(
+        row=outer_level_start_row,
+        column=outer_level_start_col,
+        columnspan=2,
+        **header_label_kwargs,
+    )
+    label.config(font=("Arial", 16))
+
+    # Create label and checkbutton for outer ring elements
+    for i, ol in enumerate(outer_levels):
+        val = BooleanVar()
+        label = ttk.Label(root, text=ol.replace("_", " "), background=bg)
+        label.grid(
+            row=outer_level_start_row + 1 + i // 4,
+            column=outer_level_start_col + (i * 2) % 8,
+            padx=padx,
+            pady=pady,
+            sticky=E,
+        )
+        cb = ttk.Checkbutton(root, variable=val, style="Default.TCheckbutton")
+        cb.grid(
+            row=outer_level_start_row + 1 + i // 4,
+            column=outer_level_start_col + 1 + (i * 2) % 8,
+            padx=padx,
+            pady=pady,
+            sticky=W,
+        )
+        outer_level_cbs[ol] = val
+        outer_defs = definitions["OuterLevel"]
+        add_tooltip(label, text=outer_defs[ol.replace("_", " ")])
+
+    button_starting_row = 1
+
+    buttons = []
+
+    # Add button: add entries to the list of compass entries
+    btn_add_entry = ttk.Button(
+        root,
+        text="← Add Compass Entry",
+        command=on_press_add_entry_button,
+    )
+    add_tooltip(
+        btn_add_entry,
+        text="Adds a new entry with the current selection of inner and outer level options.",
+    )
+
+    btn_delete_entry = ttk.Button(
+        root,
+        text="← Delete Compass Entry",
+        command=on_press_delete_button,
+    )
+    add_tooltip(btn_delete_entry, text="Deletes the selected compass entry from the list below.")
+
+    btn_update_entry = ttk.Button(
+        root,
+        text="← Update Compass Entry",
+        command=on_press_update_button,
+    )
+    add_tooltip(
+        btn_update_entry,
+        text="Update the selected compass entry with the current selection of inner and outer level options, label, and color.",
+    )
+
+    btn_export_entry = ttk.Button(
+        root,
+        text="← Export Entry to File",
+        command=on_press_export_button,
+    )
+    add_tooltip(btn_export_entry, text="Export the selected entry in the list to a JSON file.")
+
+    btn_export_to_image = ttk.Button(
+        root,
+        text="Export to Image →",
+        command=on_press_export_image,
+    )
+    add_tooltip(
+        btn_export_to_image,
+        text="Export the current preview of the CLEVA Compass to an image (SVG/PNG)",
+    )
+
+    use_native_renderer = BooleanVar(root, MISSING_PDF2IMG)
+    cb_native_renderer = ttk.Checkbutton(
+        root,
+        text="Native SVG renderer",
+        variable=use_native_renderer,
+        style="Default.TCheckbutton",
+    )
+    add_tooltip(
+        cb_native_renderer,
+        text="Draw SVG exports directly in Python instead of compiling them with pdflatex and "
+        "pdf2svg.",
+    )
+
+    btn_import_entry = ttk.Button(
+        root,
+        text="← Import Ent. from File(s)",
+        command=on_press_import_button,
+    )
+    add_tooltip(
+        btn_import_entry, text="Import CLEVA Compass entries from one or multiple JSON files."
+    )
+
+    btn_export_to_tex = ttk.Button(
+        root,
+        text="Export to Tex File →",
+        command=on_press_generate_compass,
+    )
+    add_tooltip(btn_export_to_tex, text="Export the CLEVA Compass as Tikz code into a LaTeX file.")
+
+    btn_reload_preview = ttk.Button(
+        root,
+        text="Reload Preview →",
+        command=on_press_generate_image,
+    )
+    add_tooltip(
+        btn_reload_preview,
+        text="Reload the CLEVA Compass preview, based on the current list of entries.",
+    )
+
+
+    btn_download_methods = ttk.Button(
+        root,
+        text="Download methods ↓",
+        command=on_press_download_methods_button,
+    )
+    add_tooltip(
+        btn_download_methods,
+        text="Rerieve the methods from the github repo and place them in `methods` directory",
+    )
+
+    buttons = [
+        btn_add_entry,
+        btn_delete_entry,
+        btn_update_entry,
+        btn_reload_preview,
+        btn_download_methods,
+        btn_import_entry,
+        btn_export_entry,
+        btn_export_to_image,
+        btn_export_to_tex,
+    ]
+
+    kwargs = dict(columnspan=2, padx=0, pady=0, sticky=W + E)
+
+    # Entry buttons
+    btn_add_entry.grid(row=len(inner_levels) + 6, column=4, **kwargs)
+    btn_delete_entry.grid(row=len(inner_levels) + 7, column=4, **kwargs)
+    btn_update_entry.grid(row=len(inner_levels) + 8, column=4, **kwargs)
+    btn_export_entry.grid(row=len(inner_levels) + 9, column=4, **kwargs)
+    btn_import_entry.grid(row=len(inner_levels) + 10, column=4, **kwargs)
+
+    # Export Buttons
+    btn_export_to_image.grid(row=outer_level_start_row + 6, column=4, **kwargs)
+    btn_export_to_tex.grid(row=outer_level_start_row + 7, column=4, **kwargs)
+    btn_reload_preview.grid(row=outer_level_start_row + 8, column=4, **kwargs)
+    btn_download_methods.grid(row=outer_level_start_row + 11, column=4, **kwargs)
+    cb_native_renderer.grid(row=outer_level_start_row + 9, column=4, **kwargs)
+
+    # Assign buttons in a 4x2 grid
+    # for i, btn in enumerate(buttons):
+    #     btn.grid(
+    #         row=button_starting_row + 1 + i // 4,
+    #         column=4 + (i * 2) % 8,
+    #         **kwargs,
+    #     )
+
+    # Listbox to list already added elements
+    label = ttk.Label(root, text="Compass Entries", background=bg)
+    label.grid(row=len(inner_levels) + 5, column=0, columnspan=4, **header_label_kwargs)
+    label.config(font=("Arial", 16))
+
+    list_hint = ttk.Label(root, text="(select to delete/update)", background=bg)
+    list_hint.grid(row=len(inner_levels) + 5, column=2, sticky=W + E, padx=padx, pady=pady)
+    list_hint.config(font=("Arial", 8))
+
+    # Type-ahead filter of the entry list
+    filter_val = StringVar()
+    filter_val.after_id = None
+    filter_val.trace_add("write", on_filter_changed)
+    entry_filter = ttk.Entry(root, textvariable=filter_val)
+    entry_filter.grid(row=len(inner_levels) + 5, column=3, sticky=W + E, padx=padx, pady=pady)
+    add_tooltip(
+        entry_filter,
+        text="Filter the entries by label and attributes, e.g. 'replay federated=1 forgetting=1'.",
+    )
+
+    # Only the visible rows of the entry list are created, so that it also holds whole libraries
+    lb = VirtualListbox(root, entry_text, on_select_method, background="white", foreground="black")
+    lb.grid(
+        row=len(inner_levels) + 6,
+        column=0,
+        rowspan=5,
+        columnspan=4,
+        sticky=W + E + N + S,
+        padx=padx + 5,
+        pady=0,
+    )
+
+    if libraries_available():
+        # img = tikz2img(tex_output)
+        # img = update_background(img)
+        # photo = ImageTk.PhotoImage(scale_image_to_width(img, width=500))
+        image = Label(root, image=None, background=bg, border=4, relief="ridge")
+        image.image = None
+        image_start_row = outer_level_start_row + 5
+        image_start_col = outer_level_start_col + 2
+        image_colspan = 6
+        image_rowspan = len(outer_levels)
+        image.grid(
+            row=image_start_row,
+            column=image_start_col,
+            columnspan=image_colspan,
+            rowspan=image_rowspan,
+            padx=padx,
+            pady=pady,
+            ipadx=3,
+            ipady=3,
+        )
+
+        # Indeterminate progress bar below the preview, running while renders are in flight
+        progress = ttk.Progressbar(root, mode="indeterminate")
+        progress.running = False
+        progress.grid(
+            row=image_start_row + image_rowspan,
+            column=image_start_col,
+            columnspan=image_colspan,
+            sticky=W + E,
+            padx=padx,
+            pady=pady,
+        )
+    else:
+        progress = None
+        warn_missing_libraries()
+
 
 # Add some dummy example
 def init_load_dummy_entry():
@@ -727,13 +909,24 @@ def init_load_dummy_entry():
     entry.outer_level.stored_data = True
     entry_label.insert(0, entry.label)
     set_state(entry)
-    global_entries.append(entry)
-    lb.insert(len(global_entries), entry.label + " (" + entry.color + ")")
+    store.add(entry)
+    update_entry_list()
     import PIL.Image
     image.image = ImageTk.PhotoImage(PIL.Image.open(".dummy.png"))
     image.configure(image=image.image)
     # on_press_generate_image()
 
 
-init_load_dummy_entry()
-root.mainloop()
+def main():
+    global preview_worker
+    # Renders run on background threads, so that the window stays responsive while pdflatex runs.
+    # Preview requests in quick succession are coalesced into a single render, exports are queued.
+    preview_worker = RenderWorker(delay=0.25)
+    build_window()
+    init_load_dummy_entry()
+    poll_render_workers()
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
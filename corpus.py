@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for large method corpora.
+
+Every entry is one row of NumPy arrays: the packed inner level (levels.pack_inner), the packed outer
+level (levels.pack_outer), an index into the color table and the label as UTF-8 bytes in one shared
+buffer. A corpus is saved as a directory of .npy files which are memory-mapped when loaded, so
+opening even millions of entries only reads the file headers.
+
+Example: build a corpus from the method library
+
+    $ python corpus.py methods.corpus methods/
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from entry_loader import load_entry_files
+from levels import CompassEntry, InnerLevel, OuterLevel, INNER_FIELDS, OUTER_FIELDS
+from levels import pack_inner, pack_outer, unpack_inner, unpack_outer
+
+COLUMNS = ["inner", "outer", "color", "label_offsets", "label_data"]
+META = "corpus.json"
+VERSION = 1
+
+_INNER_WEIGHTS = 3 ** np.arange(len(INNER_FIELDS), dtype=np.uint32)
+_OUTER_BITS = np.arange(len(OUTER_FIELDS), dtype=np.uint16)
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="Build a CLEVA-Compass corpus from JSON data or method files.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "output",
+        help="Output corpus directory.",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="JSON data files or directories of method files.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes decoding the input files (default: number of CPUs).",
+    )
+    return parser.parse_args()
+
+
+class Corpus(object):
+    """Compass entries stored column-wise in NumPy arrays, one row per entry."""
+
+    def __init__(self, inner, outer, color, colors, label_offsets, label_data):
+        self.inner = inner  # uint32, packed inner levels
+        self.outer = outer  # uint16, packed outer levels
+        self.color = color  # uint8, index into colors
+        self.colors = list(colors)  # Color names
+        self.label_offsets = label_offsets  # int64, start of every label and end of the last one
+        self.label_data = label_data  # uint8, UTF-8 encoded labels
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Create a corpus from CompassEntry objects (or their __slots__ variants)."""
+        colors = {}
+        color = [colors.setdefault(e.color, len(colors)) for e in entries]
+        if len(colors) > 256:
+            raise ValueError(f"{len(colors)} different colors, at most 256 are supported")
+        labels = [e.label.encode() for e in entries]
+        offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+        np.cumsum([len(label) for label in labels], out=offsets[1:])
+        return cls(
+            np.array([pack_inner(e.inner_level) for e in entries], dtype=np.uint32),
+            np.array([pack_outer(e.outer_level) for e in entries], dtype=np.uint16),
+            np.array(color, dtype=np.uint8),
+            colors,
+            offsets,
+            np.frombuffer(b"".join(labels), dtype=np.uint8),
+        )
+
+    def __len__(self):
+        return len(self.inner)
+
+    def label(self, i):
+        """Label of the i-th entry."""
+        start, end = self.label_offsets[i], self.label_offsets[i + 1]
+        return self.label_data[start:end].tobytes().decode()
+
+    def entry(self, i, inner_cls=InnerLevel, outer_cls=OuterLevel, entry_cls=CompassEntry):
+        """The i-th entry, by default as CompassEntry."""
+        return entry_cls(
+            self.colors[self.color[i]],
+            self.label(i),
+            inner_cls(*unpack_inner(int(self.inner[i]))),
+            outer_cls(*unpack_outer(int(self.outer[i]))),
+        )
+
+    def __getitem__(self, i):
+        if isinstance(i, (slice, np.ndarray, list)):
+            return self.select(i)
+        return self.entry(range(len(self))[i])
+
+    def __iter__(self):
+        return (self.entry(i) for i in range(len(self)))
+
+    def inner_levels(self):
+        """Inner levels as (n, 11) uint8 array, columns in the field order of InnerLevel."""
+        return (self.inner[:, None] // _INNER_WEIGHTS % 3).astype(np.uint8)
+
+    def outer_levels(self):
+        """Outer levels as (n, 15) bool array, columns in the field order of OuterLevel."""
+        return (self.outer[:, None] >> _OUTER_BITS & 1).astype(bool)
+
+    def column(self, field):
+        """Values of one inner or outer level attribute for all entries."""
+        if field in INNER_FIELDS:
+            return (self.inner // _INNER_WEIGHTS[INNER_FIELDS.index(field)] % 3).astype(np.uint8)
+        if field in OUTER_FIELDS:
+            return (self.outer >> OUTER_FIELDS.index(field) & 1).astype(bool)
+        raise ValueError(f"Unknown attribute '{field}'")
+
+    def where(self, color=None, **attributes):
+        """
+        Boolean mask of the entries matching all conditions, given as field=value or
+        field=[values], e.g. corpus.where(federated=1, forgetting=True).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if color is not None:
+            if color not in self.colors:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.color == self.colors.index(color)
+        for field, value in attributes.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= np.isin(self.column(field), [int(v) for v in values])
+        return mask
+
+    def select(self, rows):
+        """New in-memory corpus of the given rows (indices, slice or boolean mask)."""
+        indices = np.arange(len(self))[rows]
+        starts = self.label_offsets[indices]
+        lengths = self.label_offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Position of every label byte in the old buffer
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return Corpus(
+            self.inner[indices],
+            self.outer[indices],
+            self.color[indices],
+            self.colors,
+            offsets,
+            self.label_data[positions],
+        )
+
+    def save(self, path):
+        """Save the corpus as directory of .npy files."""
+        os.makedirs(path, exist_ok=True)
+        for name in COLUMNS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, META), "w") as f:
+            json.dump({"version": VERSION, "size": len(self), "colors": self.colors}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved corpus. With mmap, the columns are memory-mapped read-only."""
+        with open(os.path.join(path, META)) as f:
+            meta = json.load(f)
+        if meta.get("version") != VERSION:
+            raise ValueError(f"Unsupported corpus version {meta.get('version')}")
+
+        columns = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None)
+            for name in COLUMNS
+        }
+        return cls(colors=meta["colors"], **columns)
+
+
+def load_entries(inputs, workers=None):
+    """Read the entries of JSON data files and of all method files in directories."""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True))
+        else:
+            files.append(path)
+    return load_entry_files(files, workers)
+
+
+def load_corpus(inputs, workers=None):
+    """Load a saved corpus, or build one from JSON data files and directories of method files."""
+    if len(inputs) == 1 and os.path.exists(os.path.join(inputs[0], META)):
+        return Corpus.load(inputs[0])
+    return Corpus.from_entries(load_entries(inputs, workers))
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    corpus = Corpus.from_entries(load_entries(args.inputs, args.workers))
+    corpus.save(args.output)
+    print(f"Saved {len(corpus)} entries to {args.output}")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Coverage statistics of method corpora.
+
+The statistics are computed from histograms of the packed levels of a Corpus (see corpus.py): one
+np.bincount pass over the packed inner and one over the packed outer level column, from which the
+counts per attribute and level are summed up. Large, memory-mapped corpora are read in chunks.
+
+An aggregate compass shows the statistics as one entry: its inner polygon is drawn at the mean (or
+a quantile) level of every attribute and its outer stripes are shaded by the reporting frequency.
+
+Example: statistics of the method library and its aggregate compass
+
+    $ python corpus_stats.py methods/ --output aggregate.svg
+"""
+import argparse
+import json
+import os
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from corpus import Corpus, load_corpus
+from create_compass import (
+    FORMATS,
+    insert_inner_level_aggregate,
+    insert_legend,
+    insert_number_of_methods,
+    insert_outer_level_aggregate,
+    render_tex,
+)
+from levels import INNER_CODES, INNER_FIELDS, INNER_ORDER, OUTER_CODES, OUTER_FIELDS, OUTER_ORDER
+
+CHUNK_SIZE = 1 << 22  # Rows per bincount pass
+LEVELS = ["none", "supervised", "unsupervised"]
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="Coverage statistics of CLEVA-Compass methods.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        default=["methods"],
+        help="JSON data files, directories of method files or a saved corpus.",
+    )
+    parser.add_argument(
+        "--where",
+        nargs="+",
+        default=[],
+        help="Only methods matching all conditions <attribute>=<value>, see method_index.py.",
+    )
+    parser.add_argument(
+        "--inner",
+        type=inner_aggregate,
+        default="mean",
+        help="Inner level of the aggregate compass: 'mean', 'median' or a quantile in [0, 1].",
+    )
+    parser.add_argument(
+        "--color",
+        default="blue",
+        help="Color of the aggregate compass.",
+    )
+    parser.add_argument(
+        "--json",
+        default=None,
+        help="Save the statistics to this JSON file.",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Render the aggregate compass into this file "
+        f"({', '.join('.' + f for f in FORMATS)}).",
+    )
+    return parser.parse_args()
+
+
+def inner_aggregate(value):
+    """Argument type of --inner: 'mean', 'median' or a quantile in [0, 1] as float."""
+    if value in ("mean", "median"):
+        return value
+    try:
+        q = float(value)
+    except ValueError:
+        q = None
+    if q is None or not 0 <= q <= 1:
+        raise argparse.ArgumentTypeError("expected 'mean', 'median' or a number in [0, 1]")
+    return q
+
+
+@dataclass
+class AggregateEntry:
+    """Compass entry summarizing many methods, rendered by the *_aggregate emitters."""
+
+    color: str
+    label: str
+    inner_levels: List[float]  # Level of every inner attribute, in InnerLevel iteration order
+    outer_frequencies: List[float]  # Share of every outer attribute, in OuterLevel iteration order
+
+
+@dataclass
+class CorpusStats:
+    """Number of methods per inner attribute and level and per reported outer attribute."""
+
+    size: int
+    inner_counts: np.ndarray  # (11, 3), rows in InnerLevel field order, columns per level
+    outer_counts: np.ndarray  # (15,), in OuterLevel field order
+
+    @classmethod
+    def from_corpus(cls, corpus, mask=None):
+        """Statistics of a Corpus, or of its rows selected by the boolean mask."""
+        inner_hist = np.zeros(INNER_CODES, dtype=np.int64)
+        outer_hist = np.zeros(OUTER_CODES, dtype=np.int64)
+        size = 0
+        for start in range(0, len(corpus), CHUNK_SIZE):
+            inner = corpus.inner[start : start + CHUNK_SIZE]
+            outer = corpus.outer[start : start + CHUNK_SIZE]
+            if mask is not None:
+                chunk_mask = mask[start : start + CHUNK_SIZE]
+                inner, outer = inner[chunk_mask], outer[chunk_mask]
+            inner_hist += np.bincount(inner, minlength=INNER_CODES)
+            outer_hist += np.bincount(outer, minlength=OUTER_CODES)
+            size += len(inner)
+
+        # Axis a of the reshaped histograms is the digit (field) n - 1 - a of the packed codes
+        n_inner, n_outer = len(INNER_FIELDS), len(OUTER_FIELDS)
+        inner_hist = inner_hist.reshape((3,) * n_inner)
+        outer_hist = outer_hist.reshape((2,) * n_outer)
+        inner_counts = np.stack(
+            [inner_hist.sum(axis=_other_axes(n_inner, n_inner - 1 - f)) for f in range(n_inner)]
+        )
+        outer_counts = np.array(
+            [outer_hist.sum(axis=_other_axes(n_outer, n_outer - 1 - f))[1] for f in range(n_outer)]
+        )
+        return cls(size, inner_counts, outer_counts)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Statistics of a list of CompassEntry objects."""
+        return cls.from_corpus(Corpus.from_entries(entries))
+
+    def __add__(self, other):
+        """Statistics of the union of two corpora."""
+        return CorpusStats(
+            self.size + other.size,
+            self.inner_counts + other.inner_counts,
+            self.outer_counts + other.outer_counts,
+        )
+
+    def inner_shares(self):
+        """(11, 3) share of methods per inner attribute (field order) and level."""
+        return self.inner_counts / max(self.size, 1)
+
+    def inner_mean(self):
+        """Mean level of every inner attribute (field order)."""
+        return self.inner_shares() @ np.arange(3)
+
+    def inner_quantile(self, q):
+        """The q-quantile level of every inner attribute (field order)."""
+        cumulative = np.cumsum(self.inner_shares(), axis=1)
+        return np.argmax(cumulative >= q - 1e-12, axis=1)
+
+    def outer_frequencies(self):
+        """Share of methods reporting every outer attribute (field order)."""
+        return self.outer_counts / max(self.size, 1)
+
+    def to_dict(self):
+        """The statistics as JSON-serializable dict keyed by attribute names."""
+        shares = self.inner_shares()
+        means = self.inner_mean()
+        frequencies = self.outer_frequencies()
+        return {
+            "size": self.size,
+            "inner_level": {
+                field: dict(zip(LEVELS, shares[f].tolist()), mean=means[f].item())
+                for f, field in enumerate(INNER_FIELDS)
+            },
+            "outer_level": {field: frequencies[f].item() for f, field in enumerate(OUTER_FIELDS)},
+        }
+
+    def aggregate(self, inner="mean", color="blue", label=None):
+        """
+        Aggregate compass entry. inner is 'mean', 'median' or a quantile q in [0, 1], which selects
+        the level of the inner polygon.
+        """
+        if inner == "mean":
+            levels = self.inner_mean()
+            name = "Mean"
+        else:
+            q = 0.5 if inner == "median" else float(inner)
+            levels = self.inner_quantile(q)
+            name = "Median" if q == 0.5 else f"Quantile {q:g}"
+        if label is None:
+            label = f"{name} of {self.size} methods"
+        inner_levels = dict(zip(INNER_FIELDS, levels.tolist()))
+        frequencies = dict(zip(OUTER_FIELDS, self.outer_frequencies().tolist()))
+        return AggregateEntry(
+            color,
+            label,
+            [inner_levels[field] for field in INNER_ORDER],
+            [frequencies[field] for field in OUTER_ORDER],
+        )
+
+
+def _other_axes(n, axis):
+    return tuple(a for a in range(n) if a != axis)
+
+
+def fill_template_aggregate(template_path, aggregates):
+    """Fill the template with aggregate entries."""
+    with open(template_path) as f:
+        template = f.read()
+    template = insert_legend(template, aggregates)
+    template = insert_outer_level_aggregate(template, aggregates)
+    template = insert_inner_level_aggregate(template, aggregates)
+    return insert_number_of_methods(template, aggregates)
+
+
+def render_aggregate(aggregates, fmt="tex", template_path="cleva_template.tex", cache=None):
+    """Render an aggregate compass into fmt (one of FORMATS) and return bytes."""
+    return render_tex(fill_template_aggregate(template_path, aggregates), fmt, cache)
+
+
+def print_stats(stats):
+    """Print the statistics as tables."""
+    shares = stats.inner_shares()
+    means = stats.inner_mean()
+    print(f"{stats.size} methods\n")
+    print(f"{'Inner level':<24}" + "".join(f"{level:>14}" for level in LEVELS) + f"{'mean':>8}")
+    for f, field in enumerate(INNER_FIELDS):
+        row = "".join(f"{share:>13.1%} " for share in shares[f])
+        print(f"{field:<24}{row}{means[f]:>7.2f}")
+    print(f"\n{'Outer level':<24}{'reported':>14}")
+    for field, frequency in zip(OUTER_FIELDS, stats.outer_frequencies()):
+        print(f"{field:<24}{frequency:>13.1%}")
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    corpus = load_corpus(args.inputs)
+    mask = None
+    if args.where:
+        from method_index import parse_conditions
+
+        mask = corpus.where(**parse_conditions(args.where))
+    stats = CorpusStats.from_corpus(corpus, mask)
+    print_stats(stats)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(stats.to_dict(), f, indent=2)
+        print(f"\nSaved the statistics to {args.json}")
+    if args.output is not None:
+        fmt = os.path.splitext(args.output)[1][1:]
+        aggregate = stats.aggregate(args.inner, args.color)
+        with open(args.output, "wb") as f:
+            f.write(render_aggregate([aggregate], fmt))
+        print(f"\nRendered the aggregate compass to {args.output}")
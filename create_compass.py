@@ -3,7 +3,28 @@ import json
 from typing import List
 import math
 import argparse
-from levels import InnerLevel, OuterLevel, CompassEntry
+import functools
+import glob
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import tracing
+from levels import InnerLevel, OuterLevel, CompassEntry, LATEX_COLORS
+from entry_loader import decode_entries, iter_json_entries
+
+# Output formats
+FORMATS = ["tex", "svg", "png", "pdf"]
+# Output formats per renderer
+RENDERERS = {"tikz": FORMATS, "native": ["svg"]}
+
+# Name of the file in the batch output directory that records the rendered inputs
+BATCH_MANIFEST = ".cleva-batch.json"
+
+# Number of compiled templates kept by CompiledTemplate.load and .from_string
+TEMPLATE_CACHE_SIZE = 16
 
 # Constants
 D = 11  # Number of protocol dimensions
@@ -25,13 +46,72 @@ def parse_arguments():
     )
     parser.add_argument(
         "--output",
-        default="cleva_filled.tex",
-        help="Tikz filled output file.",
+        default=None,
+        help="Output file (default: cleva_filled.<format>).",
     )
     parser.add_argument(
         "--data",
-        default="data.json",
-        help="Entries as JSON file.",
+        default=["data.json"],
+        nargs="+",
+        help="Entries as JSON file. In batch mode, multiple files, directories and glob patterns "
+        "(e.g. 'methods/*.json') are accepted.",
+    )
+    parser.add_argument(
+        "--renderer",
+        default="tikz",
+        choices=list(RENDERERS),
+        help="Output renderer: 'tikz' writes the filled TikZ template (and renders it with LaTeX), "
+        "'native' writes an SVG directly from Python without LaTeX (svg format only).",
+    )
+    parser.add_argument(
+        "--layered",
+        action="store_true",
+        help="Composite svg/png outputs from a cached static background and a "
+        "per-compass overlay, which only contains the entries.",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Emit minimized TikZ code: merge adjacent stripes of the same color, drop empty "
+        "inner levels and round coordinates. Faster to compile for many entries.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="Batch mode: render each data file into this directory.",
+    )
+    parser.add_argument(
+        "--format",
+        default=None,
+        nargs="+",
+        choices=FORMATS,
+        help="Output formats, multiple formats in batch mode only (default: the extension of "
+        "--output, svg with --renderer native, else tex).",
+    )
+    parser.add_argument(
+        "--width",
+        type=int,
+        default=None,
+        help="Width of png outputs in pixels (default: as rendered).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Batch mode: number of worker processes.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Batch mode: re-render data files even if they did not change.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cleva_profile",
+        default=None,
+        help="Trace the time of every render stage into <PROFILE>.jsonl, write a cProfile dump to "
+        "<PROFILE>.prof and print a summary.",
     )
 
     return parser.parse_args()
@@ -39,169 +119,508 @@ def parse_arguments():
 
 def mapcolor(color):
     """Maps the given simple colors string to a specific color for latex."""
-    return {
-        "magenta": "magenta",
-        "green": "green!50!black",
-        "blue": "blue!70!black",
-        "orange": "orange!90!black",
-        "cyan": "cyan!90!black",
-        "brown": "brown!90!black",
-        "lime": "lime",
-        "pink": "pink",
-        "purple": "purple",
-        "teal": "teal",
-        "lightgray": "lightgray",
-    }[color]
+    return LATEX_COLORS[color]
 
 
-def insert_legend(template, entries):
-    """Insert the CLEVA-Compass legend below the compass."""
+def legend_shape(M):
+    """Number of rows/columns of the legend of M entries, with max. three elements per row."""
+    return math.ceil(M / 3), 3 if M >= 3 else M
+
+
+def legend_separator(i, n_rows, n_cols):
+    """Separator following the i-th cell of a legend with n_rows rows and n_cols columns."""
+    # x/y coordinates of the entry
+    x = i % 3
+    y = round(i // 3)
+
+    # Depending on last column/row
+    is_last_column = x == n_cols - 1
+    is_last_row = y == n_rows - 1
+    if not is_last_column:
+        # Add & for next element in row
+        return r" & "
+    if not is_last_row:
+        # Add horizontal space if there is another row
+        return " \\\\[0.15cm] \n"
+    # Add no horizontal space if this is the last row
+    return " \\\\ \n"
+
+
+def legend_cell(e: CompassEntry, separator):
+    """Legend cell of an entry, which uses \\lentry defined in the tikz template."""
+    return r"\lentry{" + mapcolor(e.color) + "}{" + e.label + "}" + separator
+
+
+def emit_legend(out, entries):
+    """Emit the CLEVA-Compass legend below the compass into the buffer out."""
 
     # Skip if no entries are given (else the empty tabular will produce compile errors)
     if len(entries) == 0:
-        return template
+        out.append(LEGEND)
+        return
 
-    # Compute number of rows/columns with max. three elements per row
-    n_rows = math.ceil(len(entries) / 3)
-    n_cols = 3 if len(entries) >= 3 else len(entries)
+    n_rows, n_cols = legend_shape(len(entries))
 
     # Begin legend tabular
-    legend_str = ""
-    legend_str += r"\begin{tabular}{" + " ".join(["l"] * n_cols) + "} \n"
+    out.append(r"\begin{tabular}{" + " ".join(["l"] * n_cols) + "} \n")
 
     for i, e in enumerate(entries):
-        # x/y coordinates of the entry
-        x = i % 3
-        y = round(i // 3)
-
-        # Actual entry which uses \lentry defined in the tikz template
-        legend_str += r"\lentry{" + mapcolor(e.color) + "}{" + e.label + "}"
-
-        # Depending on last column/row
-        is_last_column = x == n_cols - 1
-        is_last_row = y == n_rows - 1
-        if not is_last_column:
-            # Add & for next element in row
-            legend_str += r" & "
-        else:
-            if not is_last_row:
-                # Add horizontal space if there is another row
-                legend_str += " \\\\[0.15cm] \n"
-            else:
-                # Add no horizontal space if this is the last row
-                legend_str += " \\\\ \n"
+        out.append(legend_cell(e, legend_separator(i, n_rows, n_cols)))
 
     # End legend tabular
-    legend_str += "\end{tabular} \n"
+    out.append("\\end{tabular} \n")
 
-    # Replace the generated string in template
-    template = template.replace("%-$LEGEND$", legend_str)
-    return template
 
+def outer_level_strips(e: CompassEntry, e_idx, M):
+    """Outer level strips of the e_idx-th of M entries."""
+    # Add comment for readability
+    parts = ["% Entry for: " + e.label + "\n"]
 
-def insert_outer_level(template, entries: List[CompassEntry]):
-    """Insert outer level attributes."""
-    oc_str = ""
+    # Build \pic commands with coordinates depending on ol_idx and e_idx. Instead of using the
+    # variables of the template (ol_idx*\B+e_idx*\BM), the angles are computed here and inserted
+    # directly, formatted as repr of the float (like str)
+    pic = "\\pic at (0,0){strip={\\Instrip,%r,%r," + e.color + "shell, black, {}}};\n"
+    start = e_idx * B / M
+    end = (e_idx + 1) * B / M
+
+    # For each outer level attribute
+    for ol_idx, has_attribute in enumerate(e.outer_level):
+        # If attribute is not present, skip and leave white
+        if not has_attribute:
+            continue
+        offset = ol_idx * B
+        # Invert stripe direction when in the lower half (index larger than 7)
+        if ol_idx > 7:
+            parts.append(pic % (offset + end, offset + start))
+        else:
+            parts.append(pic % (offset + start, offset + end))
+    parts.append("\n")
+    return "".join(parts)
+
+
+def inner_level_path(e: CompassEntry):
+    """Inner level path connection of an entry."""
+    path = " -- ".join(f"(D{i+1}-{irv})" for i, irv in enumerate(e.inner_level))
+    return f"\\draw [color={mapcolor(e.color)},line width=1.5pt,opacity=0.6, fill={mapcolor(e.color)}!10, fill opacity=0.4] {path} -- cycle;\n"
+
+
+def emit_outer_level(out, entries: List[CompassEntry]):
+    """Emit outer level attributes into the buffer out."""
     M = len(entries)
     for e_idx, e in enumerate(entries):
-        # Add comment for readability
-        s = "% Entry for: " + e.label + "\n"
+        out.append(outer_level_strips(e, e_idx, M))
+
+
+def emit_inner_level(out, entries: List[CompassEntry]):
+    """Emit inner level path connections into the buffer out."""
+    for e in entries:
+        out.append(inner_level_path(e))
+
+
+def emit_number_of_methods(out, entries: List[CompassEntry]):
+    """Emit number of methods as newcommand \\M into the buffer out."""
+    out.append(r"\newcommand{\M}{" + str(len(entries)) + "}")
 
-        # For each outer level attribute
-        for ol_idx, has_attribute in enumerate(e.outer_level):
-            # If attribute is not present, skip and leave white
-            if not has_attribute:
+
+# Decimal places of coordinates emitted by the optimizing emitters
+PRECISION = 2
+
+
+def number(x):
+    """Format a coordinate with at most PRECISION decimal places."""
+    return f"{round(x, PRECISION):g}"
+
+
+def emit_outer_level_optimized(out, entries: List[CompassEntry]):
+    """
+    Emit outer level attributes with as few TikZ commands as possible. Adjacent stripes of the same
+    color within an evaluation measure are merged into a single arc and drawn with a reusable pic,
+    which skips the empty text decoration of the template strip pic.
+    """
+    M = len(entries)
+    out.append(
+        "\\tikzset{pics/estrip/.style n args={3}{code={"
+        "\\draw[#3] (#1:\\Instrip-1.25mm) arc (#1:#2:\\Instrip-1.25mm) "
+        "-- (#2:\\Instrip+1.25mm) arc (#2:#1:\\Instrip+1.25mm) -- cycle;}}}\n"
+    )
+    outer_levels = [tuple(e.outer_level) for e in entries]
+    for ol_idx in range(EV):
+        e_idx = 0
+        while e_idx < M:
+            e = entries[e_idx]
+            if not outer_levels[e_idx][ol_idx]:
+                e_idx += 1
                 continue
 
-            # Build \pic command with coordinates depending on ol_idx and e_idx
-            # Use variables defined in the template
-            # angle_start = f"{ol_idx}*\B+{e_idx}*\BM"
-            # angle_end = f"{ol_idx}*\B+{e_idx + 1}*\BM"
+            # Extend the stripe over all following entries of the same color with this attribute
+            e_end = e_idx + 1
+            while (
+                e_end < M
+                and entries[e_end].color == e.color
+                and outer_levels[e_end][ol_idx]
+            ):
+                e_end += 1
+
+            angle_start = number(ol_idx * B + e_idx * B / M)
+            angle_end = number(ol_idx * B + e_end * B / M)
+            out.append(f"\\pic{{estrip={{{angle_start}}}{{{angle_end}}}{{{e.color}shell}}}};\n")
+            e_idx = e_end
+
 
-            # Compute dimensions here and insert angle directly
-            angle_start = str(ol_idx * B + e_idx * B / M)
-            angle_end = str(ol_idx * B + (e_idx + 1) * B / M)
+def emit_inner_level_optimized(out, entries: List[CompassEntry]):
+    """
+    Emit inner level path connections using one style per color. Entries without any inner level
+    attribute are skipped, since their path collapses into the origin, and consecutive vertices in
+    the origin are merged.
+    """
+    colors = []
+    for e in entries:
+        if e.color not in colors:
+            colors.append(e.color)
+    for color in colors:
+        c = mapcolor(color)
+        out.append(
+            f"\\tikzset{{{color}inner/.style={{color={c},line width=1.5pt,opacity=0.6,"
+            f"fill={c}!10,fill opacity=0.4}}}}\n"
+        )
 
-            # Invert stripe direction when in the lower half (index larger than 7)
+    for e in entries:
+        # All D<i>-0 coordinates are the origin, so consecutive zeros are a single vertex
+        vertices = []
+        for i, irv in enumerate(e.inner_level):
+            if irv == 0 and vertices and vertices[-1][1] == 0:
+                continue
+            vertices.append((i + 1, irv))
+        if len(vertices) > 1 and vertices[0][1] == 0 and vertices[-1][1] == 0:
+            vertices.pop()
+        if all(irv == 0 for _, irv in vertices):
+            continue
+        path = "--".join(f"(D{i}-{irv})" for i, irv in vertices)
+        out.append(f"\\draw[{e.color}inner]{path}--cycle;\n")
+
+
+def emit_outer_level_aggregate(out, aggregates):
+    """
+    Emit the outer level of aggregate entries (see corpus_stats.py) into the buffer out. The stripe
+    of every attribute is shaded by the share of methods reporting it.
+    """
+    M = len(aggregates)
+    for a_idx, a in enumerate(aggregates):
+        c = mapcolor(a.color)
+        out.append("% Reporting frequencies of: " + a.label + "\n")
+        for ol_idx, frequency in enumerate(a.outer_frequencies):
+            if frequency <= 0:
+                continue
+            style = f"aggregate{a_idx}-{ol_idx}"
+            out.append(
+                f"\\tikzset{{{style}/.style={{draw={c},fill={c},draw opacity=0.5,"
+                f"fill opacity={number(0.9 * frequency)}}}}}\n"
+            )
+            angle_start = number(ol_idx * B + a_idx * B / M)
+            angle_end = number(ol_idx * B + (a_idx + 1) * B / M)
             if ol_idx > 7:
                 angle_start, angle_end = angle_end, angle_start
+            strip = f"\\Instrip,{angle_start},{angle_end},{style},black,{{}}"
+            out.append(f"\\pic at (0,0){{strip={{{strip}}}}};\n")
+        out.append("\n")
 
-            shell = e.color + "shell"
-            s += (
-                "\pic at (0,0){strip={\Instrip,"
-                + angle_start
-                + ","
-                + angle_end
-                + ","
-                + shell
-                + ", black, {}}};\n"
-            )
-        oc_str += s + "\n"
 
-    template = template.replace("%-$OUTER-CIRCLE$", oc_str)
-    return template
+def emit_inner_level_aggregate(out, aggregates):
+    """
+    Emit the inner level polygons of aggregate entries into the buffer out. Their levels may be
+    fractional, e.g. the mean level of a corpus, so the vertices are given as polar coordinates.
+    """
+    for a in aggregates:
+        c = mapcolor(a.color)
+        path = " -- ".join(
+            f"({i + 1}*\\A:{number(level)}*\\R/\\U)" for i, level in enumerate(a.inner_levels)
+        )
+        out.append(
+            f"\\draw [color={c},line width=1.5pt,opacity=0.6, fill={c}!10, fill opacity=0.4] "
+            f"{path} -- cycle;\n"
+        )
+
+
+def _insert(placeholder, emit, template, entries):
+    out = []
+    emit(out, entries)
+    return template.replace(placeholder, "".join(out))
+
+
+def insert_legend(template, entries):
+    """Insert the CLEVA-Compass legend below the compass."""
+    return _insert(LEGEND, emit_legend, template, entries)
+
+
+def insert_outer_level(template, entries: List[CompassEntry]):
+    """Insert outer level attributes."""
+    return _insert(OUTER_CIRCLE, emit_outer_level, template, entries)
 
 
 def insert_inner_level(template, entries: List[CompassEntry]):
     """Insert inner level path connections."""
-    ir_str = ""
-    for e in entries:
-        path = " -- ".join(f"(D{i+1}-{irv})" for i, irv in enumerate(e.inner_level))
-        ir_str += f"\draw [color={mapcolor(e.color)},line width=1.5pt,opacity=0.6, fill={mapcolor(e.color)}!10, fill opacity=0.4] {path} -- cycle;\n"
-
-    template = template.replace("%-$INNER-CIRCLE$", ir_str)
-    return template
+    return _insert(INNER_CIRCLE, emit_inner_level, template, entries)
 
 
 def insert_number_of_methods(template, entries: List[CompassEntry]):
-    """Insert number of methods as newcommand \M."""
-    n_methods_str = r"\newcommand{\M}{" + str(len(entries)) + "}"
-    template = template.replace("%-$NUMBER-OF-METHODS$", n_methods_str)
-    return template
+    """Insert number of methods as newcommand \\M."""
+    return _insert(NUMBER_OF_METHODS, emit_number_of_methods, template, entries)
+
+
+def insert_outer_level_aggregate(template, aggregates):
+    """Insert the reporting frequencies of aggregate entries as outer level."""
+    return _insert(OUTER_CIRCLE, emit_outer_level_aggregate, template, aggregates)
+
+
+def insert_inner_level_aggregate(template, aggregates):
+    """Insert the (fractional) inner levels of aggregate entries."""
+    return _insert(INNER_CIRCLE, emit_inner_level_aggregate, template, aggregates)
+
+
+# Template placeholders and the functions emitting their content
+LEGEND = "%-$LEGEND$"
+OUTER_CIRCLE = "%-$OUTER-CIRCLE$"
+INNER_CIRCLE = "%-$INNER-CIRCLE$"
+NUMBER_OF_METHODS = "%-$NUMBER-OF-METHODS$"
+PLACEHOLDERS = {
+    LEGEND: emit_legend,
+    OUTER_CIRCLE: emit_outer_level,
+    INNER_CIRCLE: emit_inner_level,
+    NUMBER_OF_METHODS: emit_number_of_methods,
+}
+OPTIMIZED_PLACEHOLDERS = dict(
+    PLACEHOLDERS,
+    **{OUTER_CIRCLE: emit_outer_level_optimized, INNER_CIRCLE: emit_inner_level_optimized},
+)
+
+
+class CompiledTemplate(object):
+    """
+    A compass template parsed once into static segments and placeholder slots. Rendering emits all
+    parts into one buffer and joins it once (or streams them, see write), instead of copying the
+    whole document per placeholder. Most of the time is spent generating the entries though.
+    With optimize, the entries are emitted by the optimizing emitters, which produce a smaller
+    document for large numbers of entries.
+    """
+
+    _cache = {}  # (path, optimize) -> ((mtime, size), template), least recently used first
+    _cache_lock = threading.Lock()
+
+    def __init__(self, template, optimize=False):
+        placeholders = OPTIMIZED_PLACEHOLDERS if optimize else PLACEHOLDERS
+        pattern = re.compile("|".join(re.escape(p) for p in placeholders))
+        self.segments = []  # Static strings and placeholder emit functions
+        pos = 0
+        for m in pattern.finditer(template):
+            self.segments.append(template[pos : m.start()])
+            self.segments.append(placeholders[m.group(0)])
+            pos = m.end()
+        self.segments.append(template[pos:])
+
+    @classmethod
+    def load(cls, template_path, optimize=False):
+        """
+        Load and compile a template file. The TEMPLATE_CACHE_SIZE most recently used templates
+        are cached, each until its file is modified.
+        """
+        st = os.stat(template_path)
+        key = (os.path.abspath(template_path), optimize)
+        version = (st.st_mtime_ns, st.st_size)
+        with cls._cache_lock:
+            cached = cls._cache.pop(key, None)
+        if cached is None or cached[0] != version:
+            with open(template_path) as f:
+                cached = (version, cls(f.read(), optimize))
+        with cls._cache_lock:
+            cls._cache[key] = cached
+            while len(cls._cache) > TEMPLATE_CACHE_SIZE:
+                del cls._cache[next(iter(cls._cache))]
+        return cached[1]
+
+    @classmethod
+    @functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+    def from_string(cls, template, optimize=False):
+        """Compile a template given as string, cached by content."""
+        return cls(template, optimize)
+
+    def emit(self, out, entries, fragments=None):
+        """
+        Emit the filled template into the buffer out, reusing the fragments of unchanged entries
+        if a FragmentCache is given.
+        """
+        if fragments is not None:
+            fragments.emit(self.segments, out, entries)
+            return
+        for segment in self.segments:
+            if isinstance(segment, str):
+                out.append(segment)
+            else:
+                segment(out, entries)
+
+    def render(self, entries, fragments=None):
+        """Return the filled template as string, see emit."""
+        out = []
+        self.emit(out, entries, fragments)
+        return "".join(out)
+
+    def write(self, f, entries):
+        """
+        Stream the filled template into the text file (or e.g. socket.makefile('w')) f without
+        building the whole document in memory.
+        """
+        out = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                f.write(segment)
+            else:
+                segment(out, entries)
+                f.writelines(out)
+                out.clear()
+
+
+def entry_key(e: CompassEntry):
+    """Hashable key of the content of an entry."""
+    return (e.color, e.label, tuple(e.inner_level), tuple(e.outer_level))
+
+
+class _EntryFragments(object):
+    """Fragments generated for one entry content during one render."""
+
+    __slots__ = ["previous", "inner", "legend", "outer"]
+
+    def __init__(self, previous=None):
+        self.previous = previous  # Fragments of the same content in the previous render
+        self.inner = previous.inner if previous is not None else None
+        self.legend = previous.legend if previous is not None else {}  # Separator -> cell
+        self.outer = {}  # (e_idx, M) -> strips
+
+    def outer_level_strips(self, e, e_idx, M):
+        """Outer level strips of e at position e_idx of M, and whether they were generated."""
+        strips = self.outer.get((e_idx, M))
+        if strips is None and self.previous is not None:
+            strips = self.previous.outer.get((e_idx, M))
+        if strips is not None:
+            self.outer[(e_idx, M)] = strips
+            return strips, False
+        strips = self.outer[(e_idx, M)] = outer_level_strips(e, e_idx, M)
+        return strips, True
+
+
+class FragmentCache(object):
+    """
+    Cache of the TikZ fragments generated per entry, so that filling the template again after a
+    few entries were edited, added, removed or reordered only generates the fragments of those
+    entries.
+
+    Fragments are keyed by the entry content and, where they depend on it, by the position of the
+    entry: inner paths by content only, legend cells by their separator and outer strips by the
+    index e_idx and number of entries M, since their angles depend on both. Only the fragments
+    used by the latest render are kept, so the cache never holds more than one document and stale
+    positions are dropped as soon as entries move. The optimizing emitters draw across entries and
+    are not cached. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._fragments = {}  # entry_key -> _EntryFragments of the latest render
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def emit(self, segments, out, entries):
+        """Emit the segments of a CompiledTemplate filled with the entries into the buffer out."""
+        with self._lock:
+            previous = self._fragments
+        fragments = {}
+        records = []
+        for e in entries:
+            key = entry_key(e)
+            record = fragments.get(key)
+            if record is None:
+                record = fragments[key] = _EntryFragments(previous.get(key))
+            records.append(record)
+
+        lookups = misses = 0
+        for segment in segments:
+            if isinstance(segment, str):
+                out.append(segment)
+                continue
+            if segment is emit_legend:
+                misses += self._emit_legend(out, entries, records)
+            elif segment is emit_outer_level:
+                misses += self._emit_outer_level(out, entries, records)
+            elif segment is emit_inner_level:
+                misses += self._emit_inner_level(out, entries, records)
+            else:
+                segment(out, entries)
+                continue
+            lookups += len(entries)
+
+        for record in records:
+            record.previous = None
+        with self._lock:
+            self._fragments = fragments
+            self.hits += lookups - misses
+            self.misses += misses
+        tracing.count("fragments.hit", lookups - misses)
+        tracing.count("fragments.miss", misses)
+
+    def _emit_legend(self, out, entries, records):
+        if len(entries) == 0:
+            out.append(LEGEND)
+            return 0
+        misses = 0
+        n_rows, n_cols = legend_shape(len(entries))
+        out.append(r"\begin{tabular}{" + " ".join(["l"] * n_cols) + "} \n")
+        for i, (e, record) in enumerate(zip(entries, records)):
+            separator = legend_separator(i, n_rows, n_cols)
+            cell = record.legend.get(separator)
+            if cell is None:
+                cell = record.legend[separator] = legend_cell(e, separator)
+                misses += 1
+            out.append(cell)
+        out.append("\\end{tabular} \n")
+        return misses
+
+    def _emit_outer_level(self, out, entries, records):
+        misses = 0
+        M = len(entries)
+        for e_idx, (e, record) in enumerate(zip(entries, records)):
+            strips, generated = record.outer_level_strips(e, e_idx, M)
+            out.append(strips)
+            misses += generated
+        return misses
+
+    def _emit_inner_level(self, out, entries, records):
+        misses = 0
+        for e, record in zip(entries, records):
+            if record.inner is None:
+                record.inner = inner_level_path(e)
+                misses += 1
+            out.append(record.inner)
+        return misses
+
+    def stats(self):
+        """Hit/miss statistics of the fragment lookups and the number of cached entries."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._fragments),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._fragments = {}
 
 
 def read_json_entries(entries_json):
-    """Read the compass entries from a json file."""
-    entries = []
-    for d in entries_json:
-        dil = d["inner_level"]
-        dol = d["outer_level"]
-        entry = CompassEntry(
-            color=d["color"],
-            label=d["label"],
-            inner_level=InnerLevel(
-                multiple_models=dil["multiple_models"],
-                federated=dil["federated"],
-                online=dil["online"],
-                open_world=dil["open_world"],
-                multiple_modalities=dil["multiple_modalities"],
-                active_data_query=dil["active_data_query"],
-                task_order_discovery=dil["task_order_discovery"],
-                task_agnostic=dil["task_agnostic"],
-                episodic_memory=dil["episodic_memory"],
-                generative=dil["generative"],
-                uncertainty=dil["uncertainty"],
-            ),
-            outer_level=OuterLevel(
-                compute_time=dol["compute_time"],
-                mac_operations=dol["mac_operations"],
-                communication=dol["communication"],
-                forgetting=dol["forgetting"],
-                forward_transfer=dol["forward_transfer"],
-                backward_transfer=dol["backward_transfer"],
-                openness=dol["openness"],
-                parameters=dol["parameters"],
-                memory=dol["memory"],
-                stored_data=dol["stored_data"],
-                generated_data=dol["generated_data"],
-                optimization_steps=dol["optimization_steps"],
-                per_task_metric=dol["per_task_metric"],
-                task_order=dol["task_order"],
-                data_per_task=dol["data_per_task"],
-            ),
-        )
-        entries.append(entry)
-    return entries
+    """
+    Read the compass entries from the "entries" list of a json file. Raises EntryValidationError
+    listing all invalid fields.
+    """
+    return decode_entries(entries_json)
 
 
 def generate_random_entries():
@@ -251,32 +670,402 @@ def generate_random_entries():
     return entries
 
 
-def fill_template(template_path, entries):
-    template_path = template_path
-    with open(template_path) as f:
-        template = "".join(f.readlines())
+def fill_template(template_path, entries, optimize=False, fragments=None):
+    """
+    Fill the template file with the entries. Pass a FragmentCache as fragments when filling the
+    template repeatedly with slightly changed entries, e.g. while editing.
+    """
+    with tracing.span("fill_template", entries=len(entries), optimize=optimize) as span:
+        tex = CompiledTemplate.load(template_path, optimize).render(entries, fragments)
+        span.set(bytes_out=len(tex))
+        return tex
 
-    # Replace respective parts in template
-    output = template
-    output = insert_legend(output, entries)
-    output = insert_outer_level(output, entries)
-    output = insert_inner_level(output, entries)
-    output = insert_number_of_methods(output, entries)
 
-    return output
+def fill_template_string(template, entries, optimize=False):
+    """Fill the given template content with the entries."""
+    return CompiledTemplate.from_string(template, optimize).render(entries)
 
 
-if __name__ == "__main__":
-    args = parse_arguments()
+def render_entries(
+    entries,
+    fmt="tex",
+    template_path="cleva_template.tex",
+    renderer="tikz",
+    cache=None,
+    layered=False,
+    optimize=False,
+    width=None,
+    fragments=None,
+):
+    """
+    Render the compass for the given entries into fmt (one of FORMATS) and return bytes. With
+    layered, SVG and PNG outputs are composited from a cached background and a per-request overlay.
+    With optimize, the TikZ code is emitted by the optimizing emitters. PNG outputs are resized to
+    width pixels if given. fragments is an optional FragmentCache, see fill_template. Raises
+    ValueError if the renderer cannot produce fmt, see check_renderer.
+    """
+    check_renderer(fmt, renderer)
+    with tracing.span("render_entries", fmt=fmt, entries=len(entries), renderer=renderer) as span:
+        data = _render_entries(
+            entries, fmt, template_path, renderer, cache, layered, optimize, width, fragments
+        )
+        span.set(bytes_out=len(data))
+        return data
+
+
+def check_renderer(fmt, renderer):
+    """Raise ValueError unless renderer (one of RENDERERS) can produce the format fmt."""
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer '{renderer}', must be one of {list(RENDERERS)}")
+    if fmt not in RENDERERS[renderer]:
+        raise ValueError(
+            f"The {renderer} renderer cannot produce {fmt}, only {', '.join(RENDERERS[renderer])}"
+        )
+
+
+def _render_entries(
+    entries, fmt, template_path, renderer, cache, layered, optimize, width, fragments
+):
+    if fmt == "svg" and renderer == "native":
+        from svg_compass import render_svg
+
+        return render_svg(entries).encode("utf-8")
+
+    if layered and fmt in ["svg", "png"]:
+        import layered as layers
+
+        if fmt == "svg":
+            return layers.render_layered_svg(template_path, entries, cache, optimize).encode(
+                "utf-8"
+            )
+        return encode_png(layers.render_layered_png(template_path, entries, cache, optimize), width)
+
+    tex = fill_template(template_path, entries, optimize, fragments)
+    return render_tex(tex, fmt, cache, width)
+
+
+def render_tex(tex, fmt="tex", cache=None, width=None):
+    """Render a filled template into fmt (one of FORMATS) and return bytes."""
+    if fmt == "tex":
+        return tex.encode("utf-8")
+
+    import tikz2svg
+
+    if fmt == "svg":
+        return tikz2svg.tikz2svg(tex, cache=cache).encode("utf-8")
+    elif fmt == "pdf":
+        return tikz2svg.tikz2pdf(tex, cache=cache)
+    elif fmt == "png":
+        return encode_png(tikz2svg.tikz2img(tex, cache=cache, width=width), width)
+    raise ValueError(f"Unknown format '{fmt}', must be one of {FORMATS}")
+
+
+def encode_png(image, width=None):
+    """Post-process a rendered image (see image_utils) and encode it as PNG."""
+    from image_utils import postprocess
+
+    buf = io.BytesIO()
+    postprocess(image, width=width).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def find_data_files(patterns):
+    """Expand data files, directories (all *.json files) and glob patterns into a sorted list."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "*.json"))
+        else:
+            matches = glob.glob(pattern) or [pattern]
+        for path in sorted(matches):
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def batch_key(data_path, template_path, fmt, renderer, optimize=False, width=None):
+    """Hash of everything a batch output depends on, used to skip unchanged inputs."""
+    h = hashlib.sha256()
+    h.update(f"{fmt}\0{renderer}\0{optimize}\0{width}\0".encode("utf-8"))
+    for path in [data_path, template_path]:
+        with open(path, "rb") as f:
+            h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _init_batch_worker():
+    # Make pdflatex produce reproducible PDFs (no timestamps), so that outputs are deterministic
+    os.environ["SOURCE_DATE_EPOCH"] = "0"
+    os.environ["FORCE_SOURCE_DATE"] = "1"
+
+
+def render_batch_file(
+    data_path,
+    output_dir,
+    formats,
+    template_path,
+    renderer,
+    layered=False,
+    optimize=False,
+    width=None,
+    name=None,
+):
+    """
+    Render one data file into all formats. The outputs are written to <output_dir>/<name>.<fmt>,
+    name defaults to the file name of data_path without extension. Returns (outputs, seconds,
+    error).
+    """
+    t0 = time.perf_counter()
+    outputs = []
+    if name is None:
+        name = os.path.splitext(os.path.basename(data_path))[0]
+    try:
+        entries = list(iter_json_entries(data_path))
+        os.makedirs(os.path.dirname(os.path.join(output_dir, name)), exist_ok=True)
+        for fmt in formats:
+            data = render_entries(
+                entries,
+                fmt,
+                template_path,
+                renderer,
+                layered=layered,
+                optimize=optimize,
+                width=width,
+            )
+            output_path = os.path.join(output_dir, name + "." + fmt)
+            with open(output_path, "wb") as f:
+                f.write(data)
+            outputs.append(output_path)
+    except Exception as e:
+        return outputs, time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+    return outputs, time.perf_counter() - t0, None
+
+
+def batch_output_names(data_files):
+    """
+    Output names (see render_batch_file) of the data files: their paths relative to the common
+    directory of all data files, without extension. Data files with the same name in different
+    directories are thus rendered into the same subdirectories of the output directory. Raises
+    ValueError if data files would still be rendered into the same outputs.
+    """
+    paths = [os.path.abspath(data_path) for data_path in data_files]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    names = {}
+    for data_path, path in zip(data_files, paths):
+        name = os.path.splitext(os.path.relpath(path, root))[0]
+        if name in names.values():
+            other = next(p for p, n in names.items() if n == name)
+            raise ValueError(f"{data_path} and {other} would both be rendered into '{name}.*'")
+        names[data_path] = name
+    return names
+
+
+def render_batch(
+    data_files,
+    output_dir,
+    formats,
+    template_path,
+    renderer="tikz",
+    jobs=None,
+    force=False,
+    layered=False,
+    optimize=False,
+    width=None,
+):
+    """
+    Render all data files into output_dir using a pool of worker processes. Data files whose content
+    (and template, format, renderer) did not change since the last run are skipped. Outputs are
+    named by batch_output_names, which raises ValueError for colliding data files. Returns a list
+    of (data_path, status, seconds, error) with status in ['rendered', 'skipped', 'failed'].
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    names = batch_output_names(data_files)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    results = []
+    todo = []
+    for data_path in data_files:
+        keys = {
+            fmt: batch_key(data_path, template_path, fmt, renderer, optimize, width)
+            for fmt in formats
+        }
+        previous = manifest.get(data_path, {})
+        unchanged = all(
+            previous.get(fmt, {}).get("key") == key
+            and os.path.exists(previous[fmt]["output"])
+            for fmt, key in keys.items()
+        )
+        if unchanged and not force:
+            results.append((data_path, "skipped", 0.0, None))
+        else:
+            todo.append((data_path, keys))
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker) as pool:
+        futures = [
+            pool.submit(
+                render_batch_file,
+                data_path,
+                output_dir,
+                formats,
+                template_path,
+                renderer,
+                layered,
+                optimize,
+                width,
+                names[data_path],
+            )
+            for data_path, _ in todo
+        ]
+        for (data_path, keys), future in zip(todo, futures):
+            outputs, seconds, error = future.result()
+            if error is None:
+                manifest[data_path] = {
+                    fmt: {"key": keys[fmt], "output": output}
+                    for fmt, output in zip(formats, outputs)
+                }
+                results.append((data_path, "rendered", seconds, None))
+            else:
+                manifest.pop(data_path, None)
+                results.append((data_path, "failed", seconds, error))
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return results
+
+
+def print_batch_summary(results, seconds):
+    """Print per-file timings and failures of a batch run."""
+    for data_path, status, file_seconds, error in results:
+        if status == "failed":
+            print(f"✘ {data_path}: {error}")
+        elif status == "skipped":
+            print(f"- {data_path} (unchanged)")
+        else:
+            print(f"✔ {data_path} ({file_seconds:.2f} s)")
+    counts = {s: sum(1 for r in results if r[1] == s) for s in ["rendered", "skipped", "failed"]}
+    print(
+        f"Rendered {counts['rendered']}, skipped {counts['skipped']}, failed {counts['failed']} "
+        f"data files in {seconds:.2f} s"
+    )
+
+
+def main(args):
+    """Run the script, returns the exit code."""
+    data_files = find_data_files(args.data)
+    if not data_files:
+        print(f"✘ No data files found in {' '.join(args.data)}")
+        return 1
+    formats = args.format
+    if formats is None and args.output is not None:
+        extension = os.path.splitext(args.output)[1][1:]
+        formats = [extension] if extension in FORMATS else None
+    if formats is None:
+        formats = ["svg"] if args.renderer == "native" else ["tex"]
+    try:
+        for fmt in formats:
+            check_renderer(fmt, args.renderer)
+    except ValueError as e:
+        print(f"✘ {e}")
+        return 1
+
+    if args.output_dir is not None or len(data_files) > 1:
+        # Batch mode
+        t0 = time.perf_counter()
+        try:
+            results = render_batch(
+                data_files,
+                args.output_dir or ".",
+                formats,
+                args.template,
+                args.renderer,
+                jobs=args.jobs,
+                force=args.force,
+                layered=args.layered,
+                optimize=args.optimize,
+                width=args.width,
+            )
+        except ValueError as e:
+            print(f"✘ {e}")
+            return 1
+        print_batch_summary(results, time.perf_counter() - t0)
+        return 1 if any(r[1] == "failed" for r in results) else 0
+
+    if len(formats) > 1:
+        print("✘ Multiple formats can only be rendered in batch mode, see --output-dir")
+        return 1
+    fmt = formats[0]
+    output = args.output or "cleva_filled." + fmt
+    extension = os.path.splitext(output)[1][1:]
+    if extension in FORMATS and extension != fmt:
+        print(f"✘ Cannot write the {fmt} format into {output}")
+        return 1
 
     # Read the compass entry from the given json data file
-    entries_json = json.load(open(args.data))["entries"]
-    entries = read_json_entries(entries_json)
+    try:
+        with tracing.span("read_entries") as span:
+            entries = list(iter_json_entries(data_files[0]))
+            span.set(entries=len(entries))
+    except ValueError as e:
+        print(f"✘ Invalid data file {data_files[0]}: {e}")
+        return 1
     # entries = generate_random_entries()
 
-    # Read template content
-    output = fill_template(args.template, entries)
-
     # Write output to the desired destination
-    with open(args.output, "w") as f:
-        f.write(output)
+    with tracing.span("write", entries=len(entries), fmt=fmt) as span:
+        if fmt == "tex":
+            # Fill the template and stream it into the output file
+            fill = tracing.span("fill_template", entries=len(entries), optimize=args.optimize)
+            with fill, open(output, "w") as f:
+                CompiledTemplate.load(args.template, args.optimize).write(f, entries)
+                fill.set(bytes_out=f.tell())
+        else:
+            data = render_entries(
+                entries,
+                fmt,
+                args.template,
+                args.renderer,
+                layered=args.layered,
+                optimize=args.optimize,
+                width=args.width,
+            )
+            with open(output, "wb") as f:
+                f.write(data)
+        span.set(renderer=args.renderer, bytes_out=os.path.getsize(output))
+    return 0
+
+
+def profile_main(args):
+    """Run main(args) with tracing and cProfile, see --profile."""
+    import cProfile
+
+    trace_path, profile_path = args.profile + ".jsonl", args.profile + ".prof"
+    if os.path.exists(trace_path):
+        os.remove(trace_path)
+    # Worker processes of batch mode trace into the same file
+    os.environ["CLEVA_TRACE"] = trace_path
+    sink = tracing.JsonLinesSink(trace_path)
+    tracing.add_sink(sink)
+    profiler = cProfile.Profile()
+    try:
+        code = profiler.runcall(main, args)
+    finally:
+        tracing.remove_sink(sink)
+        sink.close()
+        profiler.dump_stats(profile_path)
+    print()
+    tracing.print_summary(tracing.read_json_lines(trace_path))
+    print(f"\nSaved the trace to {trace_path} and the cProfile dump to {profile_path}")
+    return code
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    exit(profile_main(args) if args.profile is not None else main(args))
@@ -0,0 +1,277 @@
+"""
+Streaming loader for JSON entry files.
+
+The "entries" array is parsed incrementally, one entry at a time, so files of any size can be read
+without holding the whole document in memory. Entries are converted by a decoder which is generated
+once from the dataclass definitions in levels.py. Only entries which fail this fast path are
+validated field by field, and all errors are collected with their entry index and field path.
+"""
+import json
+import os
+import re
+from dataclasses import dataclass, fields, is_dataclass
+
+from levels import CompassEntry, LATEX_COLORS
+
+CHUNK_SIZE = 1 << 20  # Characters read at once
+MAX_REPORTED = 20  # Errors listed in the message of EntryValidationError
+
+# Validity check (inlined by compile_decoder) and description of the allowed values per field type.
+# int fields are inner levels.
+_CHECKS = {
+    str: ("type({v}) is str", "a string"),
+    int: ("type({v}) is int and 0 <= {v} <= 2", "0, 1 or 2"),
+    bool: ("type({v}) is bool", "true or false"),
+}
+# The same checks as functions, used by validate
+_VALID = {
+    str: lambda v: type(v) is str,
+    int: lambda v: type(v) is int and 0 <= v <= 2,
+    bool: lambda v: type(v) is bool,
+}
+# Checks of single fields in addition to the check of their type, with {v} as in _CHECKS
+_FIELD_CHECKS = {
+    (CompassEntry, "color"): ("{v} in LATEX_COLORS", f"one of {', '.join(LATEX_COLORS)}"),
+}
+_FIELD_VALID = {
+    (CompassEntry, "color"): lambda v: v in LATEX_COLORS,
+}
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+@dataclass
+class FieldError:
+    """Invalid or missing field of an entry."""
+
+    source: str  # File name, or None
+    index: int  # Index in the entries array
+    path: str  # Field path, e.g. inner_level.federated
+    message: str
+
+    def __str__(self):
+        location = f"entries[{self.index}]" + (f".{self.path}" if self.path else "")
+        return (f"{self.source}: " if self.source else "") + f"{location}: {self.message}"
+
+
+class EntryValidationError(ValueError):
+    """Raised for invalid entries. errors holds a FieldError for every invalid field."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        lines = [str(e) for e in errors[:MAX_REPORTED]]
+        if len(errors) > MAX_REPORTED:
+            lines.append(f"... and {len(errors) - MAX_REPORTED} more")
+        super().__init__(f"{len(errors)} invalid field(s):\n  " + "\n  ".join(lines))
+
+
+def compile_decoder(cls=CompassEntry):
+    """
+    Generate decode(d), which converts a dict into cls, from the fields of cls and its nested
+    dataclasses. decode raises on missing fields or invalid values, without telling which.
+    """
+    lines, checks, namespace = [], [], {"LATEX_COLORS": LATEX_COLORS}
+
+    def build(cls, var):
+        name = f"C{len(namespace)}"
+        namespace[name] = cls
+        args = []
+        for f in fields(cls):
+            value = f"v{len(lines)}"
+            lines.append(f"    {value} = {var}[{f.name!r}]")
+            if is_dataclass(f.type):
+                args.append(build(f.type, value))
+            else:
+                checks.append(_CHECKS[f.type][0].format(v=value))
+                if (cls, f.name) in _FIELD_CHECKS:
+                    checks.append(_FIELD_CHECKS[cls, f.name][0].format(v=value))
+                args.append(value)
+        return f"{name}({', '.join(args)})"
+
+    expression = build(cls, "d")
+    lines.append(f"    if not ({' and '.join(checks)}):\n        raise ValueError")
+    source = "\n".join(["def decode(d):"] + lines + [f"    return {expression}"])
+    exec(source, namespace)
+    return namespace["decode"]
+
+
+def validate(d, cls=CompassEntry, path=""):
+    """
+    Convert d into cls field by field. Returns the value (None if invalid) and all errors as
+    (field path, message) tuples.
+    """
+    if not isinstance(d, dict):
+        return None, [(path, f"expected an object, got {type(d).__name__}")]
+    args, errors = [], []
+    for f in fields(cls):
+        field_path = f"{path}.{f.name}" if path else f.name
+        if f.name not in d:
+            errors.append((field_path, "missing"))
+            continue
+        value = d[f.name]
+        if is_dataclass(f.type):
+            value, field_errors = validate(value, f.type, field_path)
+            errors += field_errors
+        elif f.type is bool and type(value) is int and value in (0, 1):
+            value = bool(value)  # E.g. from Tk IntVars
+        elif not _VALID[f.type](value):
+            errors.append((field_path, f"expected {_CHECKS[f.type][1]}, got {json.dumps(value)}"))
+        elif (cls, f.name) in _FIELD_VALID and not _FIELD_VALID[cls, f.name](value):
+            description = _FIELD_CHECKS[cls, f.name][1]
+            errors.append((field_path, f"expected {description}, got {json.dumps(value)}"))
+        args.append(value)
+    return (None if errors else cls(*args)), errors
+
+
+_decode = compile_decoder()
+
+
+def _decode_entries(dicts, source=None, errors=None):
+    """Yield the decoded entries. Errors are appended to errors and their entries skipped."""
+    for index, d in enumerate(dicts):
+        try:
+            yield _decode(d)
+        except Exception:
+            entry, entry_errors = validate(d)
+            if entry_errors:
+                errors.extend(FieldError(source, index, p, m) for p, m in entry_errors)
+            else:
+                yield entry
+
+
+def decode_entries(dicts, source=None):
+    """Decode a list of entry dicts. Raises EntryValidationError listing all invalid fields."""
+    errors = []
+    entries = list(_decode_entries(dicts, source, errors))
+    if errors:
+        raise EntryValidationError(errors)
+    return entries
+
+
+class _Reader(object):
+    """Incremental reader of JSON values from a text file."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, empty at the end of the file."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(f"Expecting one of '{chars}'", self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A value at the end of the buffer, e.g. a number, may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def _stream_entries(f, chunk_size):
+    """Yield the items of the top-level "entries" array as dicts."""
+    reader = _Reader(f, chunk_size)
+    reader.expect("{")
+    if reader.peek() != "}":
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key == "entries":
+                reader.expect("[")
+                if reader.peek() == "]":
+                    return
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        return
+            reader.value()
+            if reader.expect(",}") == "}":
+                break
+    raise ValueError("No 'entries' array found")
+
+
+def iter_json_entries(file, errors=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield the entries of a JSON file (path or text file object) one by one. If errors is a list,
+    invalid entries are skipped and their FieldErrors appended to it. Otherwise, the errors are
+    collected and raised as EntryValidationError after the last entry.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, encoding="utf-8") as f:
+            yield from iter_json_entries(f, errors, chunk_size)
+        return
+
+    source = getattr(file, "name", None)
+    collected = [] if errors is None else errors
+    yield from _decode_entries(_stream_entries(file, chunk_size), source, collected)
+    if errors is None and collected:
+        raise EntryValidationError(collected)
+
+
+def entry_to_json(entry):
+    """Convert an entry to a dictionary object."""
+    json_dict = {}
+    json_dict["color"] = entry.color
+    json_dict["label"] = entry.label
+    json_dict["inner_level"] = vars(entry.inner_level)
+    json_dict["outer_level"] = vars(entry.outer_level)
+    return json_dict
+
+
+def _load_file(path):
+    errors = []
+    return list(iter_json_entries(path, errors)), errors
+
+
+def load_entry_files(paths, workers=None, mp_context=None):
+    """
+    Load the entries of multiple files, in order. With several files and workers != 1, the files
+    are decoded in parallel processes, started with the multiprocessing context mp_context if
+    given. Raises EntryValidationError with the errors of all files.
+    """
+    if workers == 1 or len(paths) < 2:
+        results = map(_load_file, paths)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        n_workers = min(workers or os.cpu_count(), len(paths))
+        with ProcessPoolExecutor(n_workers, mp_context=mp_context) as pool:
+            results = list(pool.map(_load_file, paths))
+
+    entries, errors = [], []
+    for file_entries, file_errors in results:
+        entries += file_entries
+        errors += file_errors
+    if errors:
+        raise EntryValidationError(errors)
+    return entries
@@ -0,0 +1,182 @@
+"""
+Ordered collection of compass entries with stable IDs, as edited in the GUI.
+
+Every entry gets an integer ID when it is added, which stays valid while other entries are added,
+updated or removed, so that views (e.g. the entry list of the GUI) refer to entries by ID instead
+of by position. Entries are indexed by label, and filter() selects entries with a query as typed
+into a search field:
+
+    store = EntryStore(entries)
+    store.filter("ewc")  # Labels containing 'ewc' (case-insensitive)
+    store.filter("replay federated=1 forgetting=1")  # ... and with these attributes
+
+Conditions <attribute>=<value> take the values of method_index.py. A query which extends a recent
+one, e.g. while typing, only searches the entries matched by that query.
+"""
+import itertools
+
+from levels import CompassEntry
+
+FILTER_HISTORY = 32  # Number of recent filter() results searched for a query to refine
+
+
+def _refines(query, previous):
+    """Whether every entry matching query also matches the previous query."""
+    if not query.startswith(previous):
+        return False
+    terms = previous.split()
+    if not terms or previous[-1].isspace() or query[len(previous) :][:1].isspace():
+        return True
+    # The last term was extended: a longer label substring matches fewer entries, but e.g.
+    # 'federated' -> 'federated=1' or 'forgetting=1' -> 'forgetting=1,0' may match others
+    extended = query.split()[len(terms) - 1]
+    return "=" not in extended
+
+
+class EntryStore(object):
+    """Ordered compass entries with stable IDs, an index by label and incremental filtering."""
+
+    def __init__(self, entries=()):
+        self._entries = {}  # ID -> entry, in list order
+        self._labels = {}  # ID -> lowercase label
+        self._by_label = {}  # Label -> IDs (dict used as ordered set)
+        self._ids = None  # Cached list of IDs
+        self._next_id = itertools.count()
+        self._filters = {}  # Query -> IDs of recent filter() calls
+        self._filters_version = 0  # Version of the store the filter results are valid for
+        self.version = 0  # Incremented on every change
+        self.extend(entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __contains__(self, id):
+        return id in self._entries
+
+    def __getitem__(self, id):
+        return self._entries[id]
+
+    def ids(self):
+        """IDs of all entries, in order."""
+        if self._ids is None:
+            self._ids = list(self._entries)
+        return self._ids
+
+    def entries(self):
+        """List of all entries, in order."""
+        return list(self._entries.values())
+
+    def index(self, id):
+        """Position of the entry in the list."""
+        return self.ids().index(id)
+
+    def find(self, label):
+        """IDs of the entries with the given label."""
+        return list(self._by_label.get(label, ()))
+
+    def add(self, entry: CompassEntry):
+        """Append an entry and return its ID."""
+        return self.extend([entry])[0]
+
+    def extend(self, entries):
+        """Append many entries with a single change and return their IDs."""
+        ids = []
+        for entry in entries:
+            id = next(self._next_id)
+            self._entries[id] = entry
+            self._index(id, entry)
+            ids.append(id)
+        if ids:
+            self._changed(reorder=True)
+        return ids
+
+    def update(self, id, entry: CompassEntry):
+        """Replace the entry with the given ID, keeping its position."""
+        self._unindex(id)
+        self._entries[id] = entry
+        self._index(id, entry)
+        self._changed()
+
+    def remove(self, id):
+        """Remove the entry with the given ID and return it."""
+        self._unindex(id)
+        del self._labels[id]
+        entry = self._entries.pop(id)
+        self._changed(reorder=True)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self._labels.clear()
+        self._by_label.clear()
+        self._changed(reorder=True)
+
+    def filter(self, query):
+        """
+        IDs of the entries matching all terms of query, in order: plain terms must be contained in
+        the label (case-insensitive), terms <attribute>=<value>[,<value>...] must match the
+        attribute. Raises ValueError for unknown attributes or values, e.g. of incomplete terms.
+        """
+        query = query.strip()
+        if not query:
+            return list(self.ids())
+        if self._filters_version != self.version:
+            self._filters = {}
+            self._filters_version = self.version
+        candidates = self.ids()
+        for previous, ids in self._filters.items():
+            if len(ids) < len(candidates) and _refines(query, previous):
+                candidates = ids
+
+        words, conditions = [], []
+        for term in query.split():
+            if "=" in term:
+                conditions.append(term)
+            else:
+                words.append(term.lower())
+        if conditions:
+            from method_index import parse_conditions
+
+            conditions = list(parse_conditions(conditions).items())
+
+        labels = self._labels
+        for word in words:
+            candidates = [id for id in candidates if word in labels[id]]
+        if conditions:
+            candidates = [id for id in candidates if self._matches(self._entries[id], conditions)]
+        self._filters.pop(query, None)
+        self._filters[query] = candidates
+        if len(self._filters) > FILTER_HISTORY:
+            del self._filters[next(iter(self._filters))]
+        return candidates
+
+    def _matches(self, entry, conditions):
+        for field, value in conditions:
+            level = getattr(entry.inner_level, field, None)
+            if level is None:
+                level = getattr(entry.outer_level, field)
+            if isinstance(value, list):
+                if level not in value:
+                    return False
+            elif level != value:
+                return False
+        return True
+
+    def _index(self, id, entry):
+        self._labels[id] = entry.label.lower()
+        self._by_label.setdefault(entry.label, {})[id] = None
+
+    def _unindex(self, id):
+        label = self._entries[id].label
+        ids = self._by_label[label]
+        del ids[id]
+        if not ids:
+            del self._by_label[label]
+
+    def _changed(self, reorder=False):
+        self.version += 1
+        if reorder:
+            self._ids = None
@@ -1,12 +1,10 @@
 from tkinter import *
-import re
+from tkinter import font
 import os
-import urllib.request
-import signal
-import argparse
-import json
 import sys
 
+from entry_loader import entry_to_json  # Moved to entry_loader, which does not need tkinter
+
 
 class ToolTip(object):
     def __init__(self, widget):
@@ -60,6 +58,119 @@ def add_tooltip(widget, text, max_length=45):
         widget.bind("<Leave>", leave)
 
 
+class VirtualListbox(Frame):
+    """
+    Listbox for very long lists. Rows are given as a list of keys, of which only the visible rows
+    are materialized in the underlying Listbox: text(key) returns the text of a row and
+    on_select(key) is called when a row is selected. Scrolling replaces the texts of the visible
+    rows, so that setting thousands of keys costs as much as setting a screenful.
+    """
+
+    def __init__(self, master, text, on_select=None, height=10, **kwargs):
+        super().__init__(master)
+        self.text = text
+        self.on_select = on_select
+        self.keys = []
+        self.first = 0  # Index of the first visible row
+        self.rows = height  # Number of visible rows
+        self.selected = None  # Key of the selected row
+        self.listbox = Listbox(
+            self, height=height, exportselection=False, activestyle="none", **kwargs
+        )
+        self.scrollbar = Scrollbar(self, orient=VERTICAL, command=self._on_scrollbar)
+        self.listbox.grid(row=0, column=0, sticky=N + S + E + W)
+        self.scrollbar.grid(row=0, column=1, sticky=N + S)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.listbox.bind("<<ListboxSelect>>", self._on_listbox_select)
+        self.listbox.bind("<Configure>", self._on_configure)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(3))
+        self.listbox.bind("<Up>", lambda e: self._move(-1))
+        self.listbox.bind("<Down>", lambda e: self._move(1))
+        self.listbox.bind("<Prior>", lambda e: self._move(-self.rows))
+        self.listbox.bind("<Next>", lambda e: self._move(self.rows))
+
+    def set_keys(self, keys):
+        """Show the rows of keys, keeping the selection if it is among them."""
+        self.keys = keys
+        self.first = max(0, min(self.first, len(keys) - self.rows))
+        self.refresh()
+
+    def refresh(self):
+        """Materialize the visible rows, e.g. after their texts changed."""
+        visible = self.keys[self.first : self.first + self.rows]
+        self.listbox.delete(0, END)
+        if visible:
+            self.listbox.insert(0, *(self.text(key) for key in visible))
+        if self.selected in visible:
+            self.listbox.selection_set(visible.index(self.selected))
+        n = len(self.keys)
+        if n > self.rows:
+            self.scrollbar.set(self.first / n, (self.first + self.rows) / n)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        """Scroll by the given number of rows."""
+        first = max(0, min(self.first + rows, len(self.keys) - self.rows))
+        if first != self.first:
+            self.first = first
+            self.refresh()
+        return "break"
+
+    def see(self, key):
+        """Scroll the row of key into view."""
+        i = self.keys.index(key)
+        if i < self.first:
+            self.scroll(i - self.first)
+        elif i >= self.first + self.rows:
+            self.scroll(i - self.first - self.rows + 1)
+
+    def select(self, key):
+        """Select the row of key (None to clear the selection) without calling on_select."""
+        self.selected = key
+        if key is not None and key in self.keys:
+            self.see(key)
+        self.refresh()
+
+    def _on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.keys[self.first + selection[0]]
+            if self.on_select is not None:
+                self.on_select(self.selected)
+
+    def _move(self, rows):
+        if not self.keys:
+            return "break"
+        i = self.keys.index(self.selected) + rows if self.selected in self.keys else 0
+        self.select(self.keys[max(0, min(i, len(self.keys) - 1))])
+        if self.on_select is not None:
+            self.on_select(self.selected)
+        return "break"
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll(round(float(amount) * len(self.keys)) - self.first)
+        elif unit == "pages":
+            self.scroll(int(amount) * self.rows)
+        else:
+            self.scroll(int(amount))
+
+    def _on_configure(self, event):
+        # Number of rows fitting into the listbox, with the line height computed as by Tk
+        linespace = font.Font(font=self.listbox.cget("font")).metrics("linespace")
+        pitch = linespace + 1 + 2 * int(self.listbox.cget("selectborderwidth"))
+        inset = int(self.listbox.cget("borderwidth")) + int(self.listbox.cget("highlightthickness"))
+        rows = max(1, (event.height - 2 * inset) // pitch)
+        if rows != self.rows:
+            self.rows = rows
+            self.set_keys(self.keys)
+
+
 def cut_text(text, max_length):
     """Cut a string at about 'max_length' chars into multiple lines."""
     words = text.split(" ")
@@ -81,144 +192,24 @@ def cut_text(text, max_length):
     return new_text
 
 
-def entry_to_json(entry):
-    """Convert an entry to a dictionary object."""
-    json_dict = {}
-    json_dict["color"] = entry.color
-    json_dict["label"] = entry.label
-    json_dict["inner_level"] = vars(entry.inner_level)
-    json_dict["outer_level"] = vars(entry.outer_level)
-    return json_dict
-
 def scale_image_to_width(image, width):
-    from PIL import Image
-    old_width, old_height = image.size
-    scale = width / old_width
-    image_height = int(old_height * scale)
-    image = image.resize(size=(width, image_height), resample=Image.ANTIALIAS)
-    return image
-
-
-def create_url(url):
-    """
-    From the given url, produce a URL that is compatible with Github's REST API. Can handle blob or tree paths.
-    """
-    repo_only_url = re.compile(r"https:\/\/github\.com\/[a-z\d](?:[a-z\d]|-(?=[a-z\d])){0,38}\/[a-zA-Z0-9]+$")
-    re_branch = re.compile("/(tree|blob)/(.+?)/")
-
-    # Check if the given url is a url to a GitHub repo. If it is, tell the
-    # user to use 'git clone' to download it
-    if re.match(repo_only_url,url):
-        print("✘ The given url is a complete repository. Use 'git clone' to download the repository")
-        sys.exit()
-
-    # extract the branch name from the given url (e.g master)
-    branch = re_branch.search(url)
-    download_dirs = url[branch.end():]
-    api_url = (url[:branch.start()].replace("github.com", "api.github.com/repos", 1) +
-              "/contents/" + download_dirs + "?ref=" + branch.group(2))
-    return api_url, download_dirs
+    from image_utils import resize_to_width
+    return resize_to_width(image, width)
 
 
 def download_methods(repo_url, flatten=False, output_dir="methods"):
     """ Downloads the files and directories in repo_url. If flatten is specified, the contents of any and all
-     sub-directories will be pulled upwards into the root folder. """
-
-    # generate the url which returns the JSON data
-    api_url, download_dirs = create_url(repo_url)
-
-    # To handle file names.
-    if not flatten:
-        if len(download_dirs.split(".")) == 0:
-            dir_out = os.path.join(output_dir, download_dirs)
-        else:
-            dir_out = os.path.join(output_dir, "/".join(download_dirs.split("/")[:-1]))
-    else:
-        dir_out = output_dir
+     sub-directories will be pulled upwards into the root folder. Returns the methods that existed before
+     and the newly downloaded ones. """
+    from method_sync import MethodSync
 
+    os.makedirs(output_dir, exist_ok=True)
+    existing_methods = [name for name in os.listdir(output_dir) if not name.startswith(".")]
     try:
-        opener = urllib.request.build_opener()
-        opener.addheaders = [('User-agent', 'Mozilla/5.0')]
-        urllib.request.install_opener(opener)
-        response = urllib.request.urlretrieve(api_url)
+        result = MethodSync(repo_url, output_dir=output_dir, flatten=flatten).sync()
     except KeyboardInterrupt:
-        # when CTRL+C is pressed during the execution of this script,
-        # bring the cursor to the beginning, erase the current line, and dont make a new line
         print("✘ Got interrupted")
         sys.exit()
-
-    if not flatten:
-        # make a directory with the name which is taken from
-        # the actual repo
-        os.makedirs(dir_out, exist_ok=True)
-
-    # total files count
-    total_files = 0
-    existing_methods = os.listdir(output_dir)
-    new_methods = []
-    with open(response[0], "r") as f:
-        data = json.load(f)
-        # getting the total number of files so that we
-        # can use it for the output information later
-        total_files += len(data)
-
-        # If the data is a file, download it as one.
-        if isinstance(data, dict) and data["type"] == "file":
-            try:
-                # download the file
-                opener = urllib.request.build_opener()
-                opener.addheaders = [('User-agent', 'Mozilla/5.0')]
-                urllib.request.install_opener(opener)
-                urllib.request.urlretrieve(data["download_url"], os.path.join(dir_out, data["name"]))
-                # bring the cursor to the beginning, erase the current line, and dont make a new line
-                print("Downloaded: {}".format(data["name"]))
-
-                return total_files
-            except KeyboardInterrupt:
-                # when CTRL+C is pressed during the execution of this script,
-                # bring the cursor to the beginning, erase the current line, and dont make a new line
-                print("✘ Got interrupted")
-                sys.exit()
-
-        for file in data:
-            file_name = file["name"]
-            if file_name in existing_methods:
-                print(f"Found already existing {file_name}, not retrieving it")
-                continue
-
-            file_url = file["download_url"]
-            if flatten:
-                path = os.path.basename(file["path"])
-            else:
-                path = file["path"]
-            dirname = os.path.dirname(path)
-
-            if dirname != '':
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-            else:
-                pass
-
-            if file_url is not None:
-                try:
-                    opener = urllib.request.build_opener()
-                    opener.addheaders = [('User-agent', 'Mozilla/5.0')]
-                    urllib.request.install_opener(opener)
-                    # download the file
-                    urllib.request.urlretrieve(file_url, path)
-
-                    # bring the cursor to the beginning, erase the current line, and dont make a new line
-                    print("Downloaded: {}".format(file_name))
-                    new_methods.append(file_name)
-
-                except KeyboardInterrupt:
-                    # when CTRL+C is pressed during the execution of this script,
-                    # bring the cursor to the beginning, erase the current line, and dont make a new line
-                    print("✘ Got interrupted")
-                    sys.exit()
-            else:
-                download(file["html_url"], flatten, dir_out)
-
+    new_methods = [path for path in result.downloaded if os.path.basename(path) not in existing_methods]
     return existing_methods, new_methods
 
-
-# print(download_methods("https://github.com/k4ntz/cleva_methods/tree/master/methods"))
@@ -0,0 +1,70 @@
+"""
+Post-processing of rasterized compasses.
+
+The pipeline works on whole images with PIL's C implementations instead of per-pixel Python loops.
+The background is replaced in place on the smaller of the input and the resized image.
+"""
+from PIL import Image, ImageChops
+
+import tracing
+
+WHITE = (255, 255, 255)
+PREVIEW_BACKGROUND = (250, 250, 250)  # Background color of the GUI preview
+
+
+def _equal_lut(value):
+    return [255 if v == value else 0 for v in range(256)]
+
+
+def background_mask(image, color=WHITE):
+    """Mask (mode 'L') of all pixels of an RGB image which are exactly the given color."""
+    r, g, b = image.split()
+    mask = r.point(_equal_lut(color[0]))
+    mask = ImageChops.multiply(mask, g.point(_equal_lut(color[1])))
+    return ImageChops.multiply(mask, b.point(_equal_lut(color[2])))
+
+
+def replace_background(image, background=PREVIEW_BACKGROUND, color=WHITE):
+    """Replace all pixels of exactly the given color with background, in place."""
+    image.paste(background, mask=background_mask(image, color))
+    return image
+
+
+def resize_to_width(image, width):
+    """Resize an image to the given width, keeping the aspect ratio."""
+    if width is None or width == image.width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    # reducing_gap first shrinks large downscales by an integer factor, which is much cheaper
+    return image.resize((width, height), resample=Image.LANCZOS, reducing_gap=3.0)
+
+
+def postprocess(image, width=None, background=None):
+    """
+    Convert a rendered compass to RGB, resize it to width and replace its white background with
+    the color background. The input image is not modified.
+    """
+    with tracing.span("postprocess", width=width, pixels_in=image.width * image.height):
+        return _postprocess(image, width, background)
+
+
+def _postprocess(image, width, background):
+    result = image.convert("RGB") if image.mode != "RGB" else image
+    if background is not None and width is not None and width > image.width:
+        # Replace the background before enlarging, so that fewer pixels are touched
+        result = replace_background(result.copy() if result is image else result, background)
+        return resize_to_width(result, width)
+
+    result = resize_to_width(result, width)
+    if background is not None:
+        if result is image:
+            result = image.copy()
+        replace_background(result, background)
+    return result
+
+
+def to_photo_image(image):
+    """Hand an image over to Tk. Must be called from the Tk thread."""
+    from PIL import ImageTk
+
+    return ImageTk.PhotoImage(image)
@@ -0,0 +1,139 @@
+"""
+Layered compass rendering.
+
+Most of cleva_template.tex is identical for every compass: the axes, the dimension labels, the grid
+and the evaluation measure labels. The layered mode compiles this static background once per
+template version (through the render cache) and compiles only a small overlay with the inner
+polygons, outer strips and legend for each request. Both layers share the same fixed frame, so they
+can be composited by aligning their top edges and horizontal centers.
+"""
+import re
+
+from create_compass import fill_template_string
+
+# Both layers include this invisible frame, which covers the whole compass. Their bounding boxes
+# therefore agree except for the legend in the overlay, which is centered below the compass.
+FRAME = r"\path (-4.5cm,-4.5cm) rectangle (4.5cm,4.5cm);"
+
+# Coordinates D<x>-<y> of the spiderweb, which are used by the inner level paths
+COORDINATES = (
+    r"\foreach \Y in {0,...,\U}{\foreach \X in {1,...,\D}{\path (\X*\A:\Y*\R/\U) coordinate (D\X-\Y);}}"
+)
+
+BEGIN_PICTURE = re.compile(r"\\begin\{tikzpicture\}(\[[^\]]*\])?")
+LEGEND_DEFINITION = r"\newcommand{\lentry}"
+
+
+def split_template(template):
+    """
+    Split a compass template into the static background and the overlay template. The overlay keeps
+    the placeholders of the entry dependent parts and is filled like the full template.
+    """
+    begin = BEGIN_PICTURE.search(template)
+    legend = template.find(LEGEND_DEFINITION)
+    if begin is None or legend == -1:
+        raise ValueError("Template does not support layered rendering")
+    header = template[: begin.start()]
+    begin_picture = begin.group(0)
+
+    background = fill_template_string(
+        template[: begin.end()] + "\n" + FRAME + template[begin.end() :], []
+    )
+    overlay = "\n".join(
+        [
+            header + begin_picture,
+            FRAME,
+            COORDINATES,
+            "%-$INNER-CIRCLE$",
+            "%-$OUTER-CIRCLE$",
+            template[legend:],
+        ]
+    )
+    return background, overlay
+
+
+_layers = {}
+
+
+def layers(template_path):
+    """Background and overlay template of a template file, cached per template content."""
+    with open(template_path) as f:
+        template = f.read()
+    if template not in _layers:
+        _layers.clear()
+        _layers[template] = split_template(template)
+    return _layers[template]
+
+
+def render_layered_svg(template_path, entries, cache=None, optimize=False):
+    """Render the compass as SVG from the cached background and a per-request overlay."""
+    from tikz2svg import tikz2svg
+    from render_cache import default_cache
+
+    cache = cache or default_cache()
+    background, overlay = layers(template_path)
+    background_svg = tikz2svg(background, cache=cache)
+    overlay_svg = tikz2svg(fill_template_string(overlay, entries, optimize), cache=cache)
+    return merge_svg(background_svg, overlay_svg)
+
+
+def render_layered_png(template_path, entries, cache=None, optimize=False):
+    """Render the compass as image from the cached background and a per-request overlay."""
+    from tikz2svg import tikz2img
+    from render_cache import default_cache
+
+    cache = cache or default_cache()
+    background, overlay = layers(template_path)
+    background_img = tikz2img(background, cache=cache)
+    overlay_tex = fill_template_string(overlay, entries, optimize)
+    overlay_img = tikz2img(overlay_tex, cache=cache, transparent=True)
+    return composite_images(background_img, overlay_img)
+
+
+def composite_images(background, overlay):
+    """Alpha composite the overlay over the background, aligned at the top center."""
+    from PIL import Image
+
+    width = max(background.width, overlay.width)
+    height = max(background.height, overlay.height)
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 255))
+    image.paste(background.convert("RGBA"), ((width - background.width) // 2, 0))
+    image.alpha_composite(overlay.convert("RGBA"), ((width - overlay.width) // 2, 0))
+    return image.convert("RGB")
+
+
+SVG_ROOT = re.compile(r"<svg\b[^>]*>", re.DOTALL)
+SVG_LENGTH = re.compile(r'\b(width|height)="([\d.]+)(pt)?"')
+
+
+def _svg_parts(svg):
+    """Split an SVG document into (width, height, unit, content)."""
+    root = SVG_ROOT.search(svg)
+    size = dict((k, float(v)) for k, v, _ in SVG_LENGTH.findall(root.group(0)))
+    unit = "pt" if 'pt"' in root.group(0) else ""
+    content = svg[root.end() : svg.rindex("</svg>")]
+    return size["width"], size["height"], unit, content
+
+
+def _prefix_ids(content, prefix):
+    """Prefix all ids and references to them, so that two SVGs can be merged into one document."""
+    content = re.sub(r'\bid="([^"]+)"', r'id="%s\1"' % prefix, content)
+    content = re.sub(r'href="#([^"]+)"', r'href="#%s\1"' % prefix, content)
+    return re.sub(r"url\(#([^)]+)\)", r"url(#%s\1)" % prefix, content)
+
+
+def merge_svg(background, overlay):
+    """Merge the overlay SVG over the background SVG, aligned at the top center."""
+    bg_width, bg_height, unit, bg_content = _svg_parts(background)
+    ov_width, ov_height, _, ov_content = _svg_parts(overlay)
+    width, height = max(bg_width, ov_width), max(bg_height, ov_height)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{width}{unit}" height="{height}{unit}" viewBox="0 0 {width} {height}" version="1.1">\n'
+        f'<g id="background" transform="translate({(width - bg_width) / 2},0)">'
+        f"{_prefix_ids(bg_content, 'bg-')}</g>\n"
+        f'<g id="overlay" transform="translate({(width - ov_width) / 2},0)">'
+        f"{_prefix_ids(ov_content, 'ov-')}</g>\n"
+        "</svg>\n"
+    )
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, make_dataclass
+from operator import attrgetter
 
 
 @dataclass
@@ -22,20 +23,16 @@ class InnerLevel:
         Defines the iteration order. This needs to be the same order as defined in the
         cleva_template.tex file.
         """
-        for item in [
-            self.multiple_models,
-            self.federated,
-            self.online,
-            self.open_world,
-            self.multiple_modalities,
-            self.active_data_query,
-            self.task_order_discovery,
-            self.task_agnostic,
-            self.episodic_memory,
-            self.generative,
-            self.uncertainty,
-        ]:
-            yield item
+        return iter(_inner_values(self))
+
+    def pack(self):
+        """Pack the levels (0, 1 or 2) into an integer with one base-3 digit per field."""
+        return pack_inner(self)
+
+    @classmethod
+    def unpack(cls, code):
+        """Inverse of pack."""
+        return cls(*unpack_inner(code))
 
 
 @dataclass
@@ -63,31 +60,151 @@ class OuterLevel:
         Defines the iteration order. This needs to be the same order as defined in the
         cleva_template.tex file.
         """
-        for item in [
-            self.parameters,
-            self.compute_time,
-            self.mac_operations,
-            self.communication,
-            self.forgetting,
-            self.forward_transfer,
-            self.backward_transfer,
-            self.openness,
-            self.data_per_task,
-            self.task_order,
-            self.per_task_metric,
-            self.optimization_steps,
-            self.generated_data,
-            self.stored_data,
-            self.memory,
-        ]:
-            yield item
+        return iter(_outer_values(self))
+
+    def pack(self):
+        """Pack the attributes into an integer with one bit per field."""
+        return pack_outer(self)
+
+    @classmethod
+    def unpack(cls, code):
+        """Inverse of pack."""
+        return cls(*unpack_outer(code))
 
 
 @dataclass
 class CompassEntry:
     """Compass entry containing color, label, and attributes."""
 
-    color: str  # Color, can be one of [magenta, green, blue, orange, cyan, brown]
+    color: str  # Color, one of LATEX_COLORS
     label: str  # Legend label
     inner_level: InnerLevel
     outer_level: OuterLevel
+
+
+# Entry colors and the LaTeX colors they are drawn with
+LATEX_COLORS = {
+    "magenta": "magenta",
+    "green": "green!50!black",
+    "blue": "blue!70!black",
+    "orange": "orange!90!black",
+    "cyan": "cyan!90!black",
+    "brown": "brown!90!black",
+    "lime": "lime",
+    "pink": "pink",
+    "purple": "purple",
+    "teal": "teal",
+    "lightgray": "lightgray",
+}
+
+# Iteration order of the levels, which is the order of the cleva_template.tex file
+INNER_ORDER = (
+    "multiple_models",
+    "federated",
+    "online",
+    "open_world",
+    "multiple_modalities",
+    "active_data_query",
+    "task_order_discovery",
+    "task_agnostic",
+    "episodic_memory",
+    "generative",
+    "uncertainty",
+)
+OUTER_ORDER = (
+    "parameters",
+    "compute_time",
+    "mac_operations",
+    "communication",
+    "forgetting",
+    "forward_transfer",
+    "backward_transfer",
+    "openness",
+    "data_per_task",
+    "task_order",
+    "per_task_metric",
+    "optimization_steps",
+    "generated_data",
+    "stored_data",
+    "memory",
+)
+_inner_values = attrgetter(*INNER_ORDER)
+_outer_values = attrgetter(*OUTER_ORDER)
+
+# The packed representation uses the definition order of the fields
+INNER_FIELDS = tuple(f.name for f in fields(InnerLevel))
+OUTER_FIELDS = tuple(f.name for f in fields(OuterLevel))
+INNER_CODES = 3 ** len(INNER_FIELDS)  # Number of distinct packed inner levels
+OUTER_CODES = 2 ** len(OUTER_FIELDS)  # Number of distinct packed outer levels
+_inner_fields = attrgetter(*INNER_FIELDS)
+_outer_fields = attrgetter(*OUTER_FIELDS)
+
+
+def pack_inner(level):
+    """Pack an inner level into an integer, the i-th field is the i-th base-3 digit."""
+    code = 0
+    for value in reversed(_inner_fields(level)):
+        if value not in (0, 1, 2):
+            raise ValueError(f"Invalid inner level value {value!r}")
+        code = code * 3 + value
+    return code
+
+
+def unpack_inner(code):
+    """Field values of a packed inner level in definition order."""
+    values = []
+    for _ in INNER_FIELDS:
+        code, value = divmod(code, 3)
+        values.append(value)
+    return values
+
+
+def pack_outer(level):
+    """Pack an outer level into an integer, the i-th field is the i-th bit."""
+    code = 0
+    for value in reversed(_outer_fields(level)):
+        code = code << 1 | bool(value)
+    return code
+
+
+def unpack_outer(code):
+    """Field values of a packed outer level in definition order."""
+    return [bool(code >> i & 1) for i in range(len(OUTER_FIELDS))]
+
+
+def _slots_variant(cls):
+    """Create a variant of a dataclass with __slots__, i.e. without a per-instance __dict__."""
+    methods = ["__iter__", "pack", "unpack"]
+    namespace = {name: vars(cls)[name] for name in methods if name in vars(cls)}
+    namespace.update(__doc__=cls.__doc__, __module__=cls.__module__)
+    return make_dataclass(
+        cls.__name__ + "Slots",
+        [(f.name, f.type) for f in fields(cls)],
+        namespace=namespace,
+        slots=True,
+    )
+
+
+InnerLevelSlots = _slots_variant(InnerLevel)
+OuterLevelSlots = _slots_variant(OuterLevel)
+CompassEntrySlots = _slots_variant(CompassEntry)
+
+
+def to_slots(entry):
+    """Convert a CompassEntry to a CompassEntrySlots."""
+    return CompassEntrySlots(
+        entry.color,
+        entry.label,
+        InnerLevelSlots(*_inner_fields(entry.inner_level)),
+        OuterLevelSlots(*_outer_fields(entry.outer_level)),
+    )
+
+
+def from_slots(entry):
+    """Convert a CompassEntrySlots to a CompassEntry."""
+    return CompassEntry(
+        entry.color,
+        entry.label,
+        InnerLevel(*_inner_fields(entry.inner_level)),
+        OuterLevel(*_outer_fields(entry.outer_level)),
+    )
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Persistent SQLite index of the method library.
+
+Every entry of the method files is stored as one row with its label, color and all inner and outer
+level attributes as indexed integer columns. The index is updated incrementally: files whose
+modification time and size did not change are not read again, changed files are re-indexed if
+their content hash differs, and deleted files are dropped.
+
+Example: all methods with supervised federated learning which report forgetting
+
+    $ python method_index.py federated=supervised forgetting=1
+    $ python method_index.py federated=supervised forgetting=1 --output federated.svg
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from dataclasses import fields
+
+from create_compass import FORMATS, read_json_entries, render_entries
+from levels import CompassEntry, InnerLevel, OuterLevel
+
+INNER_FIELDS = [f.name for f in fields(InnerLevel)]
+OUTER_FIELDS = [f.name for f in fields(OuterLevel)]
+INNER_VALUES = {"none": 0, "supervised": 1, "unsupervised": 2}
+OUTER_VALUES = {"0": 0, "false": 0, "no": 0, "1": 1, "true": 1, "yes": 1}
+INDEX_NAME = ".cleva-index.sqlite"
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="Query the CLEVA-Compass method library.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "conditions",
+        nargs="*",
+        help="Attribute conditions as <attribute>=<value>. Inner level values are 0/none, "
+        "1/supervised or 2/unsupervised, outer level values 0 or 1. Multiple values can be "
+        "separated by commas.",
+    )
+    parser.add_argument(
+        "--methods-dir",
+        default="methods",
+        help="Directory of the method library.",
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help=f"Index file (default: {INDEX_NAME} in the methods directory).",
+    )
+    parser.add_argument(
+        "--label",
+        default=None,
+        help="Only methods whose label contains this text (case-insensitive).",
+    )
+    parser.add_argument(
+        "--color",
+        default=None,
+        help="Only methods of this color.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Maximum number of methods.",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Write the matching methods to a file instead of listing them: a .json data file "
+        f"or a rendered compass ({', '.join('.' + f for f in FORMATS)}).",
+    )
+    return parser.parse_args()
+
+
+def _parse_value(field, value):
+    if field in INNER_FIELDS:
+        values = INNER_VALUES
+    else:
+        values, value = OUTER_VALUES, value.lower()
+    if value in values:
+        return values[value]
+    if value.isdigit() and int(value) in values.values():
+        return int(value)
+    raise ValueError(f"Invalid value '{value}' for '{field}', must be one of {list(values)}")
+
+
+def parse_conditions(conditions):
+    """Parse ['federated=supervised', 'forgetting=1', ...] into query keyword arguments."""
+    attributes = {}
+    for condition in conditions:
+        field, _, value = condition.partition("=")
+        field = field.strip().replace("-", "_")
+        if field not in INNER_FIELDS + OUTER_FIELDS:
+            raise ValueError(f"Unknown attribute '{field}'")
+        values = [_parse_value(field, v.strip()) for v in value.split(",")]
+        attributes[field] = values if len(values) > 1 else values[0]
+    return attributes
+
+
+class MethodIndex(object):
+    """SQLite index of all entries of the method files in methods_dir."""
+
+    def __init__(self, methods_dir="methods", index_path=None):
+        self.methods_dir = methods_dir
+        if index_path is None:
+            index_path = os.path.join(methods_dir, INDEX_NAME)
+        self.index_path = index_path
+        self.conn = sqlite3.connect(index_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        columns = ", ".join(f"{f} INTEGER NOT NULL" for f in INNER_FIELDS + OUTER_FIELDS)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files "
+                "(path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha256 TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS methods (path TEXT NOT NULL, position INTEGER NOT "
+                f"NULL, label TEXT NOT NULL, color TEXT NOT NULL, {columns})"
+            )
+            for column in ["path", "label", "color"] + INNER_FIELDS + OUTER_FIELDS:
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS methods_{column} ON methods ({column})"
+                )
+
+    def close(self):
+        self.conn.close()
+
+    def _scan(self):
+        """All method files as {relative path: (mtime_ns, size)}."""
+        files = {}
+        stack = [(self.methods_dir, "")]
+        while stack:
+            directory, prefix = stack.pop()
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir():
+                        stack.append((entry.path, prefix + entry.name + "/"))
+                    elif entry.name.endswith(".json"):
+                        st = entry.stat()
+                        files[prefix + entry.name] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def update(self):
+        """Index new and changed method files and drop deleted ones. Returns (indexed, removed)."""
+        files = self._scan()
+        known = {
+            path: (mtime_ns, size, sha256)
+            for path, mtime_ns, size, sha256 in self.conn.execute("SELECT * FROM files")
+        }
+        placeholders = ", ".join(["?"] * (4 + len(INNER_FIELDS) + len(OUTER_FIELDS)))
+        indexed = 0
+        with self.conn:
+            for path, (mtime_ns, size) in files.items():
+                previous = known.get(path)
+                if previous is not None and previous[:2] == (mtime_ns, size):
+                    continue
+                with open(os.path.join(self.methods_dir, path), "rb") as f:
+                    data = f.read()
+                sha256 = hashlib.sha256(data).hexdigest()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                    (path, mtime_ns, size, sha256),
+                )
+                if previous is not None and previous[2] == sha256:
+                    # Only touched, the content did not change
+                    continue
+
+                self.conn.execute("DELETE FROM methods WHERE path = ?", (path,))
+                try:
+                    entries = read_json_entries(json.loads(data)["entries"])
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"✘ {path}: invalid method file ({type(e).__name__}: {e})")
+                    continue
+                self.conn.executemany(
+                    f"INSERT INTO methods VALUES ({placeholders})",
+                    [_row(path, position, e) for position, e in enumerate(entries)],
+                )
+                indexed += 1
+
+            removed = [path for path in known if path not in files]
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+            self.conn.executemany("DELETE FROM methods WHERE path = ?", [(p,) for p in removed])
+        return indexed, len(removed)
+
+    def _where(self, label=None, color=None, **attributes):
+        clauses, params = [], []
+        if label is not None:
+            clauses.append("label LIKE ? ESCAPE '\\'")
+            label = label.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{label}%")
+        if color is not None:
+            clauses.append("color = ?")
+            params.append(color)
+        for field, value in attributes.items():
+            if field not in INNER_FIELDS + OUTER_FIELDS:
+                raise ValueError(f"Unknown attribute '{field}'")
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(f"{field} IN ({', '.join(['?'] * len(value))})")
+                params += [int(v) for v in value]
+            else:
+                clauses.append(f"{field} = ?")
+                params.append(int(value))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, label=None, color=None, limit=None, **attributes):
+        """
+        Return the matching entries as CompassEntry list. Attributes are given as field=value,
+        or field=[values] to match any of them, e.g. query(federated=1, forgetting=True).
+        """
+        where, params = self._where(label, color, **attributes)
+        sql = (
+            f"SELECT label, color, {', '.join(INNER_FIELDS + OUTER_FIELDS)} FROM methods"
+            f"{where} ORDER BY path, position"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        n_inner = len(INNER_FIELDS)
+        return [
+            CompassEntry(
+                color=row[1],
+                label=row[0],
+                inner_level=InnerLevel(*row[2 : 2 + n_inner]),
+                outer_level=OuterLevel(*(bool(v) for v in row[2 + n_inner :])),
+            )
+            for row in self.conn.execute(sql, params)
+        ]
+
+    def count(self, label=None, color=None, **attributes):
+        """Number of matching entries."""
+        where, params = self._where(label, color, **attributes)
+        return self.conn.execute(f"SELECT COUNT(*) FROM methods{where}", params).fetchone()[0]
+
+
+def _row(path, position, entry):
+    # Columns follow the field definitions, not the template iteration order of the levels
+    return (
+        path,
+        position,
+        entry.label,
+        entry.color,
+        *(int(getattr(entry.inner_level, f)) for f in INNER_FIELDS),
+        *(int(getattr(entry.outer_level, f)) for f in OUTER_FIELDS),
+    )
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    index = MethodIndex(args.methods_dir, args.index)
+    indexed, removed = index.update()
+    if indexed or removed:
+        print(f"Indexed {indexed} changed and removed {removed} deleted method files")
+
+    try:
+        attributes = parse_conditions(args.conditions)
+    except (ValueError, KeyError) as e:
+        print(f"✘ Invalid condition: {e}")
+        exit(1)
+    entries = index.query(label=args.label, color=args.color, limit=args.limit, **attributes)
+
+    if args.output is None:
+        for e in entries:
+            print(f"{e.label} ({e.color})")
+        print(f"{len(entries)} matching methods")
+    elif args.output.endswith(".json"):
+        from entry_loader import entry_to_json
+
+        with open(args.output, "w") as f:
+            json.dump({"entries": [entry_to_json(e) for e in entries]}, f, indent=2)
+        print(f"Saved {len(entries)} methods to {args.output}")
+    else:
+        fmt = os.path.splitext(args.output)[1][1:]
+        with open(args.output, "wb") as f:
+            f.write(render_entries(entries, fmt))
+        print(f"Rendered {len(entries)} methods to {args.output}")
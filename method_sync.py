@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Synchronize the local method library with a directory of a GitHub repository.
+
+Files are listed through the contents API and downloaded concurrently over kept-alive connections.
+A manifest in the output directory records the git blob SHA and ETag of every file, so that
+unchanged files are skipped without a request and changed listings are fetched conditionally
+(If-None-Match). Files are written atomically, the manifest every few seconds and at the end. An
+interrupted sync resumes where it stopped, since downloaded files which are not recorded yet are
+adopted by their SHA. Rate limit responses are retried after the announced reset time, other
+transient errors with exponential backoff. $GITHUB_TOKEN is only sent to the API host, never to
+download hosts or redirect targets.
+
+The API base URL is configurable (--api-base, $CLEVA_API_BASE), e.g. to run against a local server
+which mimics the contents API.
+
+Alternatively, --archive ingests the whole library from a single tar or zip archive (by default the
+repository tarball), which needs one request instead of one per file, and also works offline with a
+local archive file.
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import List
+from urllib.parse import quote, urljoin, urlsplit
+from urllib.request import Request, urlopen
+
+DEFAULT_REPO_URL = "https://github.com/k4ntz/cleva_methods/tree/master/methods"
+DEFAULT_API_BASE = "https://api.github.com"
+MANIFEST = ".cleva-methods.json"
+USER_AGENT = "cleva-compass"
+MANIFEST_SAVE_INTERVAL = 5  # Seconds between manifest writes during a sync
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="Download CLEVA-Compass methods from a GitHub repository.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "repo_url",
+        nargs="?",
+        default=DEFAULT_REPO_URL,
+        help="GitHub URL of the directory (tree/<branch>/<path>) to download.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="methods",
+        help="Directory of the local method library.",
+    )
+    parser.add_argument(
+        "--api-base",
+        default=os.environ.get("CLEVA_API_BASE", DEFAULT_API_BASE),
+        help="Base URL of the contents API.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of concurrent downloads.",
+    )
+    parser.add_argument(
+        "--archive",
+        nargs="?",
+        const="",
+        default=None,
+        help="Replace the library with the methods of a tar/zip archive (local path or URL, "
+        "default: the repository tarball) instead of downloading files one by one.",
+    )
+    parser.add_argument(
+        "--flatten",
+        action="store_true",
+        help="Put files of sub-directories directly into the output directory.",
+    )
+    return parser.parse_args()
+
+
+class SyncError(Exception):
+    """Raised if a request fails permanently."""
+
+
+def parse_repo_url(repo_url):
+    """Split a GitHub tree/blob URL into (owner, repo, branch, path)."""
+    m = re.match(r"https?://[^/]+/([^/]+)/([^/]+)/(?:tree|blob)/([^/]+)/?(.*)$", repo_url)
+    if m is None:
+        raise ValueError(f"Not a URL to a directory or file of a repository: {repo_url}")
+    return m.groups()
+
+
+def contents_api_url(repo_url, api_base=DEFAULT_API_BASE):
+    """Convert a GitHub tree/blob URL into its contents API URL."""
+    owner, repo, branch, path = parse_repo_url(repo_url)
+    return f"{api_base.rstrip('/')}/repos/{owner}/{repo}/contents/{path}?ref={branch}"
+
+
+def tarball_url(repo_url, api_base=DEFAULT_API_BASE):
+    """URL of the tarball of the branch of a GitHub tree/blob URL."""
+    owner, repo, branch, _ = parse_repo_url(repo_url)
+    return f"{api_base.rstrip('/')}/repos/{owner}/{repo}/tarball/{branch}"
+
+
+def auth_headers(url, api_base=None):
+    """Authorization header with $GITHUB_TOKEN if url is on the host of the API, else {}."""
+    if api_base is None:
+        api_base = os.environ.get("CLEVA_API_BASE", DEFAULT_API_BASE)
+    token = os.environ.get("GITHUB_TOKEN")
+    if token and urlsplit(url)[:2] == urlsplit(api_base)[:2]:
+        return {"Authorization": "Bearer " + token}
+    return {}
+
+
+def git_blob_sha(data):
+    """SHA of a file as reported by the contents API (git blob hash)."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+@dataclass
+class SyncResult:
+    """Files of a sync run by outcome (paths relative to the output directory)."""
+
+    downloaded: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+
+
+class MethodSync(object):
+    """Downloads the files of a repository directory into output_dir."""
+
+    def __init__(
+        self,
+        repo_url=DEFAULT_REPO_URL,
+        output_dir="methods",
+        api_base=None,
+        workers=8,
+        flatten=False,
+        max_retries=5,
+        max_wait=120,
+        timeout=30,
+    ):
+        if api_base is None:
+            api_base = os.environ.get("CLEVA_API_BASE", DEFAULT_API_BASE)
+        self.api_base = api_base
+        self.api_url = contents_api_url(repo_url, api_base)
+        self.output_dir = output_dir
+        self.workers = workers
+        self.flatten = flatten
+        self.max_retries = max_retries
+        self.max_wait = max_wait  # Longest wait for a rate limit reset in seconds
+        self.timeout = timeout
+        self.headers = {"User-Agent": USER_AGENT}
+        self.manifest_path = os.path.join(output_dir, MANIFEST)
+        _recover_directory(output_dir)
+        self.manifest = self._load_manifest()
+        self._manifest_lock = threading.Lock()
+        self._manifest_due = 0  # time.monotonic() of the next manifest write
+        self._local = threading.local()
+
+    # HTTP
+
+    def _connection(self, scheme, netloc):
+        """Kept-alive connection of the current thread to netloc."""
+        connections = self._local.__dict__.setdefault("connections", {})
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+        return conn
+
+    def _get(self, url, headers):
+        parts = urlsplit(url)
+        path = quote(parts.path, safe="/%") + ("?" + parts.query if parts.query else "")
+        headers = dict(self.headers, **auth_headers(url, self.api_base), **headers)
+        while True:
+            conn = self._connection(parts.scheme, parts.netloc)
+            reused = conn.sock is not None
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.headers, response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                del self._local.connections[(parts.scheme, parts.netloc)]
+                # The server may have closed an idle kept-alive connection, retry on a new one
+                if not reused:
+                    raise
+
+    def _retry_delay(self, status, headers, attempt):
+        """Seconds to wait before retrying a response, or None if it is final."""
+        if status == 429 or (status == 403 and headers.get("X-RateLimit-Remaining") == "0"):
+            if headers.get("Retry-After"):
+                delay = float(headers["Retry-After"])
+            elif headers.get("X-RateLimit-Reset"):
+                delay = float(headers["X-RateLimit-Reset"]) - time.time()
+            else:
+                delay = 2**attempt
+            return min(max(delay, 1), self.max_wait)
+        if status is None or status >= 500:
+            return min(2**attempt, self.max_wait) * (0.5 + random.random())
+        return None
+
+    def request(self, url, headers=None):
+        """
+        GET url, following redirects and retrying rate limited and transient errors. Returns
+        (status, headers, body).
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, response_headers, body = self._get(url, headers or {})
+            except http.client.InvalidURL as e:
+                raise SyncError(f"GET {url} failed: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                status, response_headers, body, error = None, {}, b"", e
+            else:
+                error = None
+                if status in (301, 302, 303, 307, 308) and response_headers.get("Location"):
+                    url = urljoin(url, response_headers["Location"])
+                    continue
+
+            delay = self._retry_delay(status, response_headers, attempt)
+            if delay is None:
+                return status, response_headers, body
+            if attempt < self.max_retries:
+                print(f"Retrying {url} in {delay:.1f} s ({error or status})")
+                time.sleep(delay)
+        raise SyncError(f"GET {url} failed: {error or status}")
+
+    # Manifest
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.setdefault("listings", {})
+        manifest.setdefault("files", {})
+        return manifest
+
+    def _save_manifest(self):
+        with self._manifest_lock:
+            _write_atomic(self.manifest_path, json.dumps(self.manifest, indent=2, sort_keys=True))
+            self._manifest_due = time.monotonic() + MANIFEST_SAVE_INTERVAL
+
+    # Sync
+
+    def list_files(self, url=None):
+        """List all files below the API url, using the cached listing if it did not change."""
+        url = url or self.api_url
+        cached = self.manifest["listings"].get(url)
+        headers = {"Accept": "application/vnd.github+json"}
+        if cached is not None:
+            headers["If-None-Match"] = cached["etag"]
+        status, response_headers, body = self.request(url, headers)
+        if status == 304:
+            items = cached["items"]
+        elif status == 200:
+            items = json.loads(body)
+            if isinstance(items, dict):
+                items = [items]
+            if response_headers.get("ETag"):
+                self.manifest["listings"][url] = {"etag": response_headers["ETag"], "items": items}
+        else:
+            raise SyncError(f"Listing {url} failed with status {status}")
+
+        files = []
+        for item in items:
+            if item["type"] == "file":
+                files.append(item)
+            elif item["type"] == "dir":
+                files += self.list_files(item["url"])
+        return files
+
+    def local_path(self, item, root):
+        """Path of a listed file relative to the output directory."""
+        if self.flatten:
+            return item["name"]
+        root_path = urlsplit(root).path.split("/contents/", 1)[-1].strip("/")
+        path = item["path"]
+        if path == root_path:
+            return item["name"]
+        prefix = root_path + "/" if root_path else ""
+        return path[len(prefix) :] if path.startswith(prefix) else path
+
+    def fetch(self, item, rel_path):
+        """Download one file unless it is unchanged. Returns True if it was downloaded."""
+        path = os.path.join(self.output_dir, rel_path)
+        known = self.manifest["files"].get(rel_path)
+        if known is not None and known["sha"] == item["sha"] and os.path.exists(path):
+            return False
+        if known is None and os.path.exists(path):
+            # Present from an earlier (manual) download, adopt it if it is identical
+            with open(path, "rb") as f:
+                if git_blob_sha(f.read()) == item["sha"]:
+                    self._record(rel_path, {"sha": item["sha"], "etag": None})
+                    return False
+
+        headers = {}
+        if known is not None and known.get("etag") and os.path.exists(path):
+            headers["If-None-Match"] = known["etag"]
+        status, response_headers, body = self.request(item["download_url"], headers)
+        if status == 304:
+            self._record(rel_path, dict(known, sha=item["sha"]))
+            return False
+        if status != 200:
+            raise SyncError(f"Download of {item['download_url']} failed with status {status}")
+        _write_atomic(path, body)
+        self._record(rel_path, {"sha": item["sha"], "etag": response_headers.get("ETag")})
+        return True
+
+    def _record(self, rel_path, info):
+        with self._manifest_lock:
+            self.manifest["files"][rel_path] = info
+            due = time.monotonic() >= self._manifest_due
+        if due:
+            self._save_manifest()
+
+    def sync(self):
+        """Download all new or changed files. Returns a SyncResult."""
+        files = [
+            (item, self.local_path(item, self.api_url))
+            for item in self.list_files()
+            if item.get("download_url")
+        ]
+        self._save_manifest()
+
+        result = SyncResult()
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {pool.submit(self.fetch, item, rel): rel for item, rel in files}
+            for future in as_completed(futures):
+                rel_path = futures[future]
+                try:
+                    downloaded = future.result()
+                except (SyncError, OSError) as e:
+                    print(f"✘ {rel_path}: {e}")
+                    result.failed.append(rel_path)
+                    continue
+                if downloaded:
+                    print(f"Downloaded: {rel_path}")
+                    result.downloaded.append(rel_path)
+                else:
+                    result.unchanged.append(rel_path)
+        finally:
+            # On interruption, finished files are in the manifest and the next sync resumes
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._save_manifest()
+        return result
+
+
+# Largest method file accepted from an archive
+MAX_MEMBER_SIZE = 1024 * 1024
+
+
+def _member_path(name, subdir):
+    """
+    Path of an archive member relative to subdir, or None if it is not a method below subdir. An
+    empty subdir is the top-level directory of the archive (<repo>-<sha>/ in GitHub tarballs).
+    """
+    parts = name.strip("/").split("/")
+    if not parts[-1].endswith(".json") or ".." in parts:
+        return None
+    sub = [p for p in subdir.split("/") if p]
+    if not sub:
+        return "/".join(parts[1:] if len(parts) > 1 else parts)
+    for i in range(len(parts) - len(sub)):
+        if parts[i : i + len(sub)] == sub:
+            return "/".join(parts[i + len(sub) :])
+    return None
+
+
+def _archive_members(source, api_base=None):
+    """
+    Iterate over (name, read) of the regular files of a tar or zip archive at a local path or URL.
+    Tar archives are read as a stream, so remote archives are never buffered as a whole.
+    """
+    if re.match(r"https?://", source):
+        request = Request(source, headers={"User-Agent": USER_AGENT})
+        for name, value in auth_headers(source, api_base).items():
+            # Not forwarded when the archive is redirected to a download host
+            request.add_unredirected_header(name, value)
+        with urlopen(request, timeout=60) as response:
+            with tarfile.open(fileobj=response, mode="r|*") as tar:
+                for member in tar:
+                    if member.isfile():
+                        yield member.name, member.size, lambda: tar.extractfile(member).read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda: archive.read(info)
+    else:
+        with tarfile.open(source, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, member.size, lambda: tar.extractfile(member).read()
+
+
+def ingest_archive(source, output_dir="methods", subdir="methods", api_base=None):
+    """
+    Replace the method library in output_dir with the *.json files below subdir of a tar or zip
+    archive (local path or URL, $GITHUB_TOKEN is sent if it is on the host of api_base). Each file
+    is validated with read_json_entries and invalid ones are skipped. The new library is extracted
+    next to output_dir and swapped in when complete, so the old library stays untouched if the
+    ingest fails. Returns (ingested, invalid) lists of paths.
+    """
+    from create_compass import read_json_entries
+
+    _recover_directory(output_dir)
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    staging = tempfile.mkdtemp(dir=parent, prefix=".methods-")
+    ingested, invalid = [], []
+    try:
+        for name, size, read in _archive_members(source, api_base):
+            rel_path = _member_path(name, subdir)
+            if rel_path is None:
+                continue
+            if size > MAX_MEMBER_SIZE:
+                print(f"✘ {rel_path}: too large ({size} bytes, at most {MAX_MEMBER_SIZE} bytes)")
+                invalid.append(rel_path)
+                continue
+            data = read()
+            try:
+                read_json_entries(json.loads(data)["entries"])
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"✘ {rel_path}: invalid method file ({type(e).__name__}: {e})")
+                invalid.append(rel_path)
+                continue
+            path = os.path.join(staging, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            ingested.append(rel_path)
+
+        if not ingested:
+            raise SyncError(f"No valid methods below '{subdir}' in {source}")
+        _swap_directory(staging, output_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return ingested, invalid
+
+
+def _backup_path(target):
+    parent, name = os.path.split(os.path.abspath(target))
+    return os.path.join(parent, f".{name}.old")
+
+
+def _swap_directory(new_dir, target):
+    """
+    Replace the directory target with new_dir, restoring target if the swap fails. Directories
+    cannot be exchanged atomically, so target is missing between its two renames. If the process
+    dies there, target is left in its backup, which _recover_directory restores at the next start.
+    """
+    _recover_directory(target)
+    backup = None
+    if os.path.exists(target):
+        backup = _backup_path(target)
+        os.rename(target, backup)
+    try:
+        os.rename(new_dir, target)
+    except OSError:
+        if backup is not None:
+            os.rename(backup, target)
+        raise
+    if backup is not None:
+        shutil.rmtree(backup, ignore_errors=True)
+
+
+def _recover_directory(target):
+    """Restore target from the backup left by an interrupted _swap_directory, if any."""
+    backup = _backup_path(target)
+    if not os.path.exists(backup):
+        return
+    if os.path.exists(target):
+        # The swap completed, only the old directory was not removed
+        shutil.rmtree(backup, ignore_errors=True)
+    else:
+        print(f"Restoring {target} from an interrupted update")
+        os.rename(backup, target)
+
+
+def _write_atomic(path, data):
+    """Write data to path via a temporary file in the same directory and a rename."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    t0 = time.perf_counter()
+    if args.archive is not None:
+        source = args.archive or tarball_url(args.repo_url, args.api_base)
+        subdir = parse_repo_url(args.repo_url)[3]
+        try:
+            ingested, invalid = ingest_archive(
+                source, output_dir=args.output_dir, subdir=subdir, api_base=args.api_base
+            )
+        except (SyncError, OSError, tarfile.TarError) as e:
+            print(f"✘ {e}")
+            exit(1)
+        print(
+            f"Ingested {len(ingested)} methods, skipped {len(invalid)} invalid files "
+            f"in {time.perf_counter() - t0:.2f} s"
+        )
+        exit(0)
+
+    result = MethodSync(
+        args.repo_url,
+        output_dir=args.output_dir,
+        api_base=args.api_base,
+        workers=args.workers,
+        flatten=args.flatten,
+    ).sync()
+    print(
+        f"Downloaded {len(result.downloaded)}, unchanged {len(result.unchanged)}, "
+        f"failed {len(result.failed)} files in {time.perf_counter() - t0:.2f} s"
+    )
+    exit(1 if result.failed else 0)
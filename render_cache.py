@@ -0,0 +1,204 @@
+"""
+Content-addressed on-disk cache for rendered compasses.
+
+Artifacts (SVG/PNG/PDF) are stored under <cache_dir>/<key[:2]>/<key>.<fmt>, where the key is a
+hash of the filled TeX source, the output format and the resolution. Files are written atomically
+so that multiple processes can share one cache directory. The least recently used artifacts are
+evicted once the total size or number of entries exceeds the configured limits. Writes update a
+running estimate of the size of the cache, and the directory is only scanned when the estimate
+crosses a limit or every RESCAN_PUTS writes, to account for artifacts written by other processes.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+import tracing
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cleva-compass")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 4096
+RESCAN_PUTS = 256  # Writes after which the size estimate is synchronized with the directory
+
+
+class RenderCache(object):
+    """Size-bounded LRU cache of render artifacts in a directory."""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        if cache_dir is None:
+            cache_dir = os.environ.get("CLEVA_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None  # Estimated (entries, bytes), None until the first scan
+        self._puts = 0  # Writes since the last scan
+
+    @staticmethod
+    def key(tex, fmt, dpi=None):
+        """Compute the cache key of a filled TeX document rendered to fmt at the given dpi."""
+        h = hashlib.sha256()
+        h.update(fmt.encode("utf-8") + b"\0" + str(dpi).encode("utf-8") + b"\0")
+        h.update(tex.encode("utf-8") if isinstance(tex, str) else tex)
+        return h.hexdigest()
+
+    def path(self, key, fmt):
+        """Location of an artifact in the cache directory."""
+        return os.path.join(self.cache_dir, key[:2], key + "." + fmt)
+
+    def get(self, key, fmt):
+        """Return the cached artifact as bytes, or None on a miss."""
+        path = self.path(key, fmt)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            tracing.count("cache.miss")
+            return None
+
+        # Mark as recently used for the LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        tracing.count("cache.hit")
+        return data
+
+    def put(self, key, fmt, data):
+        """Store an artifact atomically and evict old entries if the cache is over its limits."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        path = self.path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = None
+
+        # Write into a temporary file in the same directory and rename, so that concurrent readers
+        # never observe a partially written artifact
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            self._puts += 1
+            if self._size is not None and self._puts < RESCAN_PUTS:
+                n_entries, total_bytes = self._size
+                if replaced is None:
+                    n_entries += 1
+                total_bytes += len(data) - (replaced or 0)
+                self._size = (n_entries, total_bytes)
+                if total_bytes <= self.max_bytes and n_entries <= self.max_entries:
+                    return
+        self.evict()
+
+    def get_or_render(self, key, fmt, render):
+        """Return the cached artifact or call render() to produce (and store) it."""
+        data = self.get(key, fmt)
+        if data is None:
+            data = render()
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            self.put(key, fmt, data)
+        return data
+
+    def _scan(self):
+        """List all artifacts as (mtime, size, path)."""
+        items = []
+        if not os.path.isdir(self.cache_dir):
+            return items
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            # Only the <key[:2]> shards hold artifacts, other directories (e.g. the LaTeX formats
+            # of tikz2svg.get_format) are never evicted
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Removed concurrently by another process
+                    continue
+                items.append((st.st_mtime, st.st_size, path))
+        return items
+
+    def evict(self):
+        """
+        Scan the cache directory and remove least recently used artifacts until the cache is
+        within its limits.
+        """
+        items = self._scan()
+        total_bytes = sum(size for _, size, _ in items)
+        n_entries = len(items)
+        if total_bytes > self.max_bytes or n_entries > self.max_entries:
+            items.sort()
+            for _, size, path in items:
+                if total_bytes <= self.max_bytes and n_entries <= self.max_entries:
+                    break
+                try:
+                    os.remove(path)
+                    with self._lock:
+                        self.evictions += 1
+                except OSError:
+                    pass
+                total_bytes -= size
+                n_entries -= 1
+        with self._lock:
+            self._size = (n_entries, total_bytes)
+            self._puts = 0
+
+    def clear(self):
+        """Remove all artifacts."""
+        for _, _, path in self._scan():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = (0, 0)
+            self._puts = 0
+
+    def stats(self):
+        """Hit/miss statistics of this process and the current size of the cache."""
+        items = self._scan()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(items),
+                "bytes": sum(size for _, size, _ in items),
+                "cache_dir": self.cache_dir,
+            }
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Shared cache instance in $CLEVA_CACHE_DIR (default: ~/.cache/cleva-compass)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RenderCache()
+    return _default_cache
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Local HTTP service rendering compasses.
+
+POST /render?format=svg with a JSON body in the data file format ({"entries": [...]}) returns the
+rendered compass. Optional query parameters are width (png), renderer ('tikz', or 'native' for
+svg only), optimize and layered (0 or 1). GET /stats returns counters and latency percentiles,
+GET /health returns 200 while the service runs.
+
+Renders run in a bounded pool of worker processes. At most workers + queue_size distinct renders
+are accepted at a time; further requests are rejected with 503 and Retry-After, so that clients
+back off instead of piling up. A failed render only fails its own request(s): 422 if LaTeX
+rejected the compass, 504 if it timed out, 500 otherwise. If a worker process dies, the pool is
+restarted. Concurrent requests for the same compass are coalesced into one
+render, and finished renders are stored in the render cache (see render_cache.py). Nothing is
+fetched over the network.
+
+Example:
+
+    $ python render_server.py --port 8765 &
+    $ curl --data @examples/compass_data_3.json 'localhost:8765/render?format=svg' > compass.svg
+"""
+import argparse
+import collections
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from create_compass import (
+    FORMATS,
+    _init_batch_worker,
+    check_renderer,
+    read_json_entries,
+    render_entries,
+)
+from render_cache import RenderCache, default_cache
+
+CONTENT_TYPES = {
+    "tex": "application/x-tex; charset=utf-8",
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "pdf": "application/pdf",
+}
+MAX_BODY = 16 * 1024 * 1024  # Largest accepted request body in bytes
+LATENCY_WINDOW = 10000  # Number of recent requests the latency percentiles are computed over
+PERCENTILES = [50, 90, 99]
+OUTCOMES = ["hit", "coalesced", "rendered", "busy", "invalid", "failed"]
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="Local HTTP service rendering CLEVA-Compasses.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on.",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to listen on.",
+    )
+    parser.add_argument(
+        "--template",
+        default="cleva_template.tex",
+        help="Tikz template file.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of render worker processes.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=32,
+        help="Number of renders waiting for a worker before requests are rejected.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120.0,
+        help="Seconds a request waits for its render.",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Log every request.",
+    )
+    return parser.parse_args()
+
+
+class ServiceBusy(Exception):
+    """Raised when the render queue is full."""
+
+
+class RenderFailed(Exception):
+    """Raised when a render failed, status is the HTTP status of the response."""
+
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        super().__init__(status, message)
+
+    def __str__(self):
+        return self.message
+
+
+@dataclasses.dataclass(frozen=True)
+class RenderOptions:
+    """Per-request render options, see render_entries."""
+
+    fmt: str = "svg"
+    width: int = None
+    renderer: str = "tikz"
+    optimize: bool = False
+    layered: bool = False
+
+    @classmethod
+    def from_query(cls, query):
+        """Options from the parsed query string of a request. Raises ValueError if invalid."""
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        fmt = params.pop("format", cls.fmt)
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', must be one of {FORMATS}")
+        renderer = params.pop("renderer", cls.renderer)
+        check_renderer(fmt, renderer)
+        width = params.pop("width", None)
+        width = int(width) if width else None
+        if width is not None and width <= 0:
+            raise ValueError(f"Invalid width {width}, must be positive")
+        flags = {name: params.pop(name, "0") in ["1", "true"] for name in ["optimize", "layered"]}
+        if params:
+            raise ValueError(f"Unknown parameter(s) {', '.join(sorted(params))}")
+        return cls(fmt, width, renderer, **flags)
+
+
+def _render(entries, options, template_path):
+    """
+    Render in a worker process, which shares the cache directory of the service. Returns the
+    rendered bytes, or a RenderFailed on failure: exceptions are returned instead of raised, so that
+    only picklable, plain values are sent back to the service.
+    """
+    try:
+        return render_entries(
+            entries,
+            options.fmt,
+            template_path,
+            options.renderer,
+            cache=default_cache(),
+            layered=options.layered,
+            optimize=options.optimize,
+            width=options.width,
+        )
+    except Exception as e:
+        return RenderFailed(_error_status(e), f"{type(e).__name__}: {e}")
+
+
+def _error_status(error):
+    """HTTP status of a failed render."""
+    from tikz2svg import CompileError
+
+    if isinstance(error, CompileError):
+        if error.result.timed_out:
+            return 504
+        if error.result.returncode != 127:  # 127: the toolchain is not installed
+            return 422
+    return 500
+
+
+class RenderService(object):
+    """
+    Renders compasses in a pool of worker processes, with request coalescing, backpressure and a
+    render cache. Thread-safe; render() is called from the request handler threads.
+    """
+
+    def __init__(
+        self,
+        template_path="cleva_template.tex",
+        workers=None,
+        queue_size=32,
+        timeout=120.0,
+        cache=None,
+    ):
+        with open(template_path, "rb") as f:
+            self.template_hash = hashlib.sha256(f.read()).hexdigest()
+        self.template_path = template_path
+        self.workers = workers or os.cpu_count()
+        self.capacity = self.workers + queue_size
+        self.timeout = timeout
+        self.cache = cache if cache is not None else RenderCache()
+        self.counts = collections.Counter()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._inflight = {}  # Key -> (Future, pool) of the running or queued render
+        self._lock = threading.RLock()
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_init_batch_worker)
+        self.restarts = 0  # Number of times the pool was replaced after a worker died
+
+    def key(self, entries, options):
+        """Cache key of the compass of the given entries, rendered with options."""
+        h = hashlib.sha256(self.template_hash.encode("utf-8"))
+        h.update(repr(options).encode("utf-8"))
+        h.update(json.dumps([dataclasses.asdict(e) for e in entries], sort_keys=True).encode())
+        return h.hexdigest()
+
+    def render(self, entries, options):
+        """
+        Render the entries and return (bytes, outcome), where outcome is 'hit', 'coalesced' or
+        'rendered'. Raises ServiceBusy if the queue is full, TimeoutError if the render takes
+        longer than the timeout and RenderFailed if it failed.
+        """
+        key = self.key(entries, options)
+        data = self.cache.get(key, options.fmt)
+        if data is not None:
+            return data, "hit"
+
+        with self._lock:
+            future, pool = self._inflight.get(key, (None, None))
+            outcome = "coalesced" if future is not None else "rendered"
+            if future is None:
+                if len(self._inflight) >= self.capacity:
+                    raise ServiceBusy()
+                pool = self._pool
+                try:
+                    future = pool.submit(_render, entries, options, self.template_path)
+                except BrokenProcessPool:
+                    pool = self._restart_pool(pool)
+                    future = pool.submit(_render, entries, options, self.template_path)
+                self._inflight[key] = (future, pool)
+                future.add_done_callback(lambda f: self._finish(key, options.fmt, f))
+        try:
+            result = future.result(self.timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Render did not finish within {self.timeout:g} s") from None
+        except BrokenProcessPool:
+            # A worker process died (e.g. killed for its memory use), which breaks the whole pool
+            self._restart_pool(pool)
+            raise RenderFailed(500, "A render worker terminated abruptly") from None
+        if isinstance(result, RenderFailed):
+            raise RenderFailed(result.status, result.message)
+        return result, outcome
+
+    def _restart_pool(self, broken):
+        """Replace the broken pool with a new one (unless that happened already) and return it."""
+        with self._lock:
+            if self._pool is broken:
+                self._pool = ProcessPoolExecutor(self.workers, initializer=_init_batch_worker)
+                self.restarts += 1
+                broken.shutdown(wait=False, cancel_futures=True)
+            return self._pool
+
+    def _finish(self, key, fmt, future):
+        # Store the result before the key leaves _inflight, so that later requests hit the cache
+        try:
+            if not future.cancelled() and future.exception() is None:
+                if isinstance(future.result(), bytes):
+                    self.cache.put(key, fmt, future.result())
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def record(self, outcome, seconds):
+        """Count a finished request and its latency."""
+        with self._lock:
+            self.counts[outcome] += 1
+            self._latencies.append(seconds)
+
+    def stats(self):
+        """Request counters, queue depth, latency percentiles in ms and cache statistics."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = {
+                "requests": sum(self.counts.values()),
+                **{o: self.counts[o] for o in OUTCOMES},
+                "inflight": len(self._inflight),
+                "capacity": self.capacity,
+                "workers": self.workers,
+                "restarts": self.restarts,
+            }
+        result["latency_ms"] = {
+            f"p{p}": _percentile(latencies, p) * 1000 if latencies else None for p in PERCENTILES
+        }
+        result["latency_ms"]["max"] = latencies[-1] * 1000 if latencies else None
+        result["cache"] = self.cache.stats()
+        return result
+
+    def close(self):
+        """Stop the worker processes, cancelling queued renders."""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _percentile(values, p):
+    """The p-th percentile of sorted values (nearest rank)."""
+    return values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))]
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """Request handler of the render service, see the module docstring."""
+
+    service = None  # RenderService, set by make_server
+    verbose = False
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._reply(200, b"ok\n", "text/plain")
+        elif path == "/stats":
+            self._reply_json(200, self.service.stats())
+        else:
+            self._reply_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        t0 = time.perf_counter()
+        url = urlsplit(self.path)
+        outcome = "failed"
+        try:
+            if url.path != "/render":
+                outcome = "invalid"
+                self._reply_json(404, {"error": f"Unknown path {url.path}"})
+                return
+            length = self.headers.get("Content-Length") or "0"
+            if not (length.isascii() and length.isdigit()):
+                # The body cannot be skipped without its length
+                outcome = "invalid"
+                self.close_connection = True
+                self._reply_json(400, {"error": f"Invalid Content-Length '{length}'"})
+                return
+            length = int(length)
+            if length > MAX_BODY:
+                outcome = "invalid"
+                self.close_connection = True
+                self._reply_json(413, {"error": f"Request body larger than {MAX_BODY} bytes"})
+                return
+            body = self.rfile.read(length)
+            try:
+                options = RenderOptions.from_query(url.query)
+                entries = read_json_entries(json.loads(body)["entries"])
+            except (ValueError, KeyError, TypeError) as e:
+                outcome = "invalid"
+                self._reply_json(400, {"error": f"{type(e).__name__}: {e}"})
+                return
+
+            try:
+                data, outcome = self.service.render(entries, options)
+            except ServiceBusy:
+                outcome = "busy"
+                self._reply_json(503, {"error": "Render queue is full"}, {"Retry-After": "1"})
+                return
+            except TimeoutError as e:
+                self._reply_json(504, {"error": str(e)})
+                return
+            except RenderFailed as e:
+                self._reply_json(e.status, {"error": e.message})
+                return
+            except Exception as e:
+                self._reply_json(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            self._reply(200, data, CONTENT_TYPES[options.fmt], {"X-Render": outcome})
+        finally:
+            self.service.record(outcome, time.perf_counter() - t0)
+
+    def _reply(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply_json(self, status, obj, headers=None):
+        data = (json.dumps(obj, indent=2) + "\n").encode("utf-8")
+        self._reply(status, data, "application/json", headers)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(service, host="127.0.0.1", port=8765, verbose=False):
+    """HTTP server answering requests with the given RenderService, see serve_forever()."""
+    handler = type("Handler", (RenderHandler,), {"service": service, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    service = RenderService(args.template, args.workers, args.queue_size, args.timeout)
+    server = make_server(service, args.host, args.port, args.verbose)
+    print(f"Serving compasses on http://{args.host}:{server.server_address[1]}/render")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(json.dumps(service.stats(), indent=2))
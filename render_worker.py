@@ -0,0 +1,81 @@
+"""
+Background rendering for the GUI.
+
+Tk widgets may only be used from the main thread, so renders run on a worker thread and their
+results are handed back through a queue, which the GUI drains with root.after. Only the latest
+request matters for a preview: requests arriving within the debounce delay are coalesced, and a
+render that becomes stale while it is running is cancelled and its result dropped.
+"""
+import queue
+import threading
+import time
+
+
+class RenderWorker(object):
+    """
+    Runs render jobs on a background thread, one at a time. A job is a function job(cancel), which
+    receives a threading.Event that is set once a newer job was submitted. Its result is passed to
+    callback(result, error) by poll(), which must be called from the GUI thread.
+    """
+
+    def __init__(self, delay=0.25):
+        self.delay = delay  # Debounce delay in seconds
+        self.generation = 0  # Incremented for every submitted job
+        self._pending = None  # (generation, due time, job, callback) of the next job
+        self._running = None  # Generation of the running job
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        """Whether a job is waiting, running or its result has not been delivered yet."""
+        return self._pending is not None or self._running is not None or not self._results.empty()
+
+    def submit(self, job, callback):
+        """
+        Schedule job, replacing a job which did not start yet and cancelling the running one.
+        Returns the generation of the job.
+        """
+        with self._cond:
+            self.generation += 1
+            self._pending = (self.generation, time.monotonic() + self.delay, job, callback)
+            self._cancel.set()
+            self._cond.notify()
+            return self.generation
+
+    def poll(self):
+        """Deliver the results of finished jobs. Results of stale jobs are dropped."""
+        while True:
+            try:
+                generation, callback, result, error = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if generation == self.generation:
+                callback(result, error)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                generation, due, job, callback = self._pending
+
+                # Wait until no newer job arrived for the debounce delay
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                self._running = generation
+                self._pending = None
+                self._cancel = cancel = threading.Event()
+
+            result = error = None
+            try:
+                result = job(cancel)
+            except Exception as e:
+                error = e
+            self._results.put((generation, callback, result, error))
+            self._running = None
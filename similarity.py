@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour search over compass profiles.
+
+The distance of two entries is the weighted sum of
+- their inner levels: per attribute 0 if equal, 1 if only one of them has it, and PARTIAL if one is
+  supervised and the other unsupervised, times the weight of the attribute, and
+- their outer levels: the number of differing attributes, i.e. the popcount of the XOR of the
+  packed outer levels, times outer_weight.
+
+Besides the vectorized brute-force search over a Corpus (nearest), ProfileIndex buckets the entries
+by outer level, so that a search only compares the entries close to the query.
+
+Example: the 3 methods most similar to VCL, rendered together with VCL as one compass
+
+    $ python similarity.py --corpus methods/ --label VCL -k 3 --output vcl.svg
+"""
+import argparse
+import dataclasses
+import functools
+import json
+import os
+
+import numpy as np
+
+from corpus import load_corpus
+from create_compass import FORMATS, render_entries
+from entry_loader import iter_json_entries
+from levels import INNER_FIELDS, OUTER_CODES, OUTER_FIELDS, pack_inner, pack_outer
+
+PARTIAL = 0.5  # Distance of supervised and unsupervised
+PALETTE = [
+    "magenta",
+    "green",
+    "blue",
+    "orange",
+    "cyan",
+    "brown",
+    "lime",
+    "pink",
+    "purple",
+    "teal",
+    "lightgray",
+]
+
+_POPCOUNT = np.array([bin(code).count("1") for code in range(OUTER_CODES)], dtype=np.uint8)
+_SPLIT_FIELDS = 6  # Inner level distances are tabulated for the first 6 and the last 5 fields
+_SPLIT = 3**_SPLIT_FIELDS
+# XOR masks of the outer level codes with Hamming distance r, for r = 0, ..., 15
+_RINGS = [np.flatnonzero(_POPCOUNT == r) for r in range(len(OUTER_FIELDS) + 1)]
+
+
+def parse_arguments():
+    """Parse commandline arguments."""
+    parser = argparse.ArgumentParser(
+        description="Find the methods with the most similar compass profile.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--corpus",
+        nargs="+",
+        default=["methods"],
+        help="Methods to search: JSON data files, directories of method files or a saved corpus.",
+    )
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument(
+        "--query",
+        help="JSON data file with the query entries.",
+    )
+    query.add_argument(
+        "--label",
+        help="Label (or part of it) of the query entry in the corpus.",
+    )
+    parser.add_argument(
+        "-k",
+        type=int,
+        default=5,
+        help="Number of neighbours.",
+    )
+    parser.add_argument(
+        "--outer-weight",
+        type=float,
+        default=1.0,
+        help="Weight of the outer level distance relative to the inner level distance.",
+    )
+    parser.add_argument(
+        "--partial",
+        type=float,
+        default=PARTIAL,
+        help="Inner level distance of supervised and unsupervised.",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Search an index instead of comparing against all methods (for large corpora).",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Render the (first) query together with its neighbours into this file "
+        f"({', '.join('.' + f for f in FORMATS)}) or save them as .json data file.",
+    )
+    return parser.parse_args()
+
+
+def _digits(codes, n):
+    """Base-3 digits of packed inner levels, least significant first."""
+    return np.stack([codes // 3**i % 3 for i in range(n)], axis=-1)
+
+
+def profile(entry):
+    """The profile of an entry as (packed inner level, packed outer level)."""
+    return pack_inner(entry.inner_level), pack_outer(entry.outer_level)
+
+
+class ProfileMetric(object):
+    """Distance between compass profiles, see the module docstring."""
+
+    def __init__(self, inner_weights=None, outer_weight=1.0, partial=PARTIAL):
+        if inner_weights is None:
+            inner_weights = [1.0] * len(INNER_FIELDS)
+        weights = np.asarray(inner_weights, dtype=float)
+        cost = np.array([[0, 1, 1], [1, 0, partial], [1, partial, 0]], dtype=float)
+        self.outer_weight = outer_weight
+
+        # Inner level distances between all pairs of the first 6 and of the last 5 field digits
+        low = _digits(np.arange(_SPLIT), _SPLIT_FIELDS)
+        n_high = len(INNER_FIELDS) - _SPLIT_FIELDS
+        high = _digits(np.arange(3**n_high), n_high)
+        self.low = cost[low[:, None], low[None, :]] @ weights[:_SPLIT_FIELDS]
+        self.high = cost[high[:, None], high[None, :]] @ weights[_SPLIT_FIELDS:]
+        self._low = self.low.tolist()
+        self._high = self.high.tolist()
+
+    def distance(self, a, b):
+        """Distance of two profiles."""
+        (a_inner, a_outer), (b_inner, b_outer) = a, b
+        inner = self._low[a_inner % _SPLIT][b_inner % _SPLIT]
+        inner += self._high[a_inner // _SPLIT][b_inner // _SPLIT]
+        return inner + self.outer_weight * (a_outer ^ b_outer).bit_count()
+
+    def inner_distances(self, inner, query_inner):
+        """Inner level distances of the packed inner level query_inner to all of inner (array)."""
+        result = self.low[query_inner % _SPLIT][inner % _SPLIT]
+        result += self.high[query_inner // _SPLIT][inner // _SPLIT]
+        return result
+
+    def distances(self, inner, outer, query):
+        """Distances of the profile query to all packed inner and outer levels (arrays)."""
+        query_inner, query_outer = query
+        result = self.inner_distances(inner, query_inner)
+        return result + self.outer_weight * _POPCOUNT[outer ^ query_outer]
+
+
+@functools.lru_cache(maxsize=None)
+def default_metric():
+    """The metric with default weights, which is built once."""
+    return ProfileMetric()
+
+
+def _k_smallest(distances, k):
+    """Indices of the k smallest distances, ordered by distance and index."""
+    if k < len(distances):
+        threshold = np.partition(distances, k - 1)[k - 1]
+        candidates = np.flatnonzero(distances <= threshold)
+    else:
+        candidates = np.arange(len(distances))
+    return candidates[np.lexsort((candidates, distances[candidates]))][:k]
+
+
+def nearest(corpus, query, k=5, metric=None, exclude=None):
+    """
+    Brute-force search for the k entries of corpus nearest to query (a CompassEntry). Returns their
+    row indices and distances, closest first. The row exclude (e.g. the query itself) is skipped.
+    """
+    metric = metric or default_metric()
+    distances = metric.distances(corpus.inner, corpus.outer, profile(query))
+    if exclude is not None:
+        distances[exclude] = np.inf
+        k = min(k, len(corpus) - 1)
+    rows = _k_smallest(distances, k)
+    return rows, distances[rows]
+
+
+class ProfileIndex(object):
+    """
+    Corpus rows bucketed by their packed outer level. A row whose outer level differs from the
+    query's in r attributes has a distance of at least r * outer_weight, so the search visits the
+    buckets ring by ring (r = 0, 1, ...) and stops once the k-th best distance is below the next
+    ring. For the typical small distances of the nearest neighbours, only a fraction of the
+    corpus is compared.
+    """
+
+    def __init__(self, corpus, metric=None):
+        self.metric = metric or default_metric()
+        self.order = np.argsort(corpus.outer, kind="stable")
+        self.inner = np.asarray(corpus.inner)[self.order]
+        # Rows with outer level code c are order[offsets[c]:offsets[c + 1]]
+        outer = np.asarray(corpus.outer)[self.order]
+        self.offsets = np.searchsorted(outer, np.arange(OUTER_CODES + 1))
+
+    def search(self, query, k=5, exclude=None):
+        """Same as nearest(corpus, query, k, metric, exclude), using the index."""
+        if exclude is not None:
+            k = min(k, len(self.order) - 1)
+        query_inner, query_outer = profile(query)
+        rows = np.zeros(0, dtype=np.int64)
+        distances = np.zeros(0)
+        for r, masks in enumerate(_RINGS):
+            codes = masks ^ query_outer
+            starts = self.offsets[codes]
+            lengths = self.offsets[codes + 1] - starts
+            ends = np.cumsum(lengths)
+            if ends[-1]:
+                positions = np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1])
+                ring_distances = self.metric.inner_distances(self.inner[positions], query_inner)
+                ring_rows = self.order[positions]
+                if exclude is not None:
+                    keep = ring_rows != exclude
+                    ring_rows, ring_distances = ring_rows[keep], ring_distances[keep]
+                ring_distances += self.metric.outer_weight * r
+                rows = np.concatenate([rows, ring_rows])
+                distances = np.concatenate([distances, ring_distances])
+                best = np.lexsort((rows, distances))[:k]
+                rows, distances = rows[best], distances[best]
+            # All rows not visited yet are at least as far away as the next ring
+            if k == 0 or len(rows) == k and distances[-1] < self.metric.outer_weight * (r + 1):
+                break
+        return rows, distances
+
+
+def find_label(corpus, text):
+    """Row of the entry with the given label, or else of the first label containing text."""
+    labels = [corpus.label(i) for i in range(len(corpus))]
+    if text in labels:
+        return labels.index(text)
+    for i, label in enumerate(labels):
+        if text.lower() in label.lower():
+            return i
+    return None
+
+
+def comparison_entries(query, neighbours, distances):
+    """The query and its neighbours as entries of one compass, with distinct colors."""
+    entries = [dataclasses.replace(query, color=PALETTE[0])]
+    for i, (entry, distance) in enumerate(zip(neighbours, distances), start=1):
+        label = f"{entry.label} [{distance:g}]"
+        entries.append(dataclasses.replace(entry, label=label, color=PALETTE[i % len(PALETTE)]))
+    return entries
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    corpus = load_corpus(args.corpus)
+    metric = ProfileMetric(outer_weight=args.outer_weight, partial=args.partial)
+    index = ProfileIndex(corpus, metric) if args.index else None
+
+    if args.label is not None:
+        row = find_label(corpus, args.label)
+        if row is None:
+            print(f"✘ No method with label '{args.label}'")
+            exit(1)
+        queries = [(corpus[row], row)]
+    else:
+        queries = [(entry, None) for entry in iter_json_entries(args.query)]
+
+    results = []
+    for query, row in queries:
+        if index is not None:
+            rows, distances = index.search(query, args.k, exclude=row)
+        else:
+            rows, distances = nearest(corpus, query, args.k, metric, exclude=row)
+        neighbours = [corpus[int(r)] for r in rows]
+        results.append((query, neighbours, distances))
+        print(f"{query.label}:")
+        for rank, (entry, distance) in enumerate(zip(neighbours, distances), start=1):
+            print(f"  {rank:>3}. {distance:6g}  {entry.label} ({entry.color})")
+
+    if args.output is not None and results:
+        entries = comparison_entries(*results[0])
+        if args.output.endswith(".json"):
+            from entry_loader import entry_to_json
+
+            with open(args.output, "w") as f:
+                json.dump({"entries": [entry_to_json(e) for e in entries]}, f, indent=2)
+        else:
+            fmt = os.path.splitext(args.output)[1][1:]
+            with open(args.output, "wb") as f:
+                f.write(render_entries(entries, fmt))
+        print(f"Saved the comparison to {args.output}")
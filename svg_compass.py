@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Native SVG renderer for the CLEVA-Compass.
+
+Computes the compass geometry of cleva_template.tex directly in Python and writes the SVG
+without running pdflatex/pdf2svg. Lengths are given in cm (as in the template) and converted
+to SVG user units (bp) on output.
+"""
+import functools
+import math
+import re
+from typing import List
+from xml.sax.saxutils import escape
+
+from create_compass import D, EV, A, B, mapcolor
+from levels import CompassEntry
+
+# Template lengths (see cleva_template.tex)
+U = 2  # Number of scale units
+R = 2.7  # Maximal diagram radius
+L = 3.3  # Radius to put dimension labels
+INSTRIP = 3.6  # Radius of the method strips
+OUTSTRIP = 3.85  # Radius of the evaluation measure labels
+STRIP_HALF_WIDTH = 0.125  # Half width of a strip (1.25mm)
+LEGEND_OFFSET = 4.05  # Distance between compass center and legend
+
+# Unit conversions
+CM = 72 / 2.54  # bp per cm
+PT = 72 / 72.27  # bp per TeX pt
+FONT_SIZE = 5 * PT  # \tiny in a 10pt document
+EX = 0.45 * FONT_SIZE  # x-height of the times font
+CHAR_WIDTH = 0.47 * FONT_SIZE  # Average character width, used to estimate text extents
+LINE_WIDTH = 0.4 * PT  # TikZ default line width
+
+# Dimension labels: (text, xshift [ex], yshift [ex], rotation [deg])
+DOFFSET = 3 * A - 90
+DIMENSION_LABELS = [
+    ("Multiple Models", -2.25, -2, DOFFSET - 2 * A),
+    ("Federated", -1, -2.5, DOFFSET - A),
+    ("Online", 0, -2.75, DOFFSET),
+    ("Open World", 1.5, -2.25, DOFFSET + A),
+    ("Multiple Modalities", 2.5, -0.5, DOFFSET + 2 * A),
+    ("Active Data Query", 2.75, 0.5, -2 * A - 5),
+    ("Task Order Discovery", 2.75, 1.25, 5 - A),
+    ("Task Agnostic", 2.0, 2.5, 0),
+    ("Episodic Memory", 0, 2.75, -(DOFFSET - 1 * A)),
+    ("Generative", -2.5, 1, 2 * A - 15),
+    ("Uncertainty", -2.75, -0.5, DOFFSET - 3 * A),
+]
+
+# Evaluation measure labels in the order of OuterLevel.__iter__
+MEASURE_LABELS = [
+    "Parameters",
+    "Compute time",
+    "MAC operations",
+    "Communication",
+    "Forgetting",
+    "Forward transfer",
+    "Backward transfer",
+    "Openness",
+    "Data per task",
+    "Task order",
+    "Per task metrics",
+    "Optimization steps",
+    "Generated data",
+    "Stored data",
+    "Memory",
+]
+
+# xcolor base colors
+_XCOLORS = {
+    "black": (0, 0, 0),
+    "white": (1, 1, 1),
+    "magenta": (1, 0, 1),
+    "green": (0, 1, 0),
+    "blue": (0, 0, 1),
+    "orange": (1, 0.5, 0),
+    "cyan": (0, 1, 1),
+    "brown": (0.75, 0.5, 0.25),
+    "lime": (0.75, 1, 0),
+    "pink": (1, 0.75, 0.75),
+    "purple": (0.75, 0, 0.25),
+    "teal": (0, 0.5, 0.5),
+    "lightgray": (0.75, 0.75, 0.75),
+}
+
+
+def xcolor(expr):
+    """Evaluate a simple xcolor expression such as 'green!50!black' to an RGB tuple."""
+    parts = expr.split("!")
+    rgb = _XCOLORS[parts[0]]
+    i = 1
+    while i < len(parts):
+        pct = float(parts[i]) / 100
+        other = _XCOLORS[parts[i + 1]] if i + 1 < len(parts) else _XCOLORS["white"]
+        rgb = tuple(pct * c + (1 - pct) * o for c, o in zip(rgb, other))
+        i += 2
+    return rgb
+
+
+def hexcolor(expr):
+    """Convert an xcolor expression to an SVG hex color."""
+    return "#" + "".join(f"{round(c * 255):02x}" for c in xcolor(expr))
+
+
+# Fill colors of the <color>shell styles in cleva_template.tex (draw color is mapcolor(color))
+SHELL_FILLS = {
+    "orange": "orange!80",
+    "cyan": "cyan!80!black",
+    "brown": "brown!80!black",
+}
+
+
+def polar(angle, radius):
+    """Convert TikZ polar coordinates (deg, cm) to SVG coordinates (bp, y pointing down)."""
+    a = math.radians(angle)
+    return radius * CM * math.cos(a), -radius * CM * math.sin(a)
+
+
+def fmt(v):
+    """Format a number with fixed precision for SVG output."""
+    s = f"{v:.3f}".rstrip("0").rstrip(".")
+    return "0" if s == "-0" else s
+
+
+def point(p):
+    return fmt(p[0]) + "," + fmt(p[1])
+
+
+def arc_to(angle_start, angle_end, radius):
+    """SVG arc command along a circle from angle_start to angle_end (TikZ 'arc' semantics)."""
+    # Counter-clockwise in TikZ is counter-clockwise on screen, which is SVG sweep-flag 0
+    sweep = 0 if angle_end > angle_start else 1
+    large = 1 if abs(angle_end - angle_start) > 180 else 0
+    r = fmt(radius * CM)
+    return f"A {r},{r} 0 {large},{sweep} {point(polar(angle_end, radius))}"
+
+
+def strip_path(radius, angle_start, angle_end):
+    """Path of the 'strip' pic defined in cleva_template.tex."""
+    r_in = radius - STRIP_HALF_WIDTH
+    r_out = radius + STRIP_HALF_WIDTH
+    return (
+        f"M {point(polar(angle_start, r_in))} "
+        + arc_to(angle_start, angle_end, r_in)
+        + f" L {point(polar(angle_end, radius))} L {point(polar(angle_end, r_out))} "
+        + arc_to(angle_end, angle_start, r_out)
+        + f" L {point(polar(angle_start, radius))} Z"
+    )
+
+
+def latex_to_text(label):
+    """Strip simple TeX markup from a legend label."""
+    label = label.replace(r"\&", "&").replace("~", " ")
+    label = re.sub(r"\\[a-zA-Z]+\*?(\[[^\]]*\])?", "", label)
+    return label.replace("{", "").replace("}", "").strip()
+
+
+def text_width(text):
+    """Estimate the width of a text at the compass font size."""
+    return len(text) * CHAR_WIDTH
+
+
+def draw_background(out):
+    """Draw the spiderweb, the dimension labels and nothing entry specific."""
+    # Axes
+    out.append('<g stroke="#000000" stroke-opacity="0.5" stroke-width="%s">' % fmt(LINE_WIDTH))
+    for x in range(1, D + 1):
+        out.append(f'<path d="M 0,0 L {point(polar(x * A, R))}"/>')
+    out.append("</g>")
+
+    # Grid circles and their coordinates D<x>-<y>
+    for y in range(U + 1):
+        radius = y * R / U
+        out.append('<g fill="#000000">')
+        for x in range(1, D + 1):
+            cx, cy = polar(x * A, radius)
+            out.append(f'<circle cx="{fmt(cx)}" cy="{fmt(cy)}" r="{fmt(1.5 * PT)}"/>')
+        out.append("</g>")
+        path = " L ".join(point(polar(x * A, radius)) for x in range(0, D + 1))
+        out.append(
+            f'<path d="M {path} Z" fill="none" stroke="#000000" stroke-opacity="0.5" '
+            f'stroke-width="{fmt(LINE_WIDTH)}"/>'
+        )
+
+    # Dimension labels
+    out.append(f'<g font-size="{fmt(FONT_SIZE)}" text-anchor="middle" dominant-baseline="central">')
+    for i, (text, xshift, yshift, rotation) in enumerate(DIMENSION_LABELS, start=1):
+        x, y = polar(i * A, L)
+        x += xshift * EX
+        y -= yshift * EX
+        out.append(
+            f'<text transform="translate({fmt(x)},{fmt(y)}) rotate({fmt(-rotation)})">'
+            f"{escape(text)}</text>"
+        )
+    out.append("</g>")
+
+
+def draw_measure_labels(out):
+    """Draw the outer ring with the evaluation measure labels."""
+    out.append(
+        f'<g stroke="#000000" fill="#ffffff" stroke-width="{fmt(LINE_WIDTH)}" opacity="0.75">'
+    )
+    for i in range(1, EV + 1):
+        angle_start, angle_end = label_angles(i)
+        out.append(f'<path d="{strip_path(OUTSTRIP, angle_start, angle_end)}"/>')
+    out.append("</g>")
+
+    out.append(f'<g font-size="{fmt(FONT_SIZE)}" text-anchor="middle">')
+    for i, text in enumerate(MEASURE_LABELS, start=1):
+        angle_start, angle_end = label_angles(i)
+        out.append(
+            f'<path id="measure-{i}" fill="none" d="M {point(polar(angle_start, OUTSTRIP))} '
+            f'{arc_to(angle_start, angle_end, OUTSTRIP)}"/>'
+        )
+        out.append(
+            f'<text dy="{fmt(0.3 * EX)}"><textPath href="#measure-{i}" startOffset="50%">'
+            f"{escape(text)}</textPath></text>"
+        )
+    out.append("</g>")
+
+
+def label_angles(i):
+    """Start and end angle of the i-th (1-based) evaluation measure label strip."""
+    # Top half runs clockwise, bottom half counter-clockwise for readable labels
+    if i <= 8:
+        return i * B, (i - 1) * B
+    return (i - 1) * B, i * B
+
+
+def draw_inner_level(out, entries: List[CompassEntry]):
+    """Draw the inner level polygons."""
+    for e in entries:
+        color = mapcolor(e.color)
+        path = " L ".join(
+            point(polar((i + 1) * A, irv * R / U)) for i, irv in enumerate(e.inner_level)
+        )
+        out.append(
+            f'<path d="M {path} Z" stroke="{hexcolor(color)}" stroke-opacity="0.6" '
+            f'stroke-width="{fmt(1.5 * PT)}" stroke-linejoin="miter" '
+            f'fill="{hexcolor(color + "!10")}" fill-opacity="0.4"/>'
+        )
+
+
+def draw_outer_level(out, entries: List[CompassEntry]):
+    """Draw the outer level strips, one per entry and reported measure."""
+    M = len(entries)
+    for e_idx, e in enumerate(entries):
+        stroke = hexcolor(mapcolor(e.color))
+        fill = hexcolor(SHELL_FILLS.get(e.color, mapcolor(e.color)))
+        paths = []
+        for ol_idx, has_attribute in enumerate(e.outer_level):
+            if not has_attribute:
+                continue
+            angle_start = ol_idx * B + e_idx * B / M
+            angle_end = ol_idx * B + (e_idx + 1) * B / M
+            paths.append(f'<path d="{strip_path(INSTRIP, angle_start, angle_end)}"/>')
+        if paths:
+            out.append(
+                f'<g stroke="{stroke}" fill="{fill}" opacity="0.3" '
+                f'stroke-width="{fmt(LINE_WIDTH)}">'
+            )
+            out.extend(paths)
+            out.append("</g>")
+
+
+def legend_layout(entries: List[CompassEntry]):
+    """Compute the legend cells as (x, baseline_y, entry) and the legend height in bp."""
+    if len(entries) == 0:
+        return [], 0.0
+    n_rows = math.ceil(len(entries) / 3)
+    n_cols = 3 if len(entries) >= 3 else len(entries)
+    box = 10.1 * PT * 0.6  # \scalebox{0.6}{\fcolorbox{..}{..}{\rule{X}{X}}}
+    space = 0.25 * FONT_SIZE
+    col_sep = 6 * PT  # \tabcolsep
+    row_height = 6 * PT  # \baselineskip of \tiny
+    row_skip = 0.15 * CM
+
+    widths = [0.0] * n_cols
+    for i, e in enumerate(entries):
+        w = box + space + text_width(latex_to_text(e.label))
+        widths[i % 3] = max(widths[i % 3], w)
+
+    total_width = sum(widths) + 2 * col_sep * n_cols
+    inner_sep = 0.3333 * FONT_SIZE
+    top = LEGEND_OFFSET * CM + inner_sep
+
+    cells = []
+    for i, e in enumerate(entries):
+        col, row = i % 3, i // 3
+        x = -total_width / 2 + col_sep + sum(widths[:col]) + 2 * col_sep * col
+        y = top + row * (row_height + row_skip) + 0.7 * row_height
+        cells.append((x, y, e))
+    height = n_rows * row_height + (n_rows - 1) * row_skip + 2 * inner_sep
+    return cells, height
+
+
+def draw_legend(out, entries: List[CompassEntry]):
+    """Draw the legend below the compass."""
+    cells, _ = legend_layout(entries)
+    if not cells:
+        return
+    box = 10.1 * PT * 0.6
+    space = 0.25 * FONT_SIZE
+    out.append(f'<g font-size="{fmt(FONT_SIZE)}">')
+    for x, y, e in cells:
+        color = hexcolor(mapcolor(e.color) + "!30")
+        out.append(
+            f'<rect x="{fmt(x)}" y="{fmt(y - box + 0.2 * box)}" width="{fmt(box)}" '
+            f'height="{fmt(box)}" fill="{color}"/>'
+        )
+        out.append(
+            f'<text x="{fmt(x + box + space)}" y="{fmt(y)}">'
+            f"{escape(latex_to_text(e.label))}</text>"
+        )
+    out.append("</g>")
+
+
+def bounding_box(entries: List[CompassEntry]):
+    """Bounding box (x, y, width, height) of the compass including the legend in bp."""
+    extent = (OUTSTRIP + STRIP_HALF_WIDTH) * CM + LINE_WIDTH
+    cells, legend_height = legend_layout(entries)
+    half_width = extent
+    bottom = extent
+    if cells:
+        legend_half_width = max(
+            abs(x) + 10.1 * PT * 0.6 + 0.25 * FONT_SIZE + text_width(latex_to_text(e.label))
+            for x, _, e in cells
+        )
+        half_width = max(half_width, legend_half_width + 6 * PT)
+        bottom = max(bottom, LEGEND_OFFSET * CM + legend_height)
+    return -half_width, -extent, 2 * half_width, extent + bottom
+
+
+@functools.lru_cache(maxsize=None)
+def static_layer():
+    """SVG of the entry independent parts of the compass, which is only drawn once."""
+    out = []
+    draw_background(out)
+    draw_measure_labels(out)
+    return "\n".join(out)
+
+
+def render_svg(entries: List[CompassEntry]) -> str:
+    """Render the compass with the given entries as an SVG document."""
+    out = []
+    x, y, width, height = bounding_box(entries)
+    out.append('<?xml version="1.0" encoding="UTF-8"?>')
+    out.append(
+        f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+        f'width="{fmt(width)}pt" height="{fmt(height)}pt" '
+        f'viewBox="{fmt(x)} {fmt(y)} {fmt(width)} {fmt(height)}" '
+        f'font-family="Times, \'Times New Roman\', \'Nimbus Roman\', serif">'
+    )
+    # The measure labels do not overlap with the strips and can be drawn with the static layer
+    out.append(static_layer())
+    draw_inner_level(out, entries)
+    draw_outer_level(out, entries)
+    draw_legend(out, entries)
+    out.append("</svg>")
+    return "\n".join(out) + "\n"
+
+
+def save_svg(entries: List[CompassEntry], filename):
+    """Render the compass and write the SVG into filename."""
+    with open(filename, "w") as f:
+        f.write(render_svg(entries))
@@ -0,0 +1,38 @@
+import os
+import random
+import sys
+from dataclasses import fields
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from levels import CompassEntry, InnerLevel, OuterLevel  # noqa: E402
+
+TEMPLATE_PATH = os.path.join(ROOT, "cleva_template.tex")
+
+
+def make_entries(n, seed=0):
+    """n reproducible random compass entries."""
+    rng = random.Random(seed)
+    colors = ["magenta", "green", "blue", "orange", "cyan", "brown"]
+    return [
+        CompassEntry(
+            color=rng.choice(colors),
+            label=f"Method {i}",
+            inner_level=InnerLevel(*(rng.randrange(3) for _ in fields(InnerLevel))),
+            outer_level=OuterLevel(*(rng.random() < 0.5 for _ in fields(OuterLevel))),
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def entries():
+    return make_entries(7)
+
+
+@pytest.fixture
+def template_path():
+    return TEMPLATE_PATH
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import cleva
+from conftest import ROOT, make_entries
+
+
+def test_public_names():
+    for name in cleva.__all__:
+        assert hasattr(cleva, name), name
+    assert cleva.EntryValidationError.__module__ == "entry_loader"
+
+
+def test_import_is_lazy():
+    code = "import sys, cleva; print(sorted({'tkinter', 'PIL', 'tikz2svg'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert out.stdout.strip() == "[]", out.stderr
+
+
+def test_render(tmp_path):
+    entries = make_entries(3)
+    tex = cleva.render(entries, fmt="tex")
+    assert tex.startswith(b"\\newcommand") and b"Method 2" in tex
+    fragments = cleva.FragmentCache()
+    assert cleva.render(entries, fmt="tex", fragments=fragments) == tex
+    output = tmp_path / "compass.svg"
+    cleva.render(entries, fmt="svg", renderer="native", output=str(output))
+    assert output.read_bytes().startswith(b"<?xml")
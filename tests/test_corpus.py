@@ -0,0 +1,97 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+import levels
+from conftest import make_entries
+from corpus import Corpus
+from levels import InnerLevel, OuterLevel
+
+
+@pytest.fixture
+def random_entries():
+    """Random entries, including empty and non-ASCII labels."""
+    rng = random.Random(1)
+    labels = ["", "Méthode", "方法 🧭", "Method"]
+    return [
+        dataclasses.replace(e, label=rng.choice(labels) + str(i) * rng.randrange(3))
+        for i, e in enumerate(make_entries(200, seed=1))
+    ]
+
+
+def test_pack_round_trip(random_entries):
+    for entry in random_entries:
+        inner, outer = entry.inner_level, entry.outer_level
+        assert InnerLevel.unpack(inner.pack()) == inner
+        assert OuterLevel.unpack(outer.pack()) == outer
+        assert 0 <= inner.pack() < levels.INNER_CODES and 0 <= outer.pack() < levels.OUTER_CODES
+    # Every code is the packed form of a level
+    rng = random.Random(0)
+    for code in rng.sample(range(levels.INNER_CODES), 100):
+        assert levels.pack_inner(InnerLevel.unpack(code)) == code
+    for code in rng.sample(range(levels.OUTER_CODES), 100):
+        assert levels.pack_outer(OuterLevel.unpack(code)) == code
+    with pytest.raises(ValueError):
+        levels.pack_inner(InnerLevel(*[3] * len(levels.INNER_FIELDS)))
+
+
+def test_slots_round_trip(random_entries):
+    for entry in random_entries:
+        slots = levels.to_slots(entry)
+        assert not hasattr(slots, "__dict__")
+        assert list(slots.inner_level) == list(entry.inner_level)
+        assert list(slots.outer_level) == list(entry.outer_level)
+        assert slots.inner_level.pack() == entry.inner_level.pack()
+        assert levels.from_slots(slots) == entry
+
+
+def test_corpus_round_trip(random_entries):
+    corpus = Corpus.from_entries(random_entries)
+    assert len(corpus) == len(random_entries)
+    assert list(corpus) == random_entries
+    slots = [levels.to_slots(e) for e in random_entries]
+    assert list(Corpus.from_entries(slots)) == random_entries
+
+    # The column views agree with the entries
+    inner = [[getattr(e.inner_level, f) for f in levels.INNER_FIELDS] for e in random_entries]
+    outer = [[getattr(e.outer_level, f) for f in levels.OUTER_FIELDS] for e in random_entries]
+    assert corpus.inner_levels().tolist() == inner
+    assert corpus.outer_levels().tolist() == outer
+    assert corpus.column("federated").tolist() == [row[1] for row in inner]
+
+
+def test_select(random_entries):
+    corpus = Corpus.from_entries(random_entries)
+    mask = corpus.where(federated=[1, 2], forgetting=True)
+    expected = [
+        e for e in random_entries if e.inner_level.federated in (1, 2) and e.outer_level.forgetting
+    ]
+    assert 0 < mask.sum() < len(corpus)
+    assert list(corpus.select(mask)) == expected
+    assert list(corpus[mask]) == expected
+
+    indices = [5, 0, 5, 199]
+    assert list(corpus.select(indices)) == [random_entries[i] for i in indices]
+    assert list(corpus[10:20:3]) == random_entries[10:20:3]
+    assert list(corpus.select([])) == []
+    assert corpus[-1] == random_entries[-1]
+
+    color = random_entries[0].color
+    assert list(corpus[corpus.where(color=color)]) == [
+        e for e in random_entries if e.color == color
+    ]
+    assert not corpus.where(color="notacolor").any()
+
+
+def test_save_and_load(random_entries, tmp_path):
+    corpus = Corpus.from_entries(random_entries)
+    corpus.save(str(tmp_path / "corpus"))
+
+    loaded = Corpus.load(str(tmp_path / "corpus"), mmap=True)
+    assert isinstance(loaded.inner, np.memmap) and not loaded.inner.flags.writeable
+    assert loaded.colors == corpus.colors
+    assert list(loaded) == random_entries
+    assert list(loaded.select(loaded.where(online=0))) == list(corpus[corpus.where(online=0)])
+    assert list(Corpus.load(str(tmp_path / "corpus"), mmap=False)) == random_entries
@@ -0,0 +1,59 @@
+import sys
+
+import numpy as np
+import pytest
+
+import corpus_stats
+from conftest import make_entries
+from corpus import Corpus
+from corpus_stats import CorpusStats
+from levels import INNER_FIELDS, OUTER_FIELDS
+
+
+def count_entries(entries):
+    """Statistics counted entry by entry."""
+    inner_counts = np.zeros((len(INNER_FIELDS), 3), dtype=np.int64)
+    outer_counts = np.zeros(len(OUTER_FIELDS), dtype=np.int64)
+    for entry in entries:
+        for f, field in enumerate(INNER_FIELDS):
+            inner_counts[f, getattr(entry.inner_level, field)] += 1
+        for f, field in enumerate(OUTER_FIELDS):
+            outer_counts[f] += getattr(entry.outer_level, field)
+    return inner_counts, outer_counts
+
+
+@pytest.mark.parametrize("chunk_size", [7, corpus_stats.CHUNK_SIZE])
+def test_from_corpus_counts_every_entry(monkeypatch, chunk_size):
+    monkeypatch.setattr(corpus_stats, "CHUNK_SIZE", chunk_size)
+    entries = make_entries(100, seed=3)
+    corpus = Corpus.from_entries(entries)
+
+    stats = CorpusStats.from_corpus(corpus)
+    inner_counts, outer_counts = count_entries(entries)
+    assert stats.size == 100
+    assert stats.inner_counts.tolist() == inner_counts.tolist()
+    assert stats.outer_counts.tolist() == outer_counts.tolist()
+
+    mask = corpus.where(online=[0, 2])
+    stats = CorpusStats.from_corpus(corpus, mask)
+    inner_counts, outer_counts = count_entries([e for e, m in zip(entries, mask) if m])
+    assert stats.size == mask.sum()
+    assert stats.inner_counts.tolist() == inner_counts.tolist()
+    assert stats.outer_counts.tolist() == outer_counts.tolist()
+    total = stats + CorpusStats.from_corpus(corpus, ~mask)
+    assert total.size == 100 and total.inner_counts.tolist() == count_entries(entries)[0].tolist()
+
+
+def parse(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["corpus_stats.py", *argv])
+    return corpus_stats.parse_arguments()
+
+
+def test_inner_argument(monkeypatch):
+    assert parse(monkeypatch).inner == "mean"
+    assert parse(monkeypatch, "--inner", "median").inner == "median"
+    assert parse(monkeypatch, "--inner", "0.25").inner == 0.25
+    assert parse(monkeypatch, "--inner", "1").inner == 1.0
+    for value in ["avg", "-0.1", "1.5", "nan"]:
+        with pytest.raises(SystemExit):
+            parse(monkeypatch, "--inner", value)
@@ -0,0 +1,103 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+import create_compass
+from conftest import ROOT, TEMPLATE_PATH
+
+EXAMPLE = os.path.join(ROOT, "examples", "compass_data_3.json")
+
+
+def run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["create_compass.py", *argv])
+    return create_compass.main(create_compass.parse_arguments())
+
+
+def test_single_file_format(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert run(monkeypatch, "--data", EXAMPLE, "--template", TEMPLATE_PATH) == 0
+    assert open("cleva_filled.tex").read().startswith("\\newcommand")
+
+    # The native renderer writes SVG, into a file named accordingly
+    assert run(monkeypatch, "--data", EXAMPLE, "--renderer", "native") == 0
+    assert open("cleva_filled.svg").read().startswith("<?xml")
+    assert run(monkeypatch, "--data", EXAMPLE, "--renderer", "native", "--output", "a.svg") == 0
+    assert open("a.svg").read().startswith("<?xml")
+
+    assert run(monkeypatch, "--data", EXAMPLE, "--format", "svg", "--output", "b.tex") == 1
+    assert run(monkeypatch, "--data", EXAMPLE, "--format", "tex", "svg") == 1
+    assert not os.path.exists("b.tex")
+
+    # A directory without data files
+    os.mkdir("empty")
+    assert run(monkeypatch, "--data", "empty") == 1
+    assert run(monkeypatch, "--data", "empty", "--output-dir", "out") == 1
+    assert not os.path.exists("out")
+
+
+def test_batch_outputs_mirror_directories(tmp_path):
+    for name in ["a/x.json", "b/x.json", "b/c/y.json"]:
+        os.makedirs(os.path.dirname(tmp_path / name), exist_ok=True)
+        shutil.copyfile(EXAMPLE, tmp_path / name)
+    data_files = [str(tmp_path / name) for name in ["a/x.json", "b/x.json", "b/c/y.json"]]
+    names = create_compass.batch_output_names(data_files)
+    assert list(names.values()) == [
+        os.path.join("a", "x"),
+        os.path.join("b", "x"),
+        os.path.join("b", "c", "y"),
+    ]
+    # Files of a single directory are rendered directly into the output directory
+    assert list(create_compass.batch_output_names(data_files[:1]).values()) == ["x"]
+
+    out = tmp_path / "out"
+    results = create_compass.render_batch(
+        data_files, str(out), ["svg"], TEMPLATE_PATH, "native", jobs=1
+    )
+    assert [status for _, status, _, _ in results] == ["rendered"] * 3
+    for name in ["a/x.svg", "b/x.svg", "b/c/y.svg"]:
+        assert (out / name).exists()
+
+
+def test_batch_rejects_colliding_outputs(tmp_path):
+    for name in ["x.json", "x.jsonl"]:
+        shutil.copyfile(EXAMPLE, tmp_path / name)
+    with pytest.raises(ValueError, match="x.jsonl"):
+        create_compass.batch_output_names([str(tmp_path / "x.json"), str(tmp_path / "x.jsonl")])
+
+
+def test_template_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(create_compass, "TEMPLATE_CACHE_SIZE", 2)
+    monkeypatch.setattr(create_compass.CompiledTemplate, "_cache", {})
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"{i}.tex"))
+        shutil.copyfile(TEMPLATE_PATH, paths[-1])
+    first = create_compass.CompiledTemplate.load(paths[0])
+    assert create_compass.CompiledTemplate.load(paths[0]) is first
+    create_compass.CompiledTemplate.load(paths[1])
+    create_compass.CompiledTemplate.load(paths[2])
+    assert len(create_compass.CompiledTemplate._cache) == 2
+    assert create_compass.CompiledTemplate.load(paths[0]) is not first
+
+    # A modified template replaces its previous version
+    with open(paths[0], "a") as f:
+        f.write("%\n")
+    assert create_compass.CompiledTemplate.load(paths[0]).segments[-1].endswith("%\n")
+    assert len(create_compass.CompiledTemplate._cache) == 2
+
+
+def test_native_renderer_only_writes_svg(tmp_path, monkeypatch, entries):
+    monkeypatch.chdir(tmp_path)
+    for fmt in ["tex", "png", "pdf"]:
+        with pytest.raises(ValueError, match="native renderer cannot produce"):
+            create_compass.render_entries(entries, fmt, TEMPLATE_PATH, "native")
+    with pytest.raises(ValueError, match="Unknown renderer"):
+        create_compass.render_entries(entries, "svg", TEMPLATE_PATH, "other")
+
+    assert run(monkeypatch, "--data", EXAMPLE, "--renderer", "native", "--output", "x.tex") == 1
+    assert run(monkeypatch, "--data", EXAMPLE, "--renderer", "native", "--format", "png") == 1
+    batch = ["--renderer", "native", "--output-dir", "out", "--format", "svg", "pdf"]
+    assert run(monkeypatch, "--data", EXAMPLE, *batch) == 1
+    assert not os.path.exists("x.tex") and not os.path.exists("out")
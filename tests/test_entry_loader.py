@@ -0,0 +1,75 @@
+import json
+import multiprocessing
+
+import pytest
+
+from conftest import make_entries
+from entry_loader import (
+    EntryValidationError,
+    _decode,
+    decode_entries,
+    entry_to_json,
+    load_entry_files,
+    validate,
+)
+
+INVALID = {
+    ("color",): ["notacolor", "Magenta", 1, None],
+    ("label",): [None, 1, True],
+    ("inner_level", "federated"): [-1, 3, 1.0, "1", True, None],
+    ("outer_level", "forgetting"): [2, "true", None, 1.0],
+}
+
+
+def test_decoder_and_validate_agree(entries):
+    for entry in entries:
+        d = json.loads(json.dumps(entry_to_json(entry)))
+        assert _decode(d) == entry
+        assert validate(d) == (entry, [])
+
+    for path, values in INVALID.items():
+        for value in values:
+            d = json.loads(json.dumps(entry_to_json(entries[0])))
+            parent = d
+            for key in path[:-1]:
+                parent = parent[key]
+            parent[path[-1]] = value
+            with pytest.raises((ValueError, TypeError)):
+                _decode(d)
+            entry, errors = validate(d)
+            assert entry is None and [p for p, _ in errors] == [".".join(path)]
+
+
+def test_errors_are_collected():
+    d = json.loads(json.dumps([entry_to_json(e) for e in make_entries(3)]))
+    d[0]["label"] = 1
+    del d[2]["inner_level"]["online"]
+    with pytest.raises(EntryValidationError) as info:
+        decode_entries(d)
+    assert [(e.index, e.path) for e in info.value.errors] == [
+        (0, "label"),
+        (2, "inner_level.online"),
+    ]
+
+
+def test_unknown_colors_are_field_errors():
+    d = json.loads(json.dumps([entry_to_json(e) for e in make_entries(2)]))
+    d[1]["color"] = "notacolor"
+    with pytest.raises(EntryValidationError) as info:
+        decode_entries(d, "data.json")
+    [error] = info.value.errors
+    assert (error.index, error.path) == (1, "color")
+    assert str(error).startswith('data.json: entries[1].color: expected one of magenta, green,')
+    assert str(error).endswith('got "notacolor"')
+
+
+def test_load_entry_files_with_spawned_workers(tmp_path):
+    entries = make_entries(6)
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"{i}.json"))
+        with open(paths[-1], "w") as f:
+            json.dump({"entries": [entry_to_json(e) for e in entries[2 * i : 2 * i + 2]]}, f)
+    spawn = multiprocessing.get_context("spawn")
+    assert load_entry_files(paths, workers=2, mp_context=spawn) == entries
+    assert load_entry_files(paths, workers=1) == entries
@@ -0,0 +1,138 @@
+import dataclasses
+
+import pytest
+
+from conftest import make_entries
+from entry_store import EntryStore
+
+LABELS = ["EWC", "Federated replay", "Online EWC", "Replay", "federated averaging"]
+
+
+@pytest.fixture
+def store():
+    entries = make_entries(60, seed=2)
+    labels = [f"{LABELS[i % len(LABELS)]} {i}" for i in range(len(entries))]
+    return EntryStore(dataclasses.replace(e, label=label) for e, label in zip(entries, labels))
+
+
+def full_scan(store, query):
+    """filter() of a new store with the same entries, i.e. without recent results to refine."""
+    ids = store.ids()
+    return [ids[i] for i in EntryStore(store.entries()).filter(query)]
+
+
+def typed(text):
+    """The queries while text is typed, including trailing spaces."""
+    return [text[:n] for n in range(1, len(text) + 1)]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "federated",  # Label term, then an attribute
+        "federated=1",
+        "replay  federated=1 ",
+        "ewc forgetting=1,0",  # Extended list of values
+        "online=0,2 replay",
+        "online ewc",
+    ],
+)
+def test_refined_filter_equals_full_scan(store, text):
+    for query in typed(text) + [text + " ", text.rstrip()]:
+        try:
+            expected = full_scan(store, query)
+        except ValueError:
+            # An incomplete term, e.g. 'federated='
+            with pytest.raises(ValueError):
+                store.filter(query)
+            continue
+        assert store.filter(query) == expected, query
+
+
+def test_filter_results_are_invalidated(store):
+    assert store.filter("replay") == full_scan(store, "replay")
+    id = store.filter("replay")[0]
+    store.update(id, dataclasses.replace(store[id], label="Other"))
+    assert id not in store.filter("replay")
+    assert store.filter("replay ") == full_scan(store, "replay ")
+
+    new_id = store.add(dataclasses.replace(store[id], label="Replay again"))
+    assert store.filter("replay")[-1] == new_id
+    store.remove(new_id)
+    assert new_id not in store.filter("replay") and new_id not in store.filter("replay a")
+
+
+def test_empty_filter_returns_a_copy(store):
+    ids = store.filter("")
+    ids.clear()
+    assert len(store.filter("  ")) == len(store) == len(store.ids())
+
+
+def test_labels_are_reindexed(store):
+    id = store.find("EWC 0")[0]
+    entry = store[id]
+    store.update(id, dataclasses.replace(entry, label="Renamed"))
+    assert store.find("EWC 0") == [] and store.find("Renamed") == [id]
+    assert store.filter("renamed") == [id]
+
+    other = store.add(dataclasses.replace(entry, label="Renamed"))
+    assert store.find("Renamed") == [id, other]
+    store.remove(id)
+    assert store.find("Renamed") == [other]
+    assert id not in store and store.index(other) == len(store) - 1
+
+
+def test_update_remove_clear(store):
+    ids = store.ids()
+    n, version = len(store), store.version
+    first, second = ids[0], ids[1]
+    entry = dataclasses.replace(store[second], label="Updated")
+    store.update(second, entry)
+    assert store[second] is entry and store.index(second) == 1 and store.version > version
+
+    assert store.remove(first).label == "EWC 0"
+    assert first not in store and len(store) == n - 1 and store.index(second) == 0
+    assert store.entries()[0] is entry
+    with pytest.raises(KeyError):
+        store.remove(first)
+
+    # IDs are never reused
+    assert store.add(entry) == n
+    store.clear()
+    assert len(store) == 0 and store.ids() == [] and store.find("Updated") == []
+    assert store.filter("") == [] and store.filter("updated") == []
+    assert store.add(entry) == n + 1
+
+
+@pytest.fixture
+def tk_root():
+    tkinter = pytest.importorskip("tkinter")
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        pytest.skip("No display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+
+def test_virtual_listbox(store, tk_root):
+    from gui_utils import VirtualListbox
+
+    selected = []
+    listbox = VirtualListbox(tk_root, lambda id: store[id].label, selected.append, height=5)
+    listbox.set_keys(store.ids())
+    assert listbox.listbox.get(0, "end") == tuple(e.label for e in store.entries()[:5])
+
+    listbox.scroll(10)
+    assert listbox.first == 10 and listbox.listbox.get(0) == store.entries()[10].label
+    listbox.scroll(1000)
+    assert listbox.first == len(store) - 5
+
+    ids = store.filter("replay")
+    listbox.select(ids[-1])
+    listbox.set_keys(ids)
+    assert listbox.listbox.get(0, "end") == tuple(store[id].label for id in ids[-5:])
+    assert listbox.listbox.curselection() == (4,)
+    listbox._move(-1)
+    assert selected == [ids[-2]]
@@ -0,0 +1,42 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import ROOT
+from method_index import MethodIndex, parse_conditions
+
+
+@pytest.fixture
+def index(tmp_path):
+    methods_dir = tmp_path / "methods"
+    shutil.copytree(os.path.join(ROOT, "methods"), methods_dir)
+    index = MethodIndex(str(methods_dir))
+    index.update()
+    yield index
+    index.close()
+
+
+def test_parse_conditions():
+    assert parse_conditions(["federated=supervised", "forgetting=yes"]) == {
+        "federated": 1,
+        "forgetting": 1,
+    }
+    assert parse_conditions(["online=0,2", "forgetting=False"]) == {
+        "online": [0, 2],
+        "forgetting": 0,
+    }
+    for condition in ["forgetting=yes!", "forgetting=", "forgetting=2", "online=3", "online=x"]:
+        with pytest.raises(ValueError):
+            parse_conditions([condition])
+    with pytest.raises(ValueError, match="Unknown attribute"):
+        parse_conditions(["unknown=1"])
+
+
+def test_label_wildcards_are_literal(index):
+    labels = [e.label for e in index.query()]
+    assert len(labels) == 5
+    assert [e.label for e in index.query(label="vcl")] == ["VCL (Nguyen et al., 2018)"]
+    assert index.query(label="%") == [] and index.query(label="_") == []
+    assert index.count(label="V_L") == 0
+
@@ -0,0 +1,270 @@
+"""MethodSync against a local stand-in of the GitHub contents API."""
+import io
+import json
+import os
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import method_sync
+from conftest import ROOT
+from method_sync import MethodSync, git_blob_sha
+
+
+class ContentsAPI(object):
+    """
+    Serves the directory methods (with a subdirectory sub) of the repository o/r. The API is
+    reached as 127.0.0.1 and the raw files as localhost, i.e. the same server under two hosts.
+    """
+
+    def __init__(self):
+        self.files = {"a.json": b'{"a": 1}', "b.json": b'{"b": 1}', "sub/c.json": b'{"c": 1}'}
+        self.missing = {"gone.json"}  # Listed, but their download fails
+        self.failing = {}  # Path -> number of 500 responses before the file is served
+        self.requests = []  # (host, path, headers)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.port = self.server.server_address[1]
+        self.api_base = f"http://127.0.0.1:{self.port}"
+        serve = lambda: self.server.serve_forever(poll_interval=0.01)
+        threading.Thread(target=serve, daemon=True).start()
+
+    def listing(self, directory):
+        items = []
+        for path in sorted(set(self.files) | self.missing):
+            parent, _, name = path.rpartition("/")
+            if parent == directory:
+                data = self.files.get(path, b"")
+                items.append(self._file(path, name, git_blob_sha(data)))
+        if directory == "":
+            url = f"{self.api_base}/repos/o/r/contents/methods/sub?ref=master"
+            items.append({"type": "dir", "name": "sub", "path": "methods/sub", "url": url})
+        return json.dumps(items).encode("utf-8")
+
+    def _file(self, path, name, sha):
+        # a.json is downloaded through a redirect of the API host
+        host = "127.0.0.1" if name == "a.json" else "localhost"
+        return {
+            "type": "file",
+            "name": name,
+            "path": "methods/" + path,
+            "sha": sha,
+            "download_url": f"http://{host}:{self.port}/raw/{path}",
+        }
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                host = self.headers["Host"].split(":")[0]
+                api.requests.append((host, self.path, dict(self.headers)))
+                path = self.path.split("?")[0]
+                if path.startswith("/repos/o/r/contents/methods"):
+                    directory = path[len("/repos/o/r/contents/methods") :].strip("/")
+                    body = api.listing(directory)
+                    etag = '"%s"' % git_blob_sha(body)
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.reply(304, b"")
+                    return self.reply(200, body, ETag=etag)
+                if not path.startswith("/raw/"):
+                    return self.reply(404, b"")
+                name = path[len("/raw/") :]
+                if host == "127.0.0.1":
+                    location = f"http://localhost:{api.port}{path}"
+                    return self.reply(302, b"", Location=location)
+                if api.failing.get(name):
+                    api.failing[name] -= 1
+                    return self.reply(500, b"")
+                if name not in api.files:
+                    return self.reply(404, b"")
+                data = api.files[name]
+                etag = '"%s"' % git_blob_sha(data)
+                if self.headers.get("If-None-Match") == etag:
+                    return self.reply(304, b"")
+                self.reply(200, data, ETag=etag)
+
+            def reply(self, status, body, **headers):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKEN", "secret")
+    api = ContentsAPI()
+    yield api
+    api.server.shutdown()
+    api.server.server_close()
+
+
+def sync(api, output_dir):
+    return MethodSync(
+        "https://github.com/o/r/tree/master/methods",
+        output_dir=str(output_dir),
+        api_base=api.api_base,
+        workers=2,
+        max_retries=2,
+        max_wait=0,
+    ).sync()
+
+
+def test_sync(api, tmp_path):
+    api.failing["b.json"] = 1  # Retried
+    result = sync(api, tmp_path)
+    assert sorted(result.downloaded) == ["a.json", "b.json", os.path.join("sub", "c.json")]
+    assert result.failed == ["gone.json"]
+    for path, data in api.files.items():
+        with open(tmp_path / path, "rb") as f:
+            assert f.read() == data
+
+    # The token is sent to the API host only, not to download hosts or redirect targets
+    assert api.requests
+    for host, path, headers in api.requests:
+        assert (headers.get("Authorization") == "Bearer secret") == (host == "127.0.0.1"), path
+    assert any(path == "/raw/a.json" and host == "localhost" for host, path, _ in api.requests)
+
+
+def test_unchanged_files_are_skipped(api, tmp_path):
+    api.missing.clear()
+    sync(api, tmp_path)
+    api.requests.clear()
+    result = sync(api, tmp_path)
+    assert result.downloaded == [] and len(result.unchanged) == 3
+    # Both listings are validated by their ETag, files are skipped by their SHA without a request
+    assert [path for _, path, _ in api.requests] == [
+        "/repos/o/r/contents/methods?ref=master",
+        "/repos/o/r/contents/methods/sub?ref=master",
+    ]
+    assert all(headers.get("If-None-Match") for _, _, headers in api.requests)
+
+    api.files["b.json"] = b'{"b": 2}'
+    api.requests.clear()
+    result = sync(api, tmp_path)
+    assert result.downloaded == ["b.json"]
+    assert [path for _, path, _ in api.requests if path.startswith("/raw/")] == ["/raw/b.json"]
+
+
+def test_existing_files_are_adopted(api, tmp_path):
+    api.missing.clear()
+    os.makedirs(tmp_path / "sub")
+    for path, data in api.files.items():
+        with open(tmp_path / path, "wb") as f:
+            f.write(data)
+    result = sync(api, tmp_path)
+    assert result.downloaded == [] and len(result.unchanged) == 3
+    with open(tmp_path / method_sync.MANIFEST) as f:
+        assert sorted(json.load(f)["files"]) == ["a.json", "b.json", "sub/c.json"]
+
+
+def test_manifest_is_written_at_intervals(api, tmp_path, monkeypatch):
+    api.missing.clear()
+    writes = []
+    write_atomic = method_sync._write_atomic
+
+    def count_writes(path, data):
+        if path.endswith(method_sync.MANIFEST):
+            writes.append(path)
+        write_atomic(path, data)
+
+    monkeypatch.setattr(method_sync, "_write_atomic", count_writes)
+    monkeypatch.setattr(method_sync, "MANIFEST_SAVE_INTERVAL", 3600)
+    sync(api, tmp_path)
+    # After the listing and at the end, not per file
+    assert len(writes) == 2
+    with open(tmp_path / method_sync.MANIFEST) as f:
+        assert len(json.load(f)["files"]) == 3
+
+
+def test_failed_listing(api, tmp_path):
+    with pytest.raises(method_sync.SyncError):
+        MethodSync(
+            "https://github.com/o/missing/tree/master/methods",
+            output_dir=str(tmp_path),
+            api_base=api.api_base,
+            max_retries=0,
+        ).sync()
+
+
+def make_archive(path, files):
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_member_path():
+    assert method_sync._member_path("r-1a2b/methods/a.json", "methods") == "a.json"
+    assert method_sync._member_path("r-1a2b/methods/sub/a.json", "methods") == "sub/a.json"
+    assert method_sync._member_path("r-1a2b/other/a.json", "methods") is None
+    assert method_sync._member_path("r-1a2b/methods/a.txt", "methods") is None
+    assert method_sync._member_path("r-1a2b/methods/../a.json", "methods") is None
+    # Without subdir, paths are relative to the top-level directory
+    assert method_sync._member_path("r-1a2b/a.json", "") == "a.json"
+    assert method_sync._member_path("r-1a2b/methods/a.json", "") == "methods/a.json"
+    assert method_sync._member_path("a.json", "") == "a.json"
+
+
+def test_ingest_archive(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(method_sync, "MAX_MEMBER_SIZE", 5000)
+    with open(os.path.join(ROOT, "examples", "compass_data_3.json"), "rb") as f:
+        valid = f.read()
+    archive = str(tmp_path / "r.tar.gz")
+    make_archive(
+        archive,
+        {
+            "r-1a2b/methods/a.json": valid,
+            "r-1a2b/methods/large.json": b" " * 5001,
+            "r-1a2b/methods/broken.json": b"{",
+            "r-1a2b/README.md": b"",
+        },
+    )
+    output_dir = str(tmp_path / "methods")
+    ingested, invalid = method_sync.ingest_archive(archive, output_dir, "methods")
+    assert ingested == ["a.json"] and sorted(invalid) == ["broken.json", "large.json"]
+    out = capsys.readouterr().out
+    assert "✘ large.json: too large" in out and "✘ broken.json: invalid" in out
+    assert os.listdir(output_dir) == ["a.json"]
+
+
+def test_interrupted_swap_is_recovered(tmp_path, monkeypatch):
+    target = tmp_path / "methods"
+    new = tmp_path / "new"
+    for path, name in [(target, "old.json"), (new, "new.json")]:
+        path.mkdir()
+        (path / name).write_text("{}")
+
+    # The process dies between the two renames: the old library is left in its backup
+    rename = os.rename
+
+    def rename_and_die(src, dst):
+        rename(src, dst)
+        raise SystemExit(1)
+
+    monkeypatch.setattr(os, "rename", rename_and_die)
+    with pytest.raises(SystemExit):
+        method_sync._swap_directory(str(new), str(target))
+    monkeypatch.setattr(os, "rename", rename)
+    assert not target.exists()
+
+    method_sync._recover_directory(str(target))
+    assert os.listdir(target) == ["old.json"]
+    assert not os.path.exists(method_sync._backup_path(str(target)))
+
+    # A completed swap whose backup was not removed
+    method_sync._swap_directory(str(new), str(target))
+    os.mkdir(method_sync._backup_path(str(target)))
+    MethodSync(output_dir=str(target), api_base="http://127.0.0.1:1")
+    assert os.listdir(target) == ["new.json"]
+    assert not os.path.exists(method_sync._backup_path(str(target)))
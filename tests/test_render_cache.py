@@ -0,0 +1,167 @@
+import os
+import threading
+
+import pytest
+
+import render_cache
+from render_cache import RenderCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(str(tmp_path / "cache"), max_bytes=1000, max_entries=4)
+
+
+def artifacts(cache):
+    return sorted(os.path.basename(path) for _, _, path in cache._scan())
+
+
+def age(cache, key, fmt, seconds):
+    """Set the access time of an artifact to seconds in the past."""
+    path = cache.path(key, fmt)
+    t = os.stat(path).st_mtime - seconds
+    os.utime(path, (t, t))
+
+
+def test_key_is_stable():
+    # Keys address artifacts shared between processes and versions, they must never change
+    assert RenderCache.key("abc", "svg") == (
+        "427e1f0a46778befe4a28089719b4f4502ca6c7ed8415812c4656601e6bfc573"
+    )
+    assert RenderCache.key(b"abc", "png", 300) == (
+        "feab4c88221edce1ac0002af2da585dda133a0aa9cc229e29cc4abbd65c0d7e9"
+    )
+    assert RenderCache.key("abc", "svg") == RenderCache.key(b"abc", "svg")
+    keys = {
+        RenderCache.key("abc", "svg"),
+        RenderCache.key("abc", "png"),
+        RenderCache.key("abc", "png", 300),
+        RenderCache.key("abd", "svg"),
+    }
+    assert len(keys) == 4
+
+
+def test_put_get(cache):
+    assert cache.get("ab12", "svg") is None
+    cache.put("ab12", "svg", "<svg/>")
+    assert cache.get("ab12", "svg") == b"<svg/>"
+    assert cache.get("ab12", "png") is None
+    assert cache.path("ab12", "svg").endswith(os.path.join("ab", "ab12.svg"))
+
+
+def test_atomic_writes(cache):
+    cache.put("ab12", "png", b"x" * 100)
+    # No temporary files are left behind, neither after a write nor after a failed one
+    assert os.listdir(os.path.dirname(cache.path("ab12", "png"))) == ["ab12.png"]
+
+    with pytest.raises(TypeError):
+        cache.put("ab13", "png", object())
+    assert os.listdir(os.path.dirname(cache.path("ab12", "png"))) == ["ab12.png"]
+
+
+def test_concurrent_readers_never_see_partial_artifacts(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=1 << 30, max_entries=100)
+    versions = [bytes([i]) * (1 << 20) for i in range(8)]
+    seen = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            data = cache.get("cd34", "png")
+            if data is not None:
+                seen.append(data in versions)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for _ in range(5):
+        for data in versions:
+            cache.put("cd34", "png", data)
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert seen and all(seen)
+
+
+def test_lru_eviction_by_entries(cache):
+    for i, key in enumerate(["aa01", "bb02", "cc03", "dd04"]):
+        cache.put(key, "svg", b"x")
+        age(cache, key, "svg", 100 - i)
+    # Reading marks an artifact as recently used
+    assert cache.get("aa01", "svg") == b"x"
+    cache.put("ee05", "svg", b"x")
+    assert artifacts(cache) == ["aa01.svg", "cc03.svg", "dd04.svg", "ee05.svg"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_eviction_by_bytes(cache):
+    cache.put("aa01", "png", b"x" * 400)
+    age(cache, "aa01", "png", 100)
+    cache.put("bb02", "png", b"x" * 400)
+    age(cache, "bb02", "png", 50)
+    cache.put("cc03", "png", b"x" * 400)
+    assert artifacts(cache) == ["bb02.png", "cc03.png"]
+    # Overwriting an artifact does not count twice
+    cache.put("cc03", "png", b"x" * 500)
+    assert artifacts(cache) == ["bb02.png", "cc03.png"]
+
+
+def test_puts_do_not_scan_below_the_limits(cache, monkeypatch):
+    cache.put("aa01", "svg", b"x")  # The first write scans once to initialize the estimate
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda: scans.append(1) or scan())
+    cache.put("bb02", "svg", b"x")
+    cache.put("cc03", "svg", b"x")
+    cache.put("bb02", "svg", b"y")
+    assert scans == []
+    cache.put("dd04", "svg", b"x")
+    cache.put("ee05", "svg", b"x")  # Crosses max_entries
+    assert scans == [1]
+    assert len(artifacts(cache)) == 4
+
+
+def test_artifacts_of_other_processes_are_counted(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_cache, "RESCAN_PUTS", 3)
+    cache = RenderCache(str(tmp_path), max_bytes=1 << 20, max_entries=4)
+    other = RenderCache(str(tmp_path), max_bytes=1 << 20, max_entries=100)
+    cache.put("aa01", "svg", b"x")
+    for key in ["bb02", "cc03", "dd04", "ee05"]:
+        other.put(key, "svg", b"x")
+    cache.put("ff06", "svg", b"x")
+    cache.put("ff07", "svg", b"x")
+    assert len(artifacts(cache)) == 7  # Within the estimate of this process
+    cache.put("ff08", "svg", b"x")  # RESCAN_PUTS writes since the last scan
+    assert len(artifacts(cache)) == 4
+
+
+def test_stats_and_clear(cache):
+    cache.put("aa01", "svg", b"12345")
+    cache.get("aa01", "svg")
+    cache.get("bb02", "svg")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert (stats["entries"], stats["bytes"]) == (1, 5)
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.get("aa01", "svg") is None
+
+
+def test_formats_are_not_evicted(cache):
+    fmt = os.path.join(cache.cache_dir, "formats", "compass-1234.fmt")
+    os.makedirs(os.path.dirname(fmt))
+    with open(fmt, "wb") as f:
+        f.write(b"x" * 2000)
+    for key in ["aa01", "bb02", "cc03", "dd04", "ee05"]:
+        cache.put(key, "svg", b"x")
+    assert len(artifacts(cache)) == 4
+    cache.clear()
+    assert os.path.exists(fmt)
+
+
+def test_get_or_render(cache):
+    calls = []
+    render = lambda: calls.append(1) or "<svg/>"
+    assert cache.get_or_render("aa01", "svg", render) == b"<svg/>"
+    assert cache.get_or_render("aa01", "svg", render) == b"<svg/>"
+    assert calls == [1]
@@ -0,0 +1,108 @@
+import json
+import os
+import pickle
+import socket
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import render_server
+import tikz2svg
+from conftest import TEMPLATE_PATH, make_entries
+from entry_loader import entry_to_json
+from render_cache import RenderCache
+from render_server import RenderFailed, RenderService, make_server
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # Worker processes use the default cache
+    monkeypatch.setenv("CLEVA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("render_cache._default_cache", None)
+    service = RenderService(TEMPLATE_PATH, workers=1, cache=RenderCache(str(tmp_path)))
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def post(server, query, entries):
+    body = json.dumps({"entries": [entry_to_json(e) for e in entries]}).encode("utf-8")
+    url = f"http://127.0.0.1:{server.server_address[1]}/render?{query}"
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, body), timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())["error"]
+
+
+def test_render(server):
+    status, data = post(server, "format=tex", make_entries(3))
+    assert status == 200 and b"\\begin{tikzpicture}" in data
+    status, data = post(server, "format=svg&renderer=native", make_entries(3))
+    assert status == 200 and b"<svg" in data
+    status, error = post(server, "format=gif", make_entries(3))
+    assert status == 400 and "Unknown format" in error
+    status, error = post(server, "format=tex&renderer=native", make_entries(3))
+    assert status == 400 and "cannot produce tex" in error
+    for width in ["0", "-10"]:
+        status, error = post(server, "format=png&width=" + width, make_entries(3))
+        assert status == 400 and "Invalid width" in error
+    status, error = post(server, "format=png&width=x", make_entries(3))
+    assert status == 400 and error.startswith("ValueError")
+
+
+def test_invalid_content_length(server):
+    for length in ["-1", "abc", "1e3", "١٢"]:
+        with socket.create_connection(server.server_address, timeout=10) as sock:
+            request = f"POST /render HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n"
+            sock.sendall(request.encode("utf-8"))
+            response = sock.makefile("rb").read()
+        assert response.startswith(b"HTTP/1.1 400 ") and b"Invalid Content-Length" in response
+
+
+def test_failed_render_fails_only_its_request(server):
+    entries = make_entries(2)
+    entries[0].label = "\\undefinedcommand"
+    # LaTeX rejects the label, or the toolchain is not installed
+    status, error = post(server, "format=pdf", entries)
+    assert status in (422, 500) and error.startswith("CompileError: ")
+    status, _ = post(server, "format=tex", make_entries(2))
+    assert status == 200
+    status, _ = post(server, "format=svg&renderer=native", make_entries(2))
+    assert status == 200
+    assert server.RequestHandlerClass.service.stats()["restarts"] == 0
+
+
+def test_render_errors(monkeypatch):
+    result = tikz2svg.RunResult("pdflatex", 1, 0.5, b"! Undefined control sequence.\n", b"")
+    options = render_server.RenderOptions("pdf")
+    for error, status in [
+        (tikz2svg.CompileError(result), 422),
+        (tikz2svg.CompileError(tikz2svg.RunResult("pdflatex", 127, 0.0, b"", b"")), 500),
+        (tikz2svg.CompileError(tikz2svg.RunResult("pdflatex", -9, 1, b"", b"", True)), 504),
+        (OSError("disk full"), 500),
+    ]:
+
+        def render_entries(*args, **kwargs):
+            raise error
+
+        monkeypatch.setattr(render_server, "render_entries", render_entries)
+        failed = pickle.loads(pickle.dumps(render_server._render([], options, TEMPLATE_PATH)))
+        assert isinstance(failed, RenderFailed) and failed.status == status
+        assert failed.message.startswith(type(error).__name__)
+
+
+def test_pool_is_restarted(server):
+    service = server.RequestHandlerClass.service
+    # Kill the worker process, which breaks the pool
+    with pytest.raises(BrokenProcessPool):
+        service._pool.submit(os._exit, 1).result(60)
+    status, _ = post(server, "format=tex", make_entries(2))
+    assert status == 200
+    assert service.stats()["restarts"] == 1
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import make_entries
+from corpus import Corpus
+from similarity import ProfileIndex, ProfileMetric, nearest, profile
+
+
+def clustered_entries(n, seed):
+    """Entries sharing a few profiles, so that many distances tie."""
+    base = make_entries(4, seed=seed)
+    rng = random.Random(seed)
+    return [rng.choice(base) for _ in range(n)]
+
+
+@pytest.mark.parametrize(
+    "metric",
+    [ProfileMetric(), ProfileMetric(outer_weight=0.5, partial=0.25), ProfileMetric(outer_weight=3)],
+)
+def test_index_search_equals_nearest(metric):
+    rng = random.Random(0)
+    for seed in range(4):
+        entries = make_entries(300, seed=seed) + clustered_entries(300, seed)
+        corpus = Corpus.from_entries(entries)
+        index = ProfileIndex(corpus, metric)
+        queries = make_entries(10, seed=100 + seed) + rng.sample(entries, 10)
+        for query in queries:
+            for k in [0, 1, 5, 50, len(corpus)]:
+                rows, distances = nearest(corpus, query, k, metric)
+                index_rows, index_distances = index.search(query, k)
+                # Same rows in the same order, ties included
+                assert index_rows.tolist() == rows.tolist()
+                assert index_distances.tolist() == distances.tolist()
+
+        row = rng.randrange(len(corpus))
+        rows, distances = nearest(corpus, entries[row], 10, metric, exclude=row)
+        index_rows, index_distances = index.search(entries[row], 10, exclude=row)
+        assert row not in index_rows
+        assert index_rows.tolist() == rows.tolist()
+        assert index_distances.tolist() == distances.tolist()
+
+
+def test_distances_agree(entries):
+    metric = ProfileMetric(outer_weight=0.5)
+    corpus = Corpus.from_entries(entries)
+    for query in entries:
+        distances = metric.distances(corpus.inner, corpus.outer, profile(query))
+        expected = [metric.distance(profile(query), profile(e)) for e in entries]
+        assert np.allclose(distances, expected)
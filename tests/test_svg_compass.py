@@ -0,0 +1,181 @@
+"""The native SVG geometry must match the TikZ code of cleva_template.tex and create_compass."""
+import math
+import re
+
+import pytest
+
+import svg_compass
+from conftest import make_entries
+from create_compass import A, B, fill_template
+from svg_compass import CM
+
+TOLERANCE = 0.01  # bp, the SVG coordinates are written with three decimals
+NUMBER = r"-?\d+(?:\.\d+)?"
+
+
+@pytest.fixture(scope="module")
+def template():
+    with open(svg_compass.__file__.replace("svg_compass.py", "cleva_template.tex")) as f:
+        return f.read()
+
+
+def cm(value):
+    """Length of a TeX dimension in cm."""
+    number, unit = re.fullmatch(r"(-?[\d.]+)\s*(cm|mm)", value.strip()).groups()
+    return float(number) / (10 if unit == "mm" else 1)
+
+
+def to_polar(x, y):
+    """Inverse of svg_compass.polar: (angle in [0, 360), radius in cm)."""
+    return math.degrees(math.atan2(-y, x)) % 360, math.hypot(x, y) / CM
+
+
+def path_points(d):
+    """End points of all commands of an SVG path (arc radii and flags are skipped)."""
+    points = []
+    for command in re.findall(r"[MLA][^MLAZ]*", d):
+        coordinates = re.findall(f"({NUMBER}),({NUMBER})", command)
+        x, y = coordinates[-1]
+        points.append((float(x), float(y)))
+    return points
+
+
+def flatten(points):
+    return [c for p in points for c in p]
+
+
+def same_angle(a, b):
+    return abs((a - b + 180) % 360 - 180) < 1e-3
+
+
+def test_template_lengths(template):
+    assert float(re.search(r"\\newcommand{\\U}{(\d+)}", template).group(1)) == svg_compass.U
+    assert cm(re.search(r"\\R=([\d.]+cm)", template).group(1)) == svg_compass.R
+    assert cm(re.search(r"\\L=([\d.]+cm)", template).group(1)) == svg_compass.L
+    assert cm(re.search(r"\\Instrip}{([\d.]+cm)}", template).group(1)) == svg_compass.INSTRIP
+    assert cm(re.search(r"\\Outstrip}{([\d.]+cm)}", template).group(1)) == svg_compass.OUTSTRIP
+    assert cm(re.search(r"#1-([\d.]+mm)", template).group(1)) == svg_compass.STRIP_HALF_WIDTH
+    assert cm(re.search(r"below=([\d.]+cm) of center", template).group(1)) == (
+        svg_compass.LEGEND_OFFSET
+    )
+
+
+@pytest.mark.parametrize("n", [1, 3, 7, 20])
+def test_outer_strips(n, template_path):
+    entries = make_entries(n, seed=n)
+    tex = fill_template(template_path, entries)
+    strips = re.findall(
+        rf"\\pic at \(0,0\){{strip={{\\Instrip,({NUMBER}),({NUMBER}),(\w+)shell, black, {{}}}}}};",
+        tex,
+    )
+    out = []
+    svg_compass.draw_outer_level(out, entries)
+    paths = re.findall(r'<path d="([^"]+)"/>', "\n".join(out))
+    assert len(paths) == len(strips) == sum(sum(e.outer_level) for e in entries)
+
+    # Both emit the strips in entry order and then attribute order
+    for (start, end, color), d in zip(strips, paths):
+        start, end = float(start), float(end)
+        p_start, p_end, p_mid_end, p_out_end, p_out_start, p_mid_start = path_points(d)
+        (a_start, r_in), (a_end, r_in_end) = to_polar(*p_start), to_polar(*p_end)
+        # The lower half of the TikZ strips runs backwards, which draws the same shape
+        assert (same_angle(a_start, start) and same_angle(a_end, end)) or (
+            same_angle(a_start, end) and same_angle(a_end, start)
+        )
+        half = svg_compass.STRIP_HALF_WIDTH
+        assert r_in == pytest.approx(svg_compass.INSTRIP - half, abs=TOLERANCE / CM)
+        assert r_in_end == pytest.approx(svg_compass.INSTRIP - half, abs=TOLERANCE / CM)
+        assert to_polar(*p_mid_end)[1] == pytest.approx(svg_compass.INSTRIP, abs=TOLERANCE / CM)
+        assert to_polar(*p_out_end)[1] == pytest.approx(
+            svg_compass.INSTRIP + half, abs=TOLERANCE / CM
+        )
+        assert same_angle(to_polar(*p_out_start)[0], a_start)
+        assert same_angle(to_polar(*p_mid_start)[0], a_start)
+
+
+def test_strips_divide_measures_evenly(template_path):
+    entries = make_entries(4)
+    for e in entries:
+        for field in vars(e.outer_level):
+            setattr(e.outer_level, field, True)
+    tex = fill_template(template_path, entries)
+    angles = {float(a) for a in re.findall(rf"strip={{\\Instrip,({NUMBER}),", tex)}
+    angles |= {float(a) for a in re.findall(rf"strip={{\\Instrip,{NUMBER},({NUMBER}),", tex)}
+    assert sorted(angles) == pytest.approx([i * B / 4 for i in range(61)], abs=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_inner_polygons(seed, template_path):
+    entries = make_entries(5, seed=seed)
+    tex = fill_template(template_path, entries)
+    polygons = re.findall(r"\] ((?:\(D\d+-\d\) -- )+)cycle;", tex)
+    out = []
+    svg_compass.draw_inner_level(out, entries)
+    paths = re.findall(r'<path d="([^"]+)"', "\n".join(out))
+    assert len(polygons) == len(paths) == len(entries)
+
+    for polygon, d in zip(polygons, paths):
+        # (D<x>-<y>) is the coordinate (x*A : y*R/U) of the template
+        vertices = [
+            svg_compass.polar(int(x) * A, int(y) * svg_compass.R / svg_compass.U)
+            for x, y in re.findall(r"\(D(\d+)-(\d)\)", polygon)
+        ]
+        assert flatten(path_points(d)) == pytest.approx(flatten(vertices), abs=TOLERANCE)
+
+
+def test_dimension_labels(template):
+    nodes = re.findall(
+        r"\\path \((\d+)\*\\A:\\L\) node \(L\d+\)\s*\[([^\]]*)\]\s*{([^}]*)}", template
+    )
+    assert len(nodes) == len(svg_compass.DIMENSION_LABELS)
+
+    out = []
+    svg_compass.draw_background(out)
+    transform = rf"translate\(({NUMBER}),({NUMBER})\) rotate\(({NUMBER})\)"
+    texts = re.findall(rf'<text transform="{transform}">([^<]*)</text>', "\n".join(out))
+    assert len(texts) == len(nodes)
+    doffset = 3 * A - 90
+    for (i, options, text), label, (x, y, rotation, svg_text) in zip(
+        nodes, svg_compass.DIMENSION_LABELS, texts
+    ):
+        options = dict(o.strip().split("=", 1) for o in options.split(",") if o.strip())
+        xshift = float(options["xshift"].replace("ex", ""))
+        yshift = float(options["yshift"].replace("ex", ""))
+        rotate = options["rotate"].replace("\\Doffset", f"({doffset})").replace("\\A", f"{A}")
+        rotate = eval(rotate)
+        assert (text, xshift, yshift) == label[:3] == (svg_text, xshift, yshift)
+        assert label[3] == pytest.approx(rotate)
+
+        px, py = svg_compass.polar(int(i) * A, svg_compass.L)
+        assert float(x) == pytest.approx(px + xshift * svg_compass.EX, abs=TOLERANCE)
+        assert float(y) == pytest.approx(py - yshift * svg_compass.EX, abs=TOLERANCE)
+        assert float(rotation) == pytest.approx(-rotate, abs=TOLERANCE)
+
+
+def test_measure_labels(template):
+    strips = re.findall(
+        r"strip={\\Outstrip,\s*(\d+)\*\\B,\s*(\d+)\*\\B,whitecircle,black,\\nodefontsize ([^}]*)}",
+        template,
+    )
+    assert [text for _, _, text in strips] == svg_compass.MEASURE_LABELS
+
+    out = []
+    svg_compass.draw_measure_labels(out)
+    paths = re.findall(r'<path id="measure-(\d+)" fill="none" d="([^"]+)"/>', "\n".join(out))
+    assert len(paths) == len(strips)
+    for (start, end, _), (i, d) in zip(strips, paths):
+        assert svg_compass.label_angles(int(i)) == (int(start) * B, int(end) * B)
+        (a_start, r_start), (a_end, r_end) = [to_polar(*p) for p in path_points(d)]
+        assert same_angle(a_start, int(start) * B) and same_angle(a_end, int(end) * B)
+        assert r_start == pytest.approx(svg_compass.OUTSTRIP, abs=TOLERANCE / CM)
+        assert r_end == pytest.approx(svg_compass.OUTSTRIP, abs=TOLERANCE / CM)
+
+
+def test_legend_below_compass(entries):
+    cells, height = svg_compass.legend_layout(entries)
+    assert len(cells) == len(entries) and height > 0
+    # The legend node is placed 4.05cm below the center; every cell lies below it
+    assert all(y > svg_compass.LEGEND_OFFSET * CM for _, y, _ in cells)
+    # Three columns, in the order of the legend tabular of create_compass
+    assert [x for x, _, _ in cells[:3]] == sorted(x for x, _, _ in cells[:3])
+    assert [x for x, _, _ in cells[3:6]] == [x for x, _, _ in cells[:3]]
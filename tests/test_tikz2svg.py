@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import pickle
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+import tikz2svg
+
+
+@pytest.fixture
+def fake_format(tmp_path, monkeypatch):
+    """Let get_format() build empty formats in tmp_path, without a TeX installation."""
+    builds = []
+
+    def build_format(fmt):
+        builds.append(fmt)
+        os.makedirs(os.path.dirname(fmt), exist_ok=True)
+        open(fmt + ".fmt", "wb").close()
+
+    monkeypatch.setattr(tikz2svg.shutil, "which", lambda cmd: "/usr/bin/" + cmd)
+    monkeypatch.setattr(tikz2svg, "tex_version", lambda: "pdfTeX 3.14")
+    monkeypatch.setattr(tikz2svg, "build_format", build_format)
+    monkeypatch.setattr(tikz2svg, "_format", None)
+    monkeypatch.setenv("CLEVA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("render_cache._default_cache", None)
+    return builds
+
+
+def test_format_is_rebuilt_when_removed(fake_format, tmp_path):
+    fmt = tikz2svg.get_format()
+    assert fmt.startswith(str(tmp_path)) and fake_format == [fmt]
+    assert tikz2svg.get_format() == fmt and len(fake_format) == 1
+    os.remove(fmt + ".fmt")
+    assert tikz2svg.get_format() == fmt and len(fake_format) == 2
+    assert os.path.exists(fmt + ".fmt")
+
+
+def test_compile_error_pickles():
+    result = tikz2svg.RunResult(
+        "pdflatex", 1, 0.5, b"! Undefined control sequence.\nl.3 \\foo\n", b"", timed_out=True
+    )
+    error = pickle.loads(pickle.dumps(tikz2svg.CompileError(result)))
+    assert isinstance(error, tikz2svg.CompileError)
+    assert error.result == result
+    assert str(error) == str(tikz2svg.CompileError(result))
+    assert "timed out after 0.5 s" in str(error) and "Undefined control sequence" in str(error)
+
+
+FAKE_TOOLS = {
+    # The "PDF" is the document itself and the "SVG" wraps it, so outputs identify their input
+    "pdflatex": "#!/bin/sh\ncat > texput.pdf\n",
+    "pdf2svg": '#!/bin/sh\n{ echo "<svg>"; cat texput.pdf; echo "</svg>"; } > out.svg\n',
+}
+
+
+@pytest.fixture
+def fake_toolchain(tmp_path, monkeypatch):
+    """Replace pdflatex and pdf2svg by shell scripts and put all workspaces into tmp_path."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, script in FAKE_TOOLS.items():
+        path = bin_dir / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(tikz2svg, "_format", "")  # Compile without a precompiled format
+    workspaces = tmp_path / "tmp"
+    workspaces.mkdir()
+    monkeypatch.setattr(tikz2svg.tempfile, "tempdir", str(workspaces))
+    return workspaces
+
+
+def _compile(i):
+    return tikz2svg.tikz2svg("%% job " + str(i) + "\n\\begin{tikzpicture}\\end{tikzpicture}")
+
+
+def test_parallel_compiles(fake_toolchain, capsys):
+    with ThreadPoolExecutor(8) as pool:
+        svgs = list(pool.map(_compile, range(32)))
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("fork")) as pool:
+        svgs += list(pool.map(_compile, range(32, 48)))
+    for i, svg in enumerate(svgs):
+        assert svg.startswith("<svg>") and svg.count("% job ") == 1 and f"% job {i}\n" in svg
+    assert len(set(svgs)) == len(svgs)
+    # Every workspace was removed, and library code does not print
+    assert os.listdir(fake_toolchain) == []
+    assert capsys.readouterr().out == ""
+
+
+def _is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_run_timeout():
+    t0 = time.monotonic()
+    with pytest.raises(tikz2svg.CompileError, match="timed out") as e:
+        tikz2svg.run(["sleep", "30"], timeout=0.2)
+    assert e.value.result.timed_out and time.monotonic() - t0 < 5
+
+
+def test_run_kills_the_process_group():
+    # The shell prints the pid of its background child, which must be killed along with it
+    cmd = ["sh", "-c", "sleep 30 & echo $!; wait"]
+    with pytest.raises(tikz2svg.CompileError) as e:
+        tikz2svg.run(cmd, timeout=0.5, keep_stdout=True)
+    child = int(e.value.result.stdout)
+    for _ in range(100):
+        if not _is_running(child):
+            break
+        time.sleep(0.01)
+    assert not _is_running(child)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc")
+def test_run_memory_limit_counts_the_group():
+    # The memory is allocated by a child of the shell, not by the group leader
+    allocate = f"'{sys.executable}' -c 'import time; x = bytearray(200 << 20); time.sleep(30)'"
+    with pytest.raises(tikz2svg.CompileError, match="memory limit") as e:
+        tikz2svg.run(["sh", "-c", allocate + "; true"], timeout=20, memory_limit=100 << 20)
+    assert e.value.result.out_of_memory and not e.value.result.timed_out
+
+
+def test_run_cancellation():
+    event = threading.Event()
+    threading.Timer(0.2, event.set).start()
+    with tikz2svg.cancellable(event):
+        with pytest.raises(tikz2svg.CompileError, match="cancelled") as e:
+            tikz2svg.run(["sleep", "30"], timeout=20)
+    assert e.value.result.cancelled
+    # Outside the context, calls are not cancelled
+    assert tikz2svg.run(["true"]).returncode == 0
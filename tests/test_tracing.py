@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+
+import pytest
+
+import create_compass
+import tracing
+from conftest import ROOT, TEMPLATE_PATH
+
+
+@pytest.fixture
+def collector():
+    collector = tracing.Collector()
+    tracing.add_sink(collector)
+    yield collector
+    tracing.remove_sink(collector)
+
+
+def test_disabled_tracing_is_a_no_op():
+    assert not tracing.enabled()
+    before = tracing.counters()
+    with tracing.span("stage", entries=1) as span:
+        span.set(bytes_out=1)
+    assert span is tracing._NO_SPAN
+    tracing.count("hits")
+    assert tracing.counters() == before
+    assert tracing.traced("stage")(lambda x: x + 1)(1) == 2
+
+
+def test_spans_are_nested(collector):
+    @tracing.traced("outer")
+    def outer():
+        with tracing.span("inner", entries=3) as span:
+            span.set(bytes_out=10)
+            tracing.count("hits", 2)
+        with pytest.raises(KeyError):
+            with tracing.span("failing"):
+                raise KeyError()
+
+    outer()
+    spans = [r for r in collector.records if r["type"] == "span"]
+    assert [(r["name"], r["parent"]) for r in spans] == [
+        ("inner", "outer"),
+        ("failing", "outer"),
+        ("outer", None),
+    ]
+    assert spans[0]["entries"] == 3 and spans[0]["bytes_out"] == 10
+    assert spans[1]["error"] == "KeyError" and "error" not in spans[2]
+    assert all(r["duration"] >= 0 for r in spans)
+    assert spans[2]["duration"] >= spans[0]["duration"] + spans[1]["duration"]
+    counts = [(r["name"], r["value"]) for r in collector.records if r["type"] == "count"]
+    assert counts == [("hits", 2)]
+
+    # Every thread has its own stack of spans
+    def run():
+        with tracing.span("thread"):
+            pass
+
+    with tracing.span("main"):
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    assert [r["parent"] for r in collector.records if r["name"] == "thread"] == [None]
+
+
+def test_json_lines_sink(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    sink = tracing.JsonLinesSink(path)
+    tracing.add_sink(sink)
+    try:
+        threads = [
+            threading.Thread(target=lambda: [tracing.count("calls") for _ in range(100)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        with tracing.span("stage", entries=2):
+            pass
+        for thread in threads:
+            thread.join()
+    finally:
+        tracing.remove_sink(sink)
+        sink.close()
+
+    records = tracing.read_json_lines(path)
+    assert len(records) == 401
+    spans, counts = tracing.summarize(records)
+    assert counts == {"calls": 400}
+    assert spans["stage"]["calls"] == 1
+    assert [r["entries"] for r in records if r["type"] == "span"] == [2]
+
+
+def test_main_traces_filling_the_template(collector, tmp_path, monkeypatch):
+    data = os.path.join(ROOT, "examples", "compass_data_3.json")
+    output = str(tmp_path / "out.tex")
+    argv = ["create_compass.py", "--data", data, "--template", TEMPLATE_PATH, "--output", output]
+    monkeypatch.setattr(sys, "argv", argv)
+    assert create_compass.main(create_compass.parse_arguments()) == 0
+    spans = {r["name"]: r for r in collector.records if r["type"] == "span"}
+    assert spans["fill_template"]["parent"] == "write"
+    assert spans["fill_template"]["bytes_out"] == spans["write"]["bytes_out"] > 0
@@ -8,43 +8,65 @@
 # depends on:
 # - pdflatex: comes with your tex dist
 # - pdf2svg: brew install pdf2svg
+# - pdftoppm/pdftocairo: comes with poppler
 
 import os
+import re
 import sys
+import time
+import signal
 import hashlib
-import functools
+import collections
+import contextlib
+import io
+import shlex
+import shutil
+import tempfile
+import threading
+import subprocess
+from dataclasses import dataclass
 from subprocess import Popen, PIPE
-import pdf2image
 
+import tracing
 
-def deleteDir(dirPath):
-    deleteFiles = []
-    deleteDirs = []
-    for root, dirs, files in os.walk(dirPath):
-        for f in files:
-            deleteFiles.append(os.path.join(root, f))
-        for d in dirs:
-            deleteDirs.append(os.path.join(root, d))
-    for f in deleteFiles:
-        os.remove(f)
-    for d in deleteDirs:
-        os.rmdir(d)
-    os.rmdir(dirPath)
+
+# move to a private tmp directory because latex litters :(
+@contextlib.contextmanager
+def workspace():
+    """
+    Create a unique temporary directory for one compile job and remove it afterwards, also on
+    errors. Jobs pass it as cwd to the subprocesses instead of changing the process-wide working
+    directory, so that renders can run concurrently in threads and processes.
+    """
+    tmp_d = tempfile.mkdtemp(prefix="cleva-")
+    try:
+        with tracing.span("workspace", path=tmp_d):
+            yield tmp_d
+    finally:
+        shutil.rmtree(tmp_d, ignore_errors=True)
 
 
 class cmds(object):
     pdflatex = "pdflatex --shell-escape -file-line-error -interaction=nonstopmode --"
+    pdflatex_fmt = "pdflatex -fmt=%s --shell-escape -file-line-error -interaction=nonstopmode --"
+    pdflatex_ini = 'pdflatex -ini -interaction=nonstopmode -jobname=%s "&pdflatex" %s'
     pdf2svg = "pdf2svg texput.pdf out.svg"
+    # Rasterize the first page of a PDF read from stdin into a PNG written to stdout
+    pdftoppm = "pdftoppm -png -singlefile -f 1 -l 1 %s -"
+    pdftocairo = "pdftocairo -png -transp -singlefile -f 1 -l 1 %s - -"
 
 
-latex_doc = r"""
+# Part of the preamble that is dumped into the precompiled format (see build_format)
+latex_preamble = r"""
 \documentclass[tikz]{standalone}
 
 \usepackage{times}
 \usepackage{tikz}
 \usetikzlibrary{shapes}
 \usetikzlibrary{mindmap,shadows,backgrounds,decorations.pathmorphing, decorations.text,positioning}
-\usepackage{hyperref}
+"""
+
+latex_doc = latex_preamble + r"""\usepackage{hyperref}
 
 
 
@@ -56,54 +78,223 @@ latex_doc = r"""
     """
 
 
+# Default limits for a single toolchain call
+TIMEOUT = 120  # Wall-clock limit in seconds
+MEMORY_LIMIT = None  # Resident memory limit in bytes (Linux only)
+MAX_OUTPUT = 1024 * 1024  # Bytes of stdout/stderr kept per call
+
+# Default raster resolution and thumbnail width in pixels
+DPI = 200
+THUMBNAIL_WIDTH = 256
+
+# Lines reported by pdflatex for errors ('! ...' or 'file:line: ...' with -file-line-error)
+LATEX_ERROR = re.compile(r"^(! .*|[^\s:]+:\d+: .*)$", re.MULTILINE)
+
+
+@dataclass
+class RunResult:
+    """Structured result of a toolchain call."""
+
+    cmd: str
+    returncode: int
+    duration: float
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+    out_of_memory: bool = False
+    cancelled: bool = False
+
+    def log_tail(self, n_lines=20):
+        """Last lines of the combined output."""
+        log = (self.stdout + self.stderr).decode("utf-8", "replace")
+        return "\n".join(log.splitlines()[-n_lines:])
+
+    @property
+    def errors(self):
+        """LaTeX error lines parsed from the output."""
+        return LATEX_ERROR.findall(self.stdout.decode("utf-8", "replace"))
+
+
+class CompileError(Exception):
+    """Raised if a toolchain call fails, times out or exceeds its memory limit."""
+
+    def __init__(self, result):
+        self.result = result
+        if result.cancelled:
+            reason = "was cancelled"
+        elif result.timed_out:
+            reason = f"timed out after {result.duration:.1f} s"
+        elif result.out_of_memory:
+            reason = "exceeded the memory limit"
+        else:
+            reason = f"failed with exit code {result.returncode}"
+        details = "\n".join(result.errors) or result.log_tail()
+        msg = f"'{result.cmd}' {reason}"
+        if details:
+            msg += ":\n" + details
+        super().__init__(msg)
+
+    def __reduce__(self):
+        # Rebuild from the result when unpickled, e.g. when raised in a worker process
+        return type(self), (self.result,)
+
+
+class _TailBuffer(object):
+    """Collects the last max_bytes of a stream (everything if max_bytes is None)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.chunks = collections.deque()
+        self.size = 0
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.max_bytes is None:
+            return
+        while self.size - len(self.chunks[0]) >= self.max_bytes:
+            self.size -= len(self.chunks.popleft())
+
+    def getvalue(self):
+        data = b"".join(self.chunks)
+        return data if self.max_bytes is None else data[-self.max_bytes :]
+
+
+def _drain(stream, buffer):
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        buffer.append(chunk)
+    stream.close()
+
+
+def _feed(stream, data):
+    try:
+        stream.write(data)
+    except (BrokenPipeError, OSError):
+        # The process exited without reading all of its input, its exit code tells why
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+
+def _group_memory(pgid):
+    """
+    Resident memory of all processes in the process group pgid in bytes, or None if unavailable
+    (non-Linux). Children count too, e.g. the pdflatex started by a shell.
+    """
+    try:
+        pids = [pid for pid in os.listdir("/proc") if pid.isdigit()]
+    except OSError:
+        return None
+    total, found = 0, False
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+            # The fields after the command name, which may contain spaces and parentheses
+            fields = stat[stat.rindex(")") + 2 :].split()
+            if int(fields[2]) == pgid:
+                total += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+                found = True
+        except (OSError, ValueError, IndexError):
+            # The process exited meanwhile
+            continue
+    return total if found else None
+
+
+def _kill(p):
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except (OSError, AttributeError):
+        p.kill()
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def cancellable(event):
+    """
+    Cancel all toolchain calls of the current thread within this context once the threading.Event
+    event is set. A cancelled call kills its process and raises CompileError.
+    """
+    previous = getattr(_local, "cancel", None)
+    _local.cancel = event
+    try:
+        yield
+    finally:
+        _local.cancel = previous
+
+
 # util to run command in a subprocess, and communicate with it.
-def run(cmd, stdin=None, exit_on_error=True):
-    # print '>', cmd
-    p = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    if stdin:
-        p.stdin.write(stdin)
-        p.stdin.close()
-    p.wait()
-
-    # error out if necessary
-    if p.returncode != 0:
-        print(">", cmd)
-        print("Error.")
-        if p.stdout:
-            print("\n" * 5 + "-" * 20, "STDOUT")
-            print(p.stdout.read().decode())
-
-        if p.stderr:
-            print("\n" * 5 + "-" * 20, "STDERR")
-            print(p.stderr.read().decode())
-
-        if p.stdin:
-            print("-" * 20, "STDIN")
-            print(stdin.decode())
-
-        if exit_on_error:
-            sys.exit(p.returncode)
-
-    return p.stdout.read()
-
-
-# memoize with a file cache.
-def memoize_in_file(fn):
-    @functools.wraps(fn)
-    def memoized(*args, **kwds):
-        i = fn.__name__ + str(*args) + str(**kwds)
-        i = i.encode("utf-8")
-        h = hashlib.sha1(i).hexdigest()
-        if os.path.exists(h):
-            with open(h) as f:
-                return f.read()
-
-        out = fn(*args, **kwds)
-        with open(h, "w") as f:
-            f.write(out)
-        return out
-
-    return memoized
+def run(cmd, stdin=None, check=True, cwd=None, timeout=None, memory_limit=None, keep_stdout=False):
+    """
+    Run cmd, feeding stdin and draining stdout/stderr concurrently so that large outputs never
+    block the process. Only the tail of the output is kept, unless keep_stdout is set. The process
+    (group) is killed if it runs longer than timeout seconds or uses more than memory_limit bytes,
+    or if it is cancelled (see cancellable). Raises CompileError on failure if check is set.
+    """
+    cancel = getattr(_local, "cancel", None)
+    timeout = TIMEOUT if timeout is None else timeout
+    memory_limit = MEMORY_LIMIT if memory_limit is None else memory_limit
+    args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+    cmd_str = cmd if isinstance(cmd, str) else " ".join(cmd)
+
+    t0 = time.monotonic()
+    try:
+        p = Popen(
+            args, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=cwd, start_new_session=True
+        )
+    except OSError as e:
+        result = RunResult(cmd_str, 127, time.monotonic() - t0, b"", str(e).encode("utf-8"))
+        if check:
+            raise CompileError(result) from e
+        return result
+
+    stdout, stderr = _TailBuffer(None if keep_stdout else MAX_OUTPUT), _TailBuffer(MAX_OUTPUT)
+    threads = [
+        threading.Thread(target=_drain, args=(p.stdout, stdout), daemon=True),
+        threading.Thread(target=_drain, args=(p.stderr, stderr), daemon=True),
+        threading.Thread(target=_feed, args=(p.stdin, stdin or b""), daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    timed_out = out_of_memory = cancelled = False
+    while True:
+        try:
+            p.wait(timeout=0.05)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+        elif time.monotonic() - t0 > timeout:
+            timed_out = True
+        elif memory_limit is not None and (_group_memory(p.pid) or 0) > memory_limit:
+            out_of_memory = True
+        if timed_out or out_of_memory or cancelled:
+            _kill(p)
+            p.wait()
+            break
+
+    for t in threads:
+        t.join()
+    result = RunResult(
+        cmd_str,
+        p.returncode,
+        time.monotonic() - t0,
+        stdout.getvalue(),
+        stderr.getvalue(),
+        timed_out=timed_out,
+        out_of_memory=out_of_memory,
+        cancelled=cancelled,
+    )
+    if check and (result.returncode != 0 or timed_out or out_of_memory or cancelled):
+        raise CompileError(result)
+    return result
 
 
 # conversion functions
@@ -117,50 +308,211 @@ def tikz2tex(tikz):
         return tikz
 
 
-def tex2pdf(tex):
-    return run(cmds.pdflatex.split(" "), stdin=tex)
+def tex2pdf(tex, use_format=True, cwd=None, timeout=None, memory_limit=None):
+    """Compile tex into texput.pdf in the directory cwd. Raises CompileError on failure."""
+    fmt = get_format() if use_format else None
+    preamble = latex_preamble.encode("utf-8")
+    limits = dict(cwd=cwd, timeout=timeout, memory_limit=memory_limit)
+    with tracing.span("tex2pdf", bytes_in=len(tex)) as span:
+        if fmt is not None and tex.startswith(preamble):
+            # The preamble is already loaded from the format, continue right after it
+            cmd, tex = cmds.pdflatex_fmt % shlex.quote(fmt), tex[len(preamble) :]
+        else:
+            cmd = cmds.pdflatex
+        result = run(cmd, stdin=tex, **limits)
+        if tracing.enabled():
+            span.set(format=cmd != cmds.pdflatex, bytes_out=_file_size(cwd, "texput.pdf"))
+        return result
+
+
+def _file_size(cwd, name):
+    try:
+        return os.path.getsize(os.path.join(cwd or ".", name))
+    except OSError:
+        return None
+
+
+def tex_version():
+    """Identify the TeX installation by the pdflatex version and its installed format."""
+    version = subprocess.run(["pdflatex", "--version"], capture_output=True).stdout.decode(
+        "utf-8", "replace"
+    )
+    try:
+        system_fmt = subprocess.run(
+            ["kpsewhich", "-engine=pdftex", "pdflatex.fmt"], capture_output=True
+        ).stdout.decode().strip()
+    except OSError:
+        system_fmt = ""
+    if system_fmt:
+        version += "%s %s" % (system_fmt, os.path.getmtime(system_fmt))
+    return version
 
 
-def pdf2svg():
-    run(cmds.pdf2svg)
-    with open("out.svg") as f:
-        return f.read()
+_format = None
+_format_lock = threading.Lock()
 
 
-def tikz2img(tikz):
-    curdir = os.getcwd()
-    tmp_d = chdir(tikz)
-    tex = tikz2tex(tikz)
-    tex2pdf(tex.encode("utf-8"))
-    image = pdf2image.convert_from_path("texput.pdf")
-    os.chdir(curdir)
-    deleteDir(tmp_d)
-    print(f"Removed tmp directory {tmp_d}")
-    image = image[0]
-    return image
-
-
-# @memoize_in_file
-def tikz2svg(tikz):
-    curdir = os.getcwd()
-    tmp_d = chdir(tikz)
-    tex = tikz2tex(tikz)
-    tex2pdf(tex.encode("utf-8"))
-    svg = pdf2svg()
-    os.chdir(curdir)
-    deleteDir(tmp_d)
-    print(f"Removed tmp directory {tmp_d}")
-    return svg
+def get_format(format_dir=None):
+    """
+    Return the path (without .fmt extension) of the precompiled format for latex_preamble. The
+    format is (re)built if the preamble or the TeX installation changed, or if it was removed.
+    Returns None if the format cannot be built, in which case documents are compiled with the
+    full preamble.
+
+    Only latex_preamble is dumped: the header of cleva_template.tex defines the number of methods
+    of each compass (\\M) and is therefore compiled with every document.
+    """
+    global _format
+    if format_dir is None and _format_ready():
+        return _format or None
+
+    with _format_lock:
+        if format_dir is None and _format_ready():
+            return _format or None
+        fmt = _get_format(format_dir)
+        _format = fmt
+        return fmt or None
 
 
-# move to tmp because latex litters :(
-def chdir(inp):
-    hash_dir = hashlib.sha1(inp.encode("utf-8")).hexdigest()
-    tmp_d = "/tmp/%s" % hash_dir
-    print(f"Compiling latex in {tmp_d}")
-    run("mkdir -p %s" % tmp_d, exit_on_error=False)
-    os.chdir(tmp_d)
-    return tmp_d
+def _format_ready():
+    """Whether the result of the last get_format() call can be used as is."""
+    return _format is not None and (_format == "" or os.path.exists(_format + ".fmt"))
+
+
+def _get_format(format_dir):
+    if shutil.which("pdflatex") is None:
+        return ""
+
+    if format_dir is None:
+        from render_cache import default_cache
+
+        format_dir = os.path.join(default_cache().cache_dir, "formats")
+
+    key = hashlib.sha1((latex_preamble + tex_version()).encode("utf-8")).hexdigest()
+    fmt = os.path.join(format_dir, "compass-" + key)
+    if not os.path.exists(fmt + ".fmt"):
+        try:
+            build_format(fmt)
+        except OSError:
+            fmt = ""
+    return fmt
+
+
+def build_format(fmt):
+    """Dump latex_preamble into the format file fmt + '.fmt'."""
+    print(f"Building LaTeX format {fmt}.fmt")
+    build_dir = tempfile.mkdtemp(prefix="cleva-fmt-")
+    try:
+        name = os.path.basename(fmt)
+        with open(os.path.join(build_dir, name + ".tex"), "w") as f:
+            f.write(latex_preamble + "\\dump\n")
+        run(cmds.pdflatex_ini % (name, name + ".tex"), check=False, cwd=build_dir)
+        built = os.path.join(build_dir, name + ".fmt")
+        if not os.path.exists(built):
+            raise OSError(f"Could not build LaTeX format {fmt}.fmt")
+
+        # Move into place atomically, so concurrent renders never load a partial format
+        os.makedirs(os.path.dirname(fmt), exist_ok=True)
+        tmp_fmt = fmt + ".fmt.%d.%d" % (os.getpid(), threading.get_ident())
+        shutil.copyfile(built, tmp_fmt)
+        os.replace(tmp_fmt, fmt + ".fmt")
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def pdf2svg(cwd=None, timeout=None):
+    """Convert texput.pdf in the directory cwd to SVG."""
+    with tracing.span("pdf2svg", bytes_in=_file_size(cwd, "texput.pdf")) as span:
+        run(cmds.pdf2svg, cwd=cwd, timeout=timeout)
+        with open(os.path.join(cwd or ".", "out.svg")) as f:
+            svg = f.read()
+        span.set(bytes_out=len(svg))
+        return svg
+
+
+def tikz2pdf(tikz, cache=None):
+    """Compile tikz code to a PDF, returned as bytes."""
+    with tracing.span("tikz2pdf", bytes_in=len(tikz)) as span:
+        tex = tikz2tex(tikz)
+        if cache is not None:
+            key = cache.key(tex, "pdf")
+            pdf = cache.get_or_render(key, "pdf", lambda: _tex2pdf_bytes(tex))
+        else:
+            pdf = _tex2pdf_bytes(tex)
+        span.set(bytes_out=len(pdf))
+        return pdf
+
+
+def _tex2pdf_bytes(tex):
+    with workspace() as tmp_d:
+        tex2pdf(tex.encode("utf-8"), cwd=tmp_d)
+        with open(os.path.join(tmp_d, "texput.pdf"), "rb") as f:
+            return f.read()
+
+
+def pdf2png(pdf, width=None, dpi=DPI, transparent=False, timeout=None):
+    """
+    Rasterize the first page of a PDF (bytes) into PNG bytes, either at the given width in pixels
+    (keeping the aspect ratio) or at dpi. The PDF and PNG are streamed through pipes of poppler.
+    """
+    size = f"-scale-to-x {int(width)} -scale-to-y -1" if width else f"-r {dpi}"
+    cmd = (cmds.pdftocairo if transparent else cmds.pdftoppm) % size
+    with tracing.span("pdf2png", bytes_in=len(pdf), width=width) as span:
+        png = run(cmd, stdin=pdf, timeout=timeout, keep_stdout=True).stdout
+        span.set(bytes_out=len(png))
+        return png
+
+
+def tikz2img(tikz, cache=None, transparent=False, width=None, dpi=DPI):
+    """
+    Render tikz code to a PIL image of the given width in pixels (or at dpi). Only the first page
+    is rasterized, directly at the requested size.
+    """
+    from PIL import Image
+
+    with tracing.span("tikz2img", bytes_in=len(tikz), width=width) as span:
+        if cache is not None:
+            # Cache the rasterized image as PNG
+            key = cache.key(tikz2tex(tikz), "png", dpi=(dpi, width, transparent))
+            png = cache.get_or_render(key, "png", lambda: _tikz2png(tikz, transparent, width, dpi))
+        else:
+            png = _tikz2png(tikz, transparent, width, dpi)
+        span.set(bytes_out=len(png))
+        image = Image.open(io.BytesIO(png))
+        image.load()
+        return image
+
+
+def tikz2thumbnail(tikz, cache=None, width=THUMBNAIL_WIDTH):
+    """Render tikz code to a small preview image, e.g. for a catalogue of methods."""
+    return tikz2img(tikz, cache=cache, width=width)
+
+
+def _tikz2png(tikz, transparent=False, width=None, dpi=DPI):
+    with workspace() as tmp_d:
+        tex2pdf(tikz2tex(tikz).encode("utf-8"), cwd=tmp_d)
+        with open(os.path.join(tmp_d, "texput.pdf"), "rb") as f:
+            pdf = f.read()
+    return pdf2png(pdf, width, dpi, transparent)
+
+
+def tikz2svg(tikz, cache=None):
+    with tracing.span("tikz2svg", bytes_in=len(tikz)) as span:
+        if cache is not None:
+            key = cache.key(tikz2tex(tikz), "svg")
+            svg = cache.get_or_render(key, "svg", lambda: _tikz2svg(tikz)).decode("utf-8")
+        else:
+            svg = _tikz2svg(tikz)
+        span.set(bytes_out=len(svg))
+        return svg
+
+
+def _tikz2svg(tikz):
+    tex = tikz2tex(tikz)
+    with workspace() as tmp_d:
+        tex2pdf(tex.encode("utf-8"), cwd=tmp_d)
+        svg = pdf2svg(cwd=tmp_d)
+    return svg
 
 
 def save_svg(svgcontent, filename):
@@ -168,18 +520,8 @@ def save_svg(svgcontent, filename):
         f.write(svgcontent)
 
 
-def compile2svg(tiks_code):
-    curdir = os.getcwd()
-    tmp_d = chdir(tiks_code)
+def compile2svg(tiks_code, outfile_name):
     svg_content = tikz2svg(tiks_code)
-    os.chdir(curdir)
-    deleteDir(tmp_d)
-    print(f"Removed tmp directory {tmp_d}")
-    try:
-        os.remove("out.svg")
-    except OSError:
-        pass
-    outfile_name = fileinput.filename().split(".")[0] + ".svg"
     save_svg(svg_content, outfile_name)
     print(f"Saved in {outfile_name}")
 
@@ -194,5 +536,9 @@ if __name__ == "__main__":
 
     lines = "".join([l for l in fileinput.input()])
     # compile2svg(lines)
-    image = tikz2img(lines)
+    try:
+        image = tikz2img(lines)
+    except CompileError as e:
+        print(e)
+        sys.exit(1)
     image.save("cleva_compass.png")
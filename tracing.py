@@ -0,0 +1,219 @@
+"""
+Lightweight tracing of the render pipeline.
+
+Stages are wrapped in spans, which record their duration and attributes such as the number of
+entries and the bytes in and out, and counters count events such as cache hits. Finished spans and
+counter increments are passed as records (dicts) to the registered sinks, e.g. a Collector in
+memory or a JsonLinesSink writing one JSON object per line. Without sinks, tracing is disabled and
+span() returns a shared no-op span, so instrumented code costs one function call and a check per
+stage.
+
+Setting the environment variable CLEVA_TRACE to a file name traces every process (e.g. the render
+workers of batch mode or the render service) into this JSON-lines file.
+
+Example:
+
+    with tracing.span("tex2pdf", bytes_in=len(tex)) as s:
+        pdf = compile(tex)
+        s.set(bytes_out=len(pdf))
+"""
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+_sinks = []
+_counters = collections.Counter()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enabled():
+    """Whether any sink is registered."""
+    return bool(_sinks)
+
+
+def add_sink(sink):
+    """Register sink, a function called with every record (a dict)."""
+    with _lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+class _NoSpan(object):
+    """Span returned while tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span(object):
+    """A timed stage. Attributes can be added with set() until the span ends."""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault("stack", [])
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        _local.stack.pop()
+        record = {
+            "type": "span",
+            "name": self.name,
+            "start": self.start,
+            "duration": duration,
+            "parent": self.parent,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            **self.attributes,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        for sink in list(_sinks):
+            sink(record)
+        return False
+
+
+def span(name, **attributes):
+    """Context manager timing the stage name, see the module docstring."""
+    if not _sinks:
+        return _NO_SPAN
+    return Span(name, attributes)
+
+
+def traced(name):
+    """Decorator wrapping every call of a function in a span."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1):
+    """Increment the counter name, if tracing is enabled."""
+    if not _sinks:
+        return
+    with _lock:
+        _counters[name] += value
+    record = {"type": "count", "name": name, "value": value, "pid": os.getpid()}
+    for sink in list(_sinks):
+        sink(record)
+
+
+def counters():
+    """Current values of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+class Collector(object):
+    """Sink keeping all records in memory."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+
+
+class JsonLinesSink(object):
+    """Sink appending every record as a line of JSON to a file. Safe to share between processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8")
+
+    def __call__(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            # One write per line, so that lines of concurrent processes do not interleave
+            self._f.write(line)
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def read_json_lines(path):
+    """Read the records written by a JsonLinesSink."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """
+    Number of calls and total, mean and maximum duration (s) per span name, and the sum of every
+    counter.
+    """
+    durations = collections.defaultdict(list)
+    counts = collections.Counter()
+    for record in records:
+        if record["type"] == "span":
+            durations[record["name"]].append(record["duration"])
+        else:
+            counts[record["name"]] += record["value"]
+    spans = {
+        name: {
+            "calls": len(values),
+            "total": sum(values),
+            "mean": sum(values) / len(values),
+            "max": max(values),
+        }
+        for name, values in durations.items()
+    }
+    return spans, dict(counts)
+
+
+def print_summary(records):
+    """Print the summary of the given records, slowest stages first, and the counters."""
+    spans, counts = summarize(records)
+    print(f"{'Stage':<32}{'calls':>8}{'total':>12}{'mean':>12}{'max':>12}")
+    for name, s in sorted(spans.items(), key=lambda item: -item[1]["total"]):
+        print(
+            f"{name:<32}{s['calls']:>8}{s['total'] * 1000:>9.1f} ms"
+            f"{s['mean'] * 1000:>9.1f} ms{s['max'] * 1000:>9.1f} ms"
+        )
+    for name, value in sorted(counts.items()):
+        print(f"{name:<32}{value:>8}")
+
+
+if os.environ.get("CLEVA_TRACE"):
+    add_sink(JsonLinesSink(os.environ["CLEVA_TRACE"]))